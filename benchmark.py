@@ -0,0 +1,476 @@
+import argparse
+import copy
+import json
+import os
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import main
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+REGRESSION_METRICS = ('p50_ms', 'p95_ms', 'alloc_peak_kb')
+
+SAMPLE_JOB_DESCRIPTION = """We are seeking a Senior Software Engineer to join our growing team.
+
+Requirements:
+- 5+ years of software development experience
+- Expertise in Python and JavaScript
+- Experience with cloud platforms (AWS preferred)
+- Strong understanding of microservices architecture
+- Leadership experience mentoring junior engineers
+
+Nice to have:
+- Kubernetes and Terraform
+- Experience with event-driven systems
+
+We are an equal opportunity employer and value diversity at our company."""
+
+OTHER_JOB_DESCRIPTIONS = [
+    """Data Scientist
+
+Responsibilities:
+- Design and analyze A/B tests for product features
+- Build forecasting models in Python and SQL
+
+Requirements:
+- 3+ years of applied statistics or machine learning
+- Experience with Spark or another distributed data platform""",
+    """Site Reliability Engineer
+
+What you'll do:
+- Run our Kubernetes clusters and on-call rotation
+- Automate infrastructure with Terraform and Go
+
+Requirements:
+- Linux internals, networking and observability tooling
+- Incident response experience in a high-traffic environment"""
+]
+JOB_LOCATIONS = ["New York, NY", "Austin, TX", "Remote (US)", "Seattle, WA"]
+
+RESUME_SIZES = {
+    'small': (1, 3, 1),
+    'medium': (4, 5, 3),
+    'large': (12, 8, 8)
+}
+
+
+def make_resume(positions, bullets, projects):
+    """Build a resume_data dict with the given number of positions, bullets per position and projects"""
+    return {
+        'contact_info': {
+            'name': 'Jordan Example',
+            'email': 'jordan@example.com',
+            'phone': '(555) 010-0000',
+            'location': 'Austin, TX',
+            'linkedin': 'linkedin.com/in/jordanexample'
+        },
+        'target_role': 'Senior Software Engineer',
+        'professional_summary': 'Software engineer with a decade of experience building distributed systems, '
+                                'leading teams and shipping customer-facing products at scale.',
+        'work_experience': [
+            {
+                'job_title': f'Software Engineer {i + 1}',
+                'company': f'Company {i + 1}',
+                'dates': f'Jan {2010 + i} - Dec {2011 + i}',
+                'location': 'Remote',
+                'achievements': [
+                    f'Led initiative {j + 1} that reduced infrastructure cost by {5 + j}% across {3 + i} services '
+                    f'while mentoring {j + 1} engineers and improving deployment frequency'
+                    for j in range(bullets)
+                ]
+            }
+            for i in range(positions)
+        ],
+        'education': [
+            {'degree': 'BSc Computer Science', 'institution': 'State University', 'year': '2009', 'honors': 'Cum Laude'}
+        ],
+        'skills': {
+            'Technical': ['Python', 'JavaScript', 'AWS', 'Kubernetes', 'PostgreSQL', 'React', 'Terraform', 'Go'],
+            'Soft': ['Leadership', 'Communication', 'Mentoring']
+        },
+        'projects': [
+            {
+                'name': f'Project {k + 1}',
+                'description': 'Built an internal platform used by every product team to ship services faster.',
+                'technologies': ['Python', 'AWS', 'Docker']
+            }
+            for k in range(projects)
+        ],
+        'certifications': ['AWS Certified Solutions Architect - Associate']
+    }
+
+
+def with_weak_bullets(resume_data, every=3):
+    """Copy resume_data with every n-th achievement replaced by a vague, unquantified one"""
+    resume_data = copy.deepcopy(resume_data)
+    for position in resume_data['work_experience']:
+        for j in range(0, len(position['achievements']), every):
+            position['achievements'][j] = 'Worked on the deployment pipeline and helped the team with releases.'
+    return resume_data
+
+
+def to_legacy_schema(resume_data):
+    """Convert resume_data to the keys expected by create_resume_pdf"""
+    legacy = dict(resume_data)
+    legacy['professional_experience'] = resume_data['work_experience']
+    legacy['technical_skills'] = resume_data['skills']['Technical']
+    return legacy
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn, iterations, warmup=2, traced_iterations=3, model=None):
+    """Time fn over iterations and trace allocations over a separate, shorter pass.
+
+    When model is given, also report how many LLM requests each run made and the
+    requests per minute a single worker would send at the measured throughput.
+    """
+    calls_before = model.calls if model is not None else 0
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    for _ in range(traced_iterations):
+        fn()
+    snapshot = tracemalloc.take_snapshot()
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained_blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+
+    llm_calls = None
+    if model is not None:
+        llm_calls = (model.calls - calls_before) / (warmup + iterations + traced_iterations)
+
+    return {
+        'iterations': iterations,
+        'llm_calls_per_run': llm_calls,
+        'rpm': round(llm_calls * iterations / elapsed * 60, 1) if llm_calls is not None and elapsed else None,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'throughput_per_s': round(iterations / elapsed, 2) if elapsed else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'alloc_peak_kb': round(alloc_peak / 1024, 1),
+        'retained_blocks': retained_blocks
+    }
+
+
+def build_benchmarks(args):
+    """Return {name: (callable, iterations)} for every benchmark in the suite"""
+    benchmarks = {}
+    job_description = SAMPLE_JOB_DESCRIPTION
+
+    keywords = main.extract_jd_keywords(job_description)
+    matcher = main.KeywordMatcher(keywords)
+    # Per-keyword regexes, the straightforward alternative to the automaton
+    keyword_patterns = [re.compile(rf"(?<![^\W_]){re.escape(keyword)}(?![^\W_])", re.IGNORECASE) for keyword in keywords]
+    benchmarks['jd_preprocess'] = (lambda: main.segment_job_description(job_description), args.iterations * 10)
+    benchmarks['keyword_matcher_build'] = (
+        lambda: main.KeywordMatcher(main.extract_jd_keywords(job_description)), args.iterations * 10
+    )
+
+    for size, shape in RESUME_SIZES.items():
+        resume = make_resume(*shape)
+        optimized = copy.deepcopy(resume)
+        for exp in optimized['work_experience']:
+            exp['achievements'] = [a.replace('Led', 'Spearheaded') for a in exp['achievements']]
+        legacy = to_legacy_schema(resume)
+
+        benchmarks[f'pdf_document/{size}'] = (lambda r=resume: main.create_pdf_document(r, is_resume=True), args.iterations)
+        benchmarks[f'resume_pdf/{size}'] = (lambda r=legacy: main.create_resume_pdf(r), args.iterations)
+        for template in main.RESUME_TEMPLATES:
+            benchmarks[f'resume_template/{template}/{size}'] = (
+                lambda r=resume, t=template: main.render_resume_pdf(r, t, 'A4'), args.iterations
+            )
+        fit_resume = with_weak_bullets(resume)
+        benchmarks[f'resume_fit_plan/{size}'] = (
+            lambda r=fit_resume: main.plan_resume_fit(r, 'classic', 'letter', job_description), args.iterations
+        )
+        benchmarks[f'resume_pdf_fit/{size}'] = (
+            lambda r=fit_resume: main.render_resume_pdf(r, 'classic', 'letter', True, job_description), args.iterations
+        )
+        benchmarks[f'comparison_data/{size}'] = (lambda r=resume, o=optimized: main.build_comparison_data(r, o), args.iterations * 10)
+        benchmarks[f'resume_model/{size}'] = (lambda r=resume: (
+            main.validate_resume_data(r),
+            main.Resume.from_dict(r).content_hash()
+        ), args.iterations * 10)
+        benchmarks[f'prompt_build/{size}'] = (lambda r=resume: (
+            main.build_optimize_prompt(r, job_description, r['target_role']),
+            main.build_cover_letter_prompt(r, job_description, 'Acme'),
+            main.build_ats_prompt(r, job_description),
+            main.build_cover_letter_ats_prompt(main.MOCK_COVER_LETTER, job_description),
+            main.build_interview_prep_prompt(r, job_description)
+        ), args.iterations * 10)
+        fields = list(main.resume_keyword_fields(resume).values())
+        benchmarks[f'keyword_scan/{size}'] = (lambda f=fields: [matcher.scan(text) for text in f], args.iterations * 10)
+        benchmarks[f'keyword_scan_regex/{size}'] = (
+            lambda f=fields: [{i for i, pattern in enumerate(keyword_patterns) if pattern.search(text)} for text in f],
+            args.iterations * 10
+        )
+        benchmarks[f'lint/{size}'] = (lambda r=main.Resume.from_dict(resume): main.lint_resume(r), args.iterations * 10)
+        benchmarks[f'ats_local/{size}'] = (
+            lambda r=resume: main.local_ats_findings(main.Resume.from_dict(r), job_description), args.iterations * 10
+        )
+        benchmarks[f'pipeline/{size}'] = (lambda r=resume: run_pipeline(r, job_description), args.pipeline_iterations)
+        benchmarks[f'pipeline_one_shot/{size}'] = (
+            lambda r=resume: run_pipeline(r, job_description, mode='one_shot'), args.pipeline_iterations
+        )
+        benchmarks[f'pipeline_no_context_cache/{size}'] = (
+            lambda r=resume: run_pipeline(r, job_description, context_caching=False), args.pipeline_iterations
+        )
+        benchmarks[f'interview_questions/{size}'] = (
+            lambda r=resume: main.generate_interview_prep(main.Resume.from_dict(r), job_description), args.pipeline_iterations
+        )
+        benchmarks[f'interview_answers/{size}'] = (
+            lambda r=resume: run_interview_answers(r, job_description), args.pipeline_iterations
+        )
+        mixed = with_weak_bullets(resume)
+        benchmarks[f'bullet_scores/{size}'] = (lambda r=main.Resume.from_dict(mixed): main.score_achievements(r, job_description), args.iterations * 10)
+        benchmarks[f'pipeline_rewrite_full/{size}'] = (lambda r=mixed: run_pipeline(r, job_description), args.pipeline_iterations)
+        benchmarks[f'pipeline_rewrite_weak/{size}'] = (
+            lambda r=mixed: run_pipeline(r, job_description, rewrite='weak_bullets'), args.pipeline_iterations
+        )
+        benchmarks[f'session_artifacts/{size}'] = (lambda r=resume: run_session_artifacts(r, 100), args.iterations)
+        benchmarks[f'pipeline_jd_dedup/{size}'] = (lambda r=resume: run_jd_dedup_batch(r), args.pipeline_iterations)
+        benchmarks[f'pipeline_burst/{size}'] = (
+            lambda r=resume: run_pipeline_burst(r, job_description, args.burst), args.pipeline_iterations
+        )
+
+    large = make_resume(*RESUME_SIZES['large'])
+    oversized_job_description = job_description * 2000
+    benchmarks['prompt_templates_load'] = (main.load_prompt_templates, args.iterations * 10)
+    benchmarks['prompt_build_over_budget/large'] = (lambda: (
+        main.build_optimize_prompt(large, oversized_job_description, large['target_role']),
+        main.build_combined_prompt(large, oversized_job_description, large['target_role'], 'Acme')
+    ), args.iterations * 10)
+
+    benchmarks['docx_cover_letter'] = (lambda: main.create_docx_cover_letter(main.MOCK_COVER_LETTER), args.iterations)
+    contact_info = make_resume(*RESUME_SIZES['small'])['contact_info']
+    benchmarks[f'docx_cover_letter_batch/{args.batch}'] = (
+        lambda: run_cover_letter_batch(contact_info, args.batch), args.pipeline_iterations
+    )
+    benchmarks['docx_cover_letter_cached'] = (
+        lambda: main.export_cover_letter_docx(main.MOCK_COVER_LETTER, contact_info), args.iterations * 10
+    )
+    interview_report = main.interview_prep_export_markdown(main.MOCK_INTERVIEW_PREP, {})
+    for kind, create in (('pdf', main.create_markdown_pdf), ('docx', main.create_markdown_docx)):
+        benchmarks[f'report_export_{kind}/ats'] = (lambda c=create: c(main.MOCK_ATS_REPORT, "ATS Compliance Report"), args.iterations)
+        benchmarks[f'report_export_{kind}/interview'] = (lambda c=create: c(interview_report, "Interview Preparation"), args.iterations)
+        benchmarks[f'report_export_{kind}/cached'] = (
+            lambda k=kind: main.export_markdown_report(main.MOCK_ATS_REPORT, "ATS Compliance Report", k), args.iterations * 10
+        )
+    return benchmarks
+
+
+def run_pipeline(resume, job_description, mode='fan_out', context_caching=True, rewrite='full'):
+    previous, main.CONTEXT_CACHING = main.CONTEXT_CACHING, context_caching
+    try:
+        results, error = main.run_optimization_pipeline(resume, job_description, resume['target_role'], 'Acme', mode, rewrite)
+    finally:
+        main.CONTEXT_CACHING = previous
+    if error:
+        raise RuntimeError(error)
+    return results
+
+
+def run_jd_dedup_batch(resume):
+    """Optimize one resume for a batch of postings where each role is reposted for several locations"""
+    for job_description in [SAMPLE_JOB_DESCRIPTION] + OTHER_JOB_DESCRIPTIONS:
+        for location in JOB_LOCATIONS:
+            _, error, _ = main.run_deduplicated_pipeline(resume, f"{job_description}\n\nLocation: {location}", resume['target_role'], 'Acme')
+            if error:
+                raise RuntimeError(error)
+    # Start every run cold so each batch pays for the first posting of every role again
+    index = main._jd_result_index()
+    index['entries'].clear()
+    index['buckets'].clear()
+
+
+def run_pipeline_burst(resume, job_description, sessions):
+    """Run the same pipeline from several threads at once, like a double-click or tabs optimizing together"""
+    errors = []
+
+    def run():
+        try:
+            run_pipeline(resume, job_description)
+        except RuntimeError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def run_interview_answers(resume, job_description):
+    """Generate a sample answer for every question on the first interview prep page, starting from a cold answer cache"""
+    main._interview_answer_store()['answers'].clear()
+    resume = main.Resume.from_dict(resume)
+    questions = main.generate_interview_prep(resume, job_description)
+    for future in main.interview_prep_answers(resume, job_description, questions).values():
+        future.result()
+
+
+def run_session_artifacts(resume, sessions):
+    """Store and read back every generated artifact for many sessions, then release them as closed sessions would be"""
+    texts = [main.MOCK_COVER_LETTER, main.MOCK_ATS_REPORT, main.MOCK_ATS_REPORT, main.MOCK_INTERVIEW_PREP]
+    handles = []
+    for i in range(sessions):
+        handles.append((f"session-{i}", main.put_artifact(json.dumps(resume).encode('utf-8'), f"session-{i}", 'json')))
+        for text in texts:
+            handles.append((f"session-{i}", main.put_artifact(f"{text}\n{i}".encode('utf-8'), f"session-{i}", 'text')))
+    for _, handle in handles:
+        main.read_artifact(handle)
+    for owner, handle in handles:
+        main.release_artifact(handle.digest, owner)
+
+
+def run_cover_letter_batch(contact_info, count):
+    """Generate count distinct cover letters with letterhead, as a mail-merge style batch would"""
+    for i in range(count):
+        main.create_docx_cover_letter(main.MOCK_COVER_LETTER.replace("this position", f"position #{i}"), contact_info)
+
+
+def compare_to_baseline(results, baseline, threshold, min_delta_ms=0.05):
+    """Return a list of human readable regressions beyond threshold, ignoring sub-noise latency changes"""
+    regressions = []
+    for name, metrics in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric in REGRESSION_METRICS:
+            before, after = reference.get(metric), metrics.get(metric)
+            if not before or after is None or after <= before * (1 + threshold):
+                continue
+            if metric.endswith('_ms') and after - before < min_delta_ms:
+                continue
+            regressions.append(f"{name} {metric}: {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_table(results):
+    header = (f"{'benchmark':<36}{'p50 ms':>10}{'p95 ms':>10}{'ops/s':>10}{'calls/run':>10}{'rpm':>8}"
+              f"{'rss MB':>9}{'alloc KB':>10}{'retained':>10}")
+    print(header)
+    print('-' * len(header))
+    for name, m in results.items():
+        calls = m.get('llm_calls_per_run')
+        print(f"{name:<36}{m['p50_ms']:>10}{m['p95_ms']:>10}{m['throughput_per_s']:>10}"
+              f"{f'{calls:.1f}' if calls is not None else '-':>10}{m.get('rpm') or '-':>8}"
+              f"{m['peak_rss_mb']:>9}{m['alloc_peak_kb']:>10}{m['retained_blocks']:>10}")
+
+
+def print_jd_reuse_stats():
+    stats = main.jd_reuse_stats()
+    if stats['lookups']:
+        print(f"\njob description reuse: {stats['exact']} identical + {stats['near']} near-duplicate of {stats['lookups']} "
+              f"lookups ({stats['hit_rate']:.0%} hit rate, threshold {main.JD_SIMILARITY_THRESHOLD})")
+
+
+def print_route_stats():
+    stats = main.get_route_stats()
+    if not stats:
+        return
+    print(f"\n{'route':<20}{'prompt':<30}{'model':<22}{'calls':>7}{'shared':>8}{'p50 s':>8}{'p95 s':>8}{'in tok':>10}{'cached':>10}{'out tok':>10}{'cost $':>10}")
+    for row in stats:
+        print(f"{row['task']:<20}{row['prompt'] or '-':<30}{row['model']:<22}{row['calls']:>7}{row['coalesced']:>8}{row['p50_s']:>8}{row['p95_s']:>8}"
+              f"{row['input_tokens']:>10}{row['cached_tokens']:>10}{row['output_tokens']:>10}{row['cost_usd']:>10}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the resume pipeline")
+    parser.add_argument('--filter', default='', help="Only run benchmarks whose name contains this text")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--pipeline-iterations', type=int, default=5)
+    parser.add_argument('--batch', type=int, default=2000, help="Cover letters generated per run in the docx_cover_letter_batch benchmark")
+    parser.add_argument('--burst', type=int, default=4, help="Concurrent identical pipelines in the pipeline_burst benchmarks")
+    parser.add_argument('--mock-latency', type=float, default=0.05, help="Fixed latency of each mock model call in seconds")
+    parser.add_argument('--mock-input-latency', type=float, default=0.02,
+                        help="Mock prefill cost in seconds per 1k uncached prompt tokens")
+    parser.add_argument('--mock-output-latency', type=float, default=0.1,
+                        help="Mock decode cost in seconds per 1k generated tokens")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Write the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown before failing, as a fraction")
+    parser.add_argument('--min-delta-ms', type=float, default=0.05, help="Ignore latency changes smaller than this")
+    parser.add_argument('--output', help="Also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    model = main.MockGenerativeModel(
+        latency=args.mock_latency,
+        seed=0,
+        input_latency=args.mock_input_latency,
+        output_latency=args.mock_output_latency
+    )
+    main.set_default_model(model)
+    # Exports and session artifacts are written to disk; keep them out of the real store
+    main.ARTIFACT_STORE_DIR = tempfile.mkdtemp(prefix="benchmark-artifacts-")
+
+    results = {}
+    for name, (fn, iterations) in build_benchmarks(args).items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn, iterations, model=model if name.startswith(('pipeline', 'interview')) else None)
+
+    print_table(results)
+    print_route_stats()
+    print_jd_reuse_stats()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(results, baseline, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"\nRegressions beyond {args.threshold * 100:.0f}%:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nNo regressions beyond {args.threshold * 100:.0f}% against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
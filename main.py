@@ -1,59 +1,231 @@
 import streamlit as st
 import google.generativeai as genai
+import google.ai.generativelanguage as glm
 import os
 from dotenv import load_dotenv
 import json
-from datetime import datetime
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem, Table, TableStyle
+from datetime import datetime, timedelta
+from reportlab.lib.pagesizes import letter, A4
+from reportlab.platypus import SimpleDocTemplate, BaseDocTemplate, PageTemplate, Frame, FrameBreak, NextPageTemplate, Paragraph, Spacer, ListFlowable, ListItem, Table, TableStyle, HRFlowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_JUSTIFY
 from reportlab.lib import colors
+from reportlab.pdfgen.canvas import Canvas
 from io import BytesIO
+from dataclasses import dataclass, field, replace
+from collections import deque, OrderedDict
+from types import SimpleNamespace
 import re
+import sys
+import html
+import itertools
+import bisect
+import math
+import copy
+import string
+import asyncio
 import textwrap
+import functools
+import time
+import random
+import hashlib
+import zipfile
+import zlib
+import threading
+import urllib.request
+import urllib.error
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from docx import Document
 from docx.shared import Pt
+import numpy as np
 
 load_dotenv()
 
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+DEFAULT_MODEL_NAME = 'gemini-1.5-flash'
+MOCK_LLM_URL = os.getenv("MOCK_LLM_URL", "http://127.0.0.1:8765")
+CONTEXT_CACHING = os.getenv("CONTEXT_CACHING", "1") != "0"
+JD_PREPROCESSING = os.getenv("JD_PREPROCESSING", "1") != "0"
+JD_SIMILARITY_THRESHOLD = float(os.getenv("JD_SIMILARITY_THRESHOLD", "0.85"))
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "fan_out")
+REWRITE_MODE = os.getenv("REWRITE_MODE", "full")
+BULLET_REWRITE_THRESHOLD = float(os.getenv("BULLET_REWRITE_THRESHOLD", "0.7"))
+RESUME_TEMPLATE = os.getenv("RESUME_TEMPLATE", "classic")
+RESUME_PAGE_SIZE = os.getenv("RESUME_PAGE_SIZE", "letter")
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "32768"))
+CONTEXT_CACHE_TTL_MINUTES = int(os.getenv("CONTEXT_CACHE_TTL_MINUTES", "10"))
+SERVER_API_KEYS = [key.strip() for key in os.getenv("GOOGLE_API_KEYS", os.getenv("GOOGLE_API_KEY", "")).split(",") if key.strip()]
+API_KEY_RPM_LIMIT = int(os.getenv("API_KEY_RPM_LIMIT", "15"))
+API_KEY_TPM_LIMIT = int(os.getenv("API_KEY_TPM_LIMIT", "1000000"))
+API_KEY_WINDOW_SECONDS = 60
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "120"))
+SESSION_REAP_INTERVAL_SECONDS = 5
+PROFILE_STORE_DIR = os.path.expanduser(os.getenv("PROFILE_STORE_DIR", "~/.genai_resume_crafter/profiles"))
+ARTIFACT_STORE_DIR = os.path.expanduser(os.getenv("ARTIFACT_STORE_DIR", "~/.genai_resume_crafter/artifacts"))
+ARTIFACT_MEMORY_MB = float(os.getenv("ARTIFACT_MEMORY_MB", "64"))
+ARTIFACT_IDLE_SECONDS = int(os.getenv("ARTIFACT_IDLE_SECONDS", "900"))
+
+RESUME_SECTIONS = [
+    ("Professional Summary", 'professional_summary', str),
+    ("Work Experience", 'work_experience', list),
+    ("Education", 'education', list),
+    ("Skills", 'skills', dict),
+    ("Projects", 'projects', list),
+    ("Certifications", 'certifications', list)
+]
+
+MOCK_COVER_LETTER = """Dear Hiring Manager,
+
+I am excited to apply for this position. My background in delivering production software aligns closely with the requirements in your job description.
+
+In my most recent role I led projects end to end, partnered with cross-functional teams and consistently shipped measurable improvements.
+
+I would welcome the opportunity to discuss how I can contribute to your team.
+
+Sincerely,"""
+
+MOCK_ATS_REPORT = """## 1. Keyword Optimization
+- Mirror the exact skill names used in the job description.
+
+## 2. Formatting Suggestions
+- Use standard section headings and a single-column layout.
+
+## 3. Content Improvements
+- Quantify the impact of each achievement."""
+
+MOCK_ATS_CONTENT = """- Lead the summary with the scale of the systems you have owned.
+- Tie each achievement to the business outcome it moved, not only the technical change.
+- Add a project that shows the event-driven work the role asks for."""
+
+MOCK_INTERVIEW_PREP = """## Technical Questions
+1. Describe a system you designed end to end.
+2. How do you decide between a relational and a document database?
+3. How would you find the cause of a latency regression in production?"""
+
+MOCK_INTERVIEW_ANSWER = """In my last role I owned our order service end to end. I started from the throughput and latency requirements, chose a queue-backed design to absorb spikes, and measured the result: p95 latency dropped by 40% while traffic doubled."""
+
+MODEL_ROUTES = {
+    'optimize': {'model': 'gemini-1.5-flash', 'temperature': 0.3, 'max_output_tokens': 4096, 'on_truncate': 'retry'},
+    'rewrite_bullets': {'model': 'gemini-1.5-flash', 'temperature': 0.3, 'max_output_tokens': 2048, 'response_mime_type': 'application/json', 'on_truncate': 'retry'},
+    'cover_letter': {'model': 'gemini-1.5-flash', 'temperature': 0.7, 'max_output_tokens': 1024},
+    'resume_ats': {'model': 'gemini-1.5-flash-8b', 'temperature': 0.2, 'max_output_tokens': 512},
+    'cover_letter_ats': {'model': 'gemini-1.5-flash-8b', 'temperature': 0.2, 'max_output_tokens': 768},
+    'interview_prep': {'model': 'gemini-1.5-flash', 'temperature': 0.7, 'max_output_tokens': 512},
+    'interview_answer': {'model': 'gemini-1.5-flash', 'temperature': 0.7, 'max_output_tokens': 400},
+    'combined': {'model': 'gemini-1.5-flash', 'temperature': 0.4, 'max_output_tokens': 8192, 'response_mime_type': 'application/json', 'on_truncate': 'retry'}
+}
+# Output that hits max_output_tokens is trimmed to its last complete block, or for routes with
+# on_truncate 'retry' (JSON that cannot be trimmed) requested once more with a doubled budget up to this cap,
+# failing with a truncation error if it is still cut off
+MAX_OUTPUT_TOKENS_LIMIT = 8192
+# Room the combined route leaves for its text fields next to the optimized resume: their own routes' caps
+ONE_SHOT_TEXT_TOKENS = sum(MODEL_ROUTES[task]['max_output_tokens'] for task in ('cover_letter', 'resume_ats', 'cover_letter_ats', 'interview_prep'))
+
+# Interview prep is generated one budgeted page of questions at a time as (heading, request, answered);
+# the pipeline fetches the first page and sample answers for answered sections are generated per question
+INTERVIEW_PREP_PAGES = [
+    ("Technical Questions", "5 likely technical questions", True),
+    ("Behavioral Questions", "5 behavioral questions", True),
+    ("More Technical Questions", "5 more technical questions that go deeper than the ones already covered", True),
+    ("Questions to Ask the Interviewer", "5 thoughtful questions the candidate should ask the interviewer", False)
+]
+ANSWERED_INTERVIEW_SECTIONS = {section for section, _, answered in INTERVIEW_PREP_PAGES if answered}
+INTERVIEW_ANSWER_CACHE_SIZE = 2000
+
+# Profile versions are stored as deltas with a full snapshot every PROFILE_SNAPSHOT_EVERY versions
+PROFILE_SNAPSHOT_EVERY = 10
+PROFILE_MAX_RESULTS = 20
+PROFILE_RESULT_FIELDS = ('optimized_resume', 'cover_letter', 'cover_letter_ats', 'ats_report', 'interview_prep')
+# Generated results live in the artifact store; session state only holds their handles
+SESSION_ARTIFACT_DEFAULTS = {'optimized_resume': None, 'cover_letter': "", 'cover_letter_ats': "", 'ats_report': "", 'interview_prep': ""}
+SECTION_CHECKBOXES = {
+    "Professional Summary": "summary_check",
+    "Work Experience": "work_check",
+    "Education": "edu_check",
+    "Skills": "skills_check",
+    "Projects": "projects_check",
+    "Certifications": "certs_check"
+}
+# Resume Builder widgets whose state must be dropped so they pick up a loaded profile
+EDITOR_WIDGET_KEY = re.compile(
+    r'^(name|email|phone|location|linkedin|job_title|company|job_desc|summary|tech_skills|soft_skills|certs)_input$'
+    r'|^(job_title|company|dates|location|achievements|degree|institution|year|honors|project_name|project_desc|project_tech)_\d+$'
+)
+
+PIPELINE_MODES = {
+    'fan_out': "Fan-out (one call per artifact)",
+    'one_shot': "One-shot (single combined call)"
+}
+REWRITE_MODES = {
+    'full': "Rewrite the whole resume",
+    'weak_bullets': "Rewrite weak bullets only"
+}
+
+# Context caching needs an explicitly versioned model name
+CACHE_MODEL_VERSIONS = {
+    'gemini-1.5-flash': 'gemini-1.5-flash-002',
+    'gemini-1.5-flash-8b': 'gemini-1.5-flash-8b-001',
+    'gemini-1.5-pro': 'gemini-1.5-pro-002'
+}
+
+# USD per million tokens as (input, output); cached input is billed at CACHED_INPUT_DISCOUNT
+CACHED_INPUT_DISCOUNT = 0.25
+MODEL_PRICING = {
+    'gemini-1.5-flash': (0.075, 0.30),
+    'gemini-1.5-flash-8b': (0.0375, 0.15),
+    'gemini-1.5-pro': (1.25, 5.00)
+}
+
+_default_model = None
+
+def load_model_routes():
+    """Merge MODEL_ROUTES overrides from the MODEL_ROUTES env var (JSON text or a path to a JSON file)"""
+    override = os.getenv("MODEL_ROUTES")
+    if not override:
+        return
+    if os.path.exists(override):
+        with open(override, 'r', encoding='utf-8') as f:
+            override = f.read()
+    for task, route in json.loads(override).items():
+        MODEL_ROUTES.setdefault(task, {}).update(route)
+
+load_model_routes()
+
+def default_resume_data():
+    return {
+        'contact_info': {
+            'name': '',
+            'email': '',
+            'phone': '',
+            'location': '',
+            'linkedin': ''
+        },
+        'target_role': '',
+        'professional_summary': '',
+        'work_experience': [],
+        'education': [],
+        'skills': {
+            'Technical': [],
+            'Soft': []
+        },
+        'projects': [],
+        'certifications': []
+    }
+
 def init_session_state():
     if 'resume_data' not in st.session_state:
-        st.session_state.resume_data = {
-            'contact_info': {
-                'name': '',
-                'email': '',
-                'phone': '',
-                'location': '',
-                'linkedin': ''
-            },
-            'target_role': '',
-            'professional_summary': '',
-            'work_experience': [],
-            'education': [],
-            'skills': {
-                'Technical': [],
-                'Soft': []
-            },
-            'projects': [],
-            'certifications': []
-        }
+        st.session_state.resume_data = default_resume_data()
     if 'use_default_data' not in st.session_state:
         st.session_state.use_default_data = False
     if 'job_description' not in st.session_state:
         st.session_state.job_description = ""
     if 'company_name' not in st.session_state:
         st.session_state.company_name = ""
-    if 'optimized_resume' not in st.session_state:
-        st.session_state.optimized_resume = None
-    if 'cover_letter' not in st.session_state:
-        st.session_state.cover_letter = ""
-    if 'cover_letter_ats' not in st.session_state:
-        st.session_state.cover_letter_ats = ""
-    if 'ats_report' not in st.session_state:
-        st.session_state.ats_report = ""
-    if 'interview_prep' not in st.session_state:
-        st.session_state.interview_prep = ""
+    if 'artifacts' not in st.session_state:
+        st.session_state.artifacts = {}
     if 'show_comparison' not in st.session_state:
         st.session_state.show_comparison = False
     if 'selected_sections' not in st.session_state:
@@ -75,29 +247,1162 @@ def init_session_state():
         st.session_state.model = None
     if 'auto_optimize' not in st.session_state:
         st.session_state.auto_optimize = False
+    if 'pipeline_mode' not in st.session_state:
+        st.session_state.pipeline_mode = PIPELINE_MODE
+    if 'rewrite_mode' not in st.session_state:
+        st.session_state.rewrite_mode = REWRITE_MODE
+    if 'resume_template' not in st.session_state:
+        st.session_state.resume_template = RESUME_TEMPLATE
+    if 'resume_page_size' not in st.session_state:
+        st.session_state.resume_page_size = RESUME_PAGE_SIZE
+    if 'resume_fit' not in st.session_state:
+        st.session_state.resume_fit = False
+
+@dataclass(frozen=True, slots=True)
+class ContactInfo:
+    name: str = ''
+    email: str = ''
+    phone: str = ''
+    location: str = ''
+    linkedin: str = ''
+
+@dataclass(frozen=True, slots=True)
+class Position:
+    job_title: str = ''
+    company: str = ''
+    dates: str = ''
+    location: str = ''
+    achievements: tuple = ()
+
+@dataclass(frozen=True, slots=True)
+class EducationEntry:
+    degree: str = ''
+    institution: str = ''
+    year: str = ''
+    honors: str = ''
+
+@dataclass(frozen=True, slots=True)
+class Project:
+    name: str = ''
+    description: str = ''
+    technologies: tuple = ()
+
+@dataclass(frozen=True, slots=True)
+class Resume:
+    """Immutable resume_data with cached canonical serialization.
+
+    Sections left out of a filtered resume are None. skills holds (category, skills) pairs,
+    or a plain tuple of skills when the source used a flat list.
+    """
+    contact_info: ContactInfo
+    target_role: str = ''
+    professional_summary: str = None
+    work_experience: tuple = None
+    education: tuple = None
+    skills: tuple = None
+    skills_by_category: bool = True
+    projects: tuple = None
+    certifications: tuple = None
+    _json: str = field(default=None, compare=False, repr=False)
+    _hash: str = field(default=None, compare=False, repr=False)
+
+    @classmethod
+    def from_dict(cls, data):
+        skills = data.get('skills')
+        skills_by_category = not isinstance(skills, list)
+        if skills is not None:
+            skills = tuple(skills) if isinstance(skills, list) else tuple((k, tuple(v)) for k, v in skills.items())
+        return cls(
+            contact_info=ContactInfo(**{k: v for k, v in data.get('contact_info', {}).items() if k in ContactInfo.__slots__}),
+            target_role=data.get('target_role', ''),
+            professional_summary=data.get('professional_summary'),
+            work_experience=_optional_tuple(data.get('work_experience'), lambda e: Position(
+                e.get('job_title', ''), e.get('company', ''), e.get('dates', ''), e.get('location', ''), tuple(e.get('achievements', ()))
+            )),
+            education=_optional_tuple(data.get('education'), lambda e: EducationEntry(
+                e.get('degree', ''), e.get('institution', ''), e.get('year', ''), e.get('honors', '')
+            )),
+            skills=skills,
+            skills_by_category=skills_by_category,
+            projects=_optional_tuple(data.get('projects'), lambda p: Project(
+                p.get('name', ''), p.get('description', ''), tuple(p.get('technologies', ()))
+            )),
+            certifications=_optional_tuple(data.get('certifications'), str)
+        )
+
+    def to_dict(self):
+        data = {
+            'contact_info': {name: getattr(self.contact_info, name) for name in ContactInfo.__slots__},
+            'target_role': self.target_role
+        }
+        if self.professional_summary is not None:
+            data['professional_summary'] = self.professional_summary
+        if self.work_experience is not None:
+            data['work_experience'] = [
+                {'job_title': p.job_title, 'company': p.company, 'dates': p.dates, 'location': p.location,
+                 'achievements': list(p.achievements)}
+                for p in self.work_experience
+            ]
+        if self.education is not None:
+            data['education'] = [
+                {'degree': e.degree, 'institution': e.institution, 'year': e.year, 'honors': e.honors}
+                for e in self.education
+            ]
+        if self.skills is not None:
+            data['skills'] = {k: list(v) for k, v in self.skills} if self.skills_by_category else list(self.skills)
+        if self.projects is not None:
+            data['projects'] = [
+                {'name': p.name, 'description': p.description, 'technologies': list(p.technologies)}
+                for p in self.projects
+            ]
+        if self.certifications is not None:
+            data['certifications'] = list(self.certifications)
+        return data
+
+    def to_json(self):
+        """Canonical JSON used in prompts, serialized once per resume"""
+        if self._json is None:
+            object.__setattr__(self, '_json', json.dumps(self.to_dict(), indent=2))
+        return self._json
+
+    def content_hash(self):
+        if self._hash is None:
+            object.__setattr__(self, '_hash', prompt_hash(self.to_json()))
+        return self._hash
+
+    def select(self, sections):
+        """Return a view holding only the given section keys; section data is shared, not copied"""
+        return replace(self, **{key: None for _, key, _ in RESUME_SECTIONS if key not in sections}, _json=None, _hash=None)
+
+def _optional_tuple(items, convert):
+    return None if items is None else tuple(convert(item) for item in items)
+
+def _coerce_string(value):
+    """A number as text; null, booleans and nested values become empty"""
+    if isinstance(value, str):
+        return value
+    return str(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else ""
+
+def _coerce_strings(data, fields):
+    for name in fields:
+        if name in data and not isinstance(data[name], str):
+            data[name] = _coerce_string(data[name])
+
+def _coerce_string_list(value):
+    """A list of non-empty strings: a lone string becomes a one-item list and unusable items are dropped"""
+    if isinstance(value, str):
+        value = [value]
+    elif not isinstance(value, list):
+        return []
+    return [text for text in map(_coerce_string, value) if text]
+
+# (section, string fields, list field) of each list section's entries
+RESUME_ENTRY_FIELDS = (
+    ('work_experience', ('job_title', 'company', 'dates', 'location'), 'achievements'),
+    ('education', ('degree', 'institution', 'year', 'honors'), None),
+    ('projects', ('name', 'description'), 'technologies')
+)
+
+def validate_resume_data(data):
+    """Check that data has the resume_data structure and return a list of problems (empty when valid).
+
+    Only structural problems are errors; optional fields of the wrong type are fixed in place, numbers becoming
+    strings and nulls becoming empty, so a "year": 2020 or "honors": null from the model does not reject the resume.
+    """
+    if not isinstance(data, dict):
+        return ["resume must be a JSON object"]
+    errors = []
+    contact_info = data.get('contact_info')
+    if not isinstance(contact_info, dict):
+        errors.append("contact_info must be an object")
+    else:
+        _coerce_strings(contact_info, ContactInfo.__slots__)
+    _coerce_strings(data, ('target_role', 'professional_summary'))
+
+    for section, fields, list_field in RESUME_ENTRY_FIELDS:
+        if section not in data:
+            continue
+        if not isinstance(data[section], list):
+            errors.append(f"{section} must be a list")
+            continue
+        for i, entry in enumerate(data[section]):
+            if not isinstance(entry, dict):
+                errors.append(f"{section}[{i}] must be an object")
+                continue
+            _coerce_strings(entry, fields)
+            if list_field and list_field in entry:
+                entry[list_field] = _coerce_string_list(entry[list_field])
+
+    if 'skills' in data:
+        skills = data['skills']
+        if isinstance(skills, dict):
+            data['skills'] = {category: _coerce_string_list(items) for category, items in skills.items()}
+        else:
+            data['skills'] = _coerce_string_list(skills)
+    if 'certifications' in data:
+        data['certifications'] = _coerce_string_list(data['certifications'])
+    return errors
+
+def complete_resume_data(data):
+    """A copy of validated resume_data merged onto default_resume_data, so every key the editors read is present"""
+    resume = default_resume_data()
+    for key, value in copy.deepcopy(data).items():
+        if key == 'contact_info':
+            resume['contact_info'].update(value)
+        else:
+            resume[key] = value
+    for section, fields, list_field in RESUME_ENTRY_FIELDS:
+        defaults = dict.fromkeys(fields, "") | ({list_field: []} if list_field else {})
+        resume[section] = [defaults | entry for entry in resume[section]]
+    return resume
+
+def as_resume(resume_data):
+    return resume_data if isinstance(resume_data, Resume) else Resume.from_dict(resume_data)
+
+def resume_json(resume_data):
+    """Prompt serialization of a Resume or resume_data dict"""
+    return resume_data.to_json() if isinstance(resume_data, Resume) else json.dumps(resume_data, indent=2)
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+def load_recordings(path):
+    """Load recorded responses keyed by prompt hash"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _extract_json_after(text, marker):
+    start = text.find('{', text.find(marker))
+    if start < 0:
+        return None
+    try:
+        return json.JSONDecoder().raw_decode(text, start)[0]
+    except json.JSONDecodeError:
+        return None
+
+def synthetic_response(prompt):
+    """Build a canned response shaped like the real model output for the task the prompt belongs to"""
+    if "OUTPUT ONLY THE JSON OBJECT WITH ALL FIVE FIELDS" in prompt:
+        resume = _extract_json_after(prompt, "RESUME DATA:")
+        return json.dumps({
+            'optimized_resume': resume if resume is not None else {'contact_info': {}},
+            'cover_letter': MOCK_COVER_LETTER,
+            'resume_ats_report': MOCK_ATS_CONTENT,
+            'cover_letter_ats_report': MOCK_ATS_REPORT,
+            'interview_prep': MOCK_INTERVIEW_PREP
+        }, indent=2)
+    if "WEAK RESUME BULLETS:" in prompt:
+        section = prompt[prompt.rfind("WEAK RESUME BULLETS:"):prompt.rfind("INSTRUCTIONS:")]
+        return json.dumps(dict(re.findall(r'^(\d+)\. (.+)$', section, re.MULTILINE)), indent=2)
+    if "OUTPUT ONLY THE JSON" in prompt:
+        resume = _extract_json_after(prompt, "RESUME DATA:")
+        return json.dumps(resume if resume is not None else {'contact_info': {}}, indent=2)
+    if "cover letter for the candidate" in prompt:
+        return MOCK_COVER_LETTER
+    if "SAMPLE ANSWER:" in prompt:
+        return MOCK_INTERVIEW_ANSWER
+    if "CONTENT IMPROVEMENTS ONLY" in prompt:
+        return MOCK_ATS_CONTENT
+    if "interview preparation" in prompt:
+        section = re.search(r'^## (.+)$', prompt[prompt.rfind("WRITE ONLY THIS SECTION"):], re.MULTILINE)
+        return MOCK_INTERVIEW_PREP.replace("## Technical Questions", section.group(0), 1) if section else MOCK_INTERVIEW_PREP
+    return MOCK_ATS_REPORT
+
+class MockResponse:
+    def __init__(self, text, prompt_tokens=0, cached_tokens=0, finish_reason='STOP'):
+        self.text = text
+        self.candidates = [SimpleNamespace(finish_reason=finish_reason)]
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens + cached_tokens,
+            candidates_token_count=estimate_tokens(text),
+            cached_content_token_count=cached_tokens
+        )
+
+MOCK_CONTEXT_CACHE_LIMIT = 256
+
+def touch_mock_cache(caches, name, create=None):
+    """Look up a mock context cache entry, adding it with create() when missing; None when absent and create is None.
+
+    Like a Gemini CachedContent, an entry lives CONTEXT_CACHE_TTL_MINUTES, here counted from its last use; the least
+    recently used entries beyond MOCK_CONTEXT_CACHE_LIMIT are dropped too. caches is an OrderedDict the caller locks.
+    """
+    now = time.monotonic()
+    while caches and next(iter(caches.values()))[0] <= now:
+        caches.popitem(last=False)
+    entry = caches.pop(name, None)
+    if entry is None and create is None:
+        return None
+    value = entry[1] if entry is not None else create()
+    caches[name] = (now + CONTEXT_CACHE_TTL_MINUTES * 60, value)
+    while len(caches) > MOCK_CONTEXT_CACHE_LIMIT:
+        caches.popitem(last=False)
+    return value
+
+class MockGenerativeModel:
+    """Offline stand-in for genai.GenerativeModel with configurable latency and error injection.
+
+    input_latency is the prefill cost in seconds per 1k uncached prompt tokens, so prompts sent
+    through a cached context (see cache_context) answer faster, like Gemini context caching.
+    output_latency is the decode cost in seconds per 1k generated tokens.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, latency=0.0, jitter=0.0, error_rate=0.0, recordings=None, seed=None,
+                 input_latency=0.0, output_latency=0.0):
+        self.model_name = model_name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.input_latency = input_latency
+        self.output_latency = output_latency
+        self.recordings = recordings if isinstance(recordings, dict) else load_recordings(recordings)
+        self.calls = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.context_caches = OrderedDict()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def cache_context(self, context_text):
+        """Register a shared prompt prefix and return a model that sends prompts after it"""
+        with self._lock:
+            touch_mock_cache(self.context_caches, prompt_hash(context_text), lambda: context_text)
+        return MockCachedModel(self, context_text)
+
+    def generate_content(self, prompt, generation_config=None):
+        return self._generate(prompt, generation_config=generation_config)
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        return await self._generate_async(prompt, generation_config=generation_config)
+
+    def _generate(self, prompt, cached_prefix=None, generation_config=None):
+        delay, response = self._prepare(prompt, cached_prefix, generation_config)
+        if delay:
+            time.sleep(delay)
+        return self._finish(response)
+
+    async def _generate_async(self, prompt, cached_prefix=None, generation_config=None):
+        delay, response = self._prepare(prompt, cached_prefix, generation_config)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._finish(response)
+
+    def _finish(self, response):
+        if response is None:
+            raise Exception("429 Resource has been exhausted (e.g. check quota).")
+        return response
+
+    def _prepare(self, prompt, cached_prefix, generation_config=None):
+        """Account for one call and return (delay, response), where response is None for an injected error.
+
+        Like the real API, text longer than max_output_tokens is cut off with finish_reason MAX_TOKENS.
+        """
+        prompt_tokens = estimate_tokens(prompt)
+        cached_tokens = estimate_tokens(cached_prefix) if cached_prefix else 0
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            delay += self.input_latency * prompt_tokens / 1000
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        if failed:
+            return delay, None
+        full_prompt = f"{cached_prefix}\n\n{prompt}" if cached_prefix else prompt
+        text = self.recordings.get(prompt_hash(full_prompt))
+        if text is None:
+            text = synthetic_response(full_prompt)
+        reason = 'STOP'
+        max_output_tokens = (generation_config or {}).get('max_output_tokens')
+        if max_output_tokens and estimate_tokens(text) > max_output_tokens:
+            text, reason = text[:max_output_tokens * 4], 'MAX_TOKENS'
+        delay += self.output_latency * estimate_tokens(text) / 1000
+        return delay, MockResponse(text, prompt_tokens, cached_tokens, reason)
+
+class MockCachedModel:
+    def __init__(self, model, context_text):
+        self.model = model
+        self.context_text = context_text
+
+    def generate_content(self, prompt, generation_config=None):
+        return self.model._generate(prompt, self.context_text, generation_config)
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        return await self.model._generate_async(prompt, self.context_text, generation_config)
+
+class RecordingModel:
+    """Wrap a live model and save its responses so MockGenerativeModel can replay them"""
+
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+        self.recordings = load_recordings(path)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, generation_config=None):
+        response = self.model.generate_content(prompt, generation_config=generation_config)
+        self._record(prompt, response)
+        return response
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        response = await self.model.generate_content_async(prompt, generation_config=generation_config)
+        self._record(prompt, response)
+        return response
+
+    def _record(self, prompt, response):
+        with self._lock:
+            self.recordings[prompt_hash(prompt)] = response.text
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.recordings, f, indent=2)
+
+class HttpGenerativeModel:
+    """Client for a mock LLM server started with create_mock_llm_server"""
+
+    def __init__(self, url=MOCK_LLM_URL, model_name=DEFAULT_MODEL_NAME, timeout=120, cached_context=None):
+        self.url = url.rstrip('/')
+        self.model_name = model_name
+        self.timeout = timeout
+        self.cached_context = cached_context
+
+    def cache_context(self, context_text):
+        body = self._post('/cache', {'model': self.model_name, 'context': context_text})
+        return HttpGenerativeModel(self.url, self.model_name, self.timeout, cached_context=body['name'])
+
+    def generate_content(self, prompt, generation_config=None):
+        return self._response(self._post('/generate', self._generate_body(prompt, generation_config)))
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        return self._response(await self._post_async('/generate', self._generate_body(prompt, generation_config)))
+
+    def _generate_body(self, prompt, generation_config):
+        return {
+            'model': self.model_name,
+            'prompt': prompt,
+            'generation_config': generation_config or {},
+            'cached_context': self.cached_context
+        }
+
+    def _response(self, body):
+        usage = body.get('usage', {})
+        return MockResponse(body['text'], usage.get('prompt_tokens', 0), usage.get('cached_tokens', 0), body.get('finish_reason', 'STOP'))
+
+    def _post(self, path, body):
+        payload = json.dumps(body).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=payload, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error')
+            except ValueError:
+                message = None
+            raise Exception(message or f"Mock LLM server returned HTTP {e.code}")
+        return body
+
+    async def _post_async(self, path, body):
+        """POST over a plain asyncio connection so waiting on the server does not hold a thread"""
+        url = urllib.parse.urlsplit(self.url + path)
+        payload = json.dumps(body).encode('utf-8')
+        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        try:
+            writer.write(
+                f"POST {url.path} HTTP/1.1\r\nHost: {url.netloc}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode('latin-1') + payload
+            )
+            await writer.drain()
+            raw = await reader.read()
+        finally:
+            writer.close()
+        head, _, data = raw.partition(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        try:
+            body = json.loads(data)
+        except ValueError:
+            body = {}
+        if status != 200:
+            raise Exception(body.get('error') or f"Mock LLM server returned HTTP {status}")
+        return body
+
+def create_mock_model(model_name=DEFAULT_MODEL_NAME):
+    """Create a MockGenerativeModel configured from the MOCK_LLM_* environment variables"""
+    seed = os.getenv("MOCK_LLM_SEED")
+    return MockGenerativeModel(
+        model_name,
+        latency=float(os.getenv("MOCK_LLM_LATENCY", "0")),
+        jitter=float(os.getenv("MOCK_LLM_JITTER", "0")),
+        error_rate=float(os.getenv("MOCK_LLM_ERROR_RATE", "0")),
+        recordings=os.getenv("MOCK_LLM_RECORDINGS"),
+        seed=int(seed) if seed else None,
+        input_latency=float(os.getenv("MOCK_LLM_INPUT_LATENCY", "0")),
+        output_latency=float(os.getenv("MOCK_LLM_OUTPUT_LATENCY", "0"))
+    )
+
+def create_mock_llm_server(host="127.0.0.1", port=8765, model=None):
+    """Create an HTTP server answering POST /generate from a mock model; call serve_forever() to run it"""
+    model = model or create_mock_model()
+    cached_models = OrderedDict()
+    cache_lock = threading.Lock()
+
+    class MockLLMHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path not in ('/generate', '/cache'):
+                self._send(404, {'error': 'Not found'})
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if self.path == '/cache':
+                    name = prompt_hash(payload.get('context', ''))
+                    with cache_lock:
+                        touch_mock_cache(cached_models, name, lambda: model.cache_context(payload.get('context', '')))
+                    self._send(200, {'name': name})
+                    return
+                target = model
+                if payload.get('cached_context'):
+                    with cache_lock:
+                        target = touch_mock_cache(cached_models, payload['cached_context'])
+                    if target is None:
+                        self._send(404, {'error': f"CachedContent {payload['cached_context']} not found or expired"})
+                        return
+                response = target.generate_content(payload.get('prompt', ''), generation_config=payload.get('generation_config'))
+                usage = response.usage_metadata
+                self._send(200, {'text': response.text, 'finish_reason': finish_reason(response), 'usage': {
+                    'prompt_tokens': usage.prompt_token_count - usage.cached_content_token_count,
+                    'cached_tokens': usage.cached_content_token_count
+                }})
+            except Exception as e:
+                self._send(500, {'error': str(e)})
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client timed out or cancelled the call
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), MockLLMHandler)
+
+def is_quota_error(error):
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "resource has been exhausted" in message
+
+def is_truncation_error(error):
+    return "response was cut off" in str(error)
+
+def is_invalid_key_error(error):
+    message = str(error).lower()
+    return "api key not valid" in message or "api_key_invalid" in message
+
+class ApiKeyPool:
+    """API keys with sliding-window request and token accounting and a client per key.
+
+    acquire() hands out the key with the most RPM/TPM headroom left in the current window, and
+    retry_after() says how long until one has room again. A key that hits a quota error leaves the
+    rotation until its window resets.
+    """
+
+    def __init__(self, keys, rpm_limit=API_KEY_RPM_LIMIT, tpm_limit=API_KEY_TPM_LIMIT, window=API_KEY_WINDOW_SECONDS):
+        self.keys = list(dict.fromkeys(keys))
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.window = window
+        self._events = {key: deque() for key in self.keys}
+        self._totals = {key: [0, 0] for key in self.keys}
+        self._blocked_until = {key: 0.0 for key in self.keys}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, key, now):
+        events, totals = self._events[key], self._totals[key]
+        while events and events[0][0] <= now - self.window:
+            _, requests, tokens = events.popleft()
+            totals[0] -= requests
+            totals[1] -= tokens
+
+    def _add(self, key, now, requests, tokens):
+        self._events[key].append((now, requests, tokens))
+        self._totals[key][0] += requests
+        self._totals[key][1] += tokens
+
+    def acquire(self, tokens, exclude=(), only=None):
+        """Reserve one request of about tokens on the key with the most headroom, or return None if none has room"""
+        now = time.monotonic()
+        best_key, best_headroom = None, 0.0
+        with self._lock:
+            for key in ([only] if only else self.keys):
+                if key in exclude or self._blocked_until[key] > now:
+                    continue
+                self._expire(key, now)
+                requests, used_tokens = self._totals[key]
+                headroom = min(1 - (requests + 1) / self.rpm_limit, 1 - (used_tokens + tokens) / self.tpm_limit)
+                if best_key is None and headroom >= 0 or headroom > best_headroom:
+                    best_key, best_headroom = key, headroom
+            if best_key is not None:
+                self._add(best_key, now, 1, tokens)
+        return best_key
+
+    def retry_after(self, tokens, exclude=(), only=None):
+        """Seconds until acquire() could find room for tokens, or None when no key ever will"""
+        now = time.monotonic()
+        waits = []
+        with self._lock:
+            for key in ([only] if only else self.keys):
+                if key in exclude or self._blocked_until[key] == float('inf') or tokens > self.tpm_limit:
+                    continue
+                self._expire(key, now)
+                events = self._events[key]
+                # The oldest request leaving the window is the soonest anything frees up
+                free_at = max(self._blocked_until[key], events[0][0] + self.window if events else now)
+                waits.append(max(0.0, free_at - now))
+        return min(waits) if waits else None
+
+    def settle(self, key, estimated_tokens, actual_tokens):
+        """Correct a reservation once the response reports its real token usage"""
+        with self._lock:
+            self._add(key, time.monotonic(), 0, actual_tokens - estimated_tokens)
+
+    def mark_exhausted(self, key):
+        """Take key out of rotation until its oldest request in the window expires"""
+        now = time.monotonic()
+        with self._lock:
+            events = self._events[key]
+            self._blocked_until[key] = (events[0][0] if events else now) + self.window
+
+    def disable(self, key):
+        with self._lock:
+            self._blocked_until[key] = float('inf')
+
+    def client(self, key, kind):
+        """Return this key's client of the given kind: 'models', 'generative', 'generative_async' or 'cache'"""
+        with self._lock:
+            if (key, kind) not in self._clients:
+                client_class = {
+                    'models': glm.ModelServiceClient,
+                    'generative': glm.GenerativeServiceClient,
+                    'generative_async': glm.GenerativeServiceAsyncClient,
+                    'cache': glm.CacheServiceClient
+                }[kind]
+                self._clients[(key, kind)] = client_class(client_options={'api_key': key})
+            return self._clients[(key, kind)]
+
+    def validate(self, key):
+        """Check key with one small list_models call on its own client; raises the API's error when it is rejected"""
+        next(iter(self.client(key, 'models').list_models(page_size=1)), None)
+
+    def usage(self):
+        """Per-key requests and tokens used in the current window, with keys masked"""
+        now = time.monotonic()
+        rows = []
+        with self._lock:
+            for key in self.keys:
+                self._expire(key, now)
+                blocked = self._blocked_until[key] - now
+                rows.append({
+                    'key': f"…{key[-4:]}",
+                    'rpm_used': f"{self._totals[key][0]}/{self.rpm_limit}",
+                    'tpm_used': f"{self._totals[key][1]}/{self.tpm_limit}",
+                    'status': "disabled" if blocked == float('inf') else f"cooling down {blocked:.0f}s" if blocked > 0 else "ok"
+                })
+        return rows
+
+@st.cache_resource
+def server_key_pool():
+    """Pool of the server-owned keys from GOOGLE_API_KEYS, shared by sessions without a key of their own"""
+    return ApiKeyPool(SERVER_API_KEYS)
+
+@st.cache_resource
+def validate_server_keys():
+    """Check every server-owned key once per process, disabling the rejected ones; returns how many passed"""
+    pool = server_key_pool()
+    valid = 0
+    for key in pool.keys:
+        try:
+            pool.validate(key)
+            valid += 1
+        except Exception as e:
+            if not is_invalid_key_error(e):
+                raise
+            pool.disable(key)
+    return valid
+
+class PooledGenerativeModel:
+    """genai.GenerativeModel that sends each call on the pool key with the most quota left.
+
+    Each key gets its own client, so sessions never share the process-global genai.configure state.
+    A quota error marks the key exhausted and a rejected key is disabled; either way the call is
+    retried on the next key. Models bound to cached
+    content stay on the key that created the cache.
+    """
+
+    def __init__(self, model_name, pool, cached_content=None, key=None):
+        self.model_name = model_name
+        self.pool = pool
+        self.cached_content = cached_content
+        self.key = key
+        self._models = {}
+
+    def _model(self, key):
+        # genai.configure is process-global, so per-key clients go through google-generativeai's private
+        # _client/_async_client and CachedContent helpers; requirements.txt pins the release this was tested with
+        if key not in self._models:
+            if self.cached_content is not None:
+                model = genai.GenerativeModel.from_cached_content(cached_content=self.cached_content)
+            else:
+                model = genai.GenerativeModel(self.model_name)
+            model._client = self.pool.client(key, 'generative')
+            self._models[key] = model
+        return self._models[key]
+
+    def _try_acquire(self, tokens, tried):
+        """(key, None) with a request reserved on key, or (None, seconds to wait before trying again)"""
+        key = self.pool.acquire(tokens, exclude=tried, only=self.key)
+        if key is not None:
+            return key, None
+        delay = self.pool.retry_after(tokens, exclude=tried, only=self.key)
+        if delay is None:
+            raise Exception("429 Resource has been exhausted (e.g. check quota). Every API key is rate limited or disabled.")
+        return None, delay + 0.05
+
+    def _acquire(self, tokens, tried):
+        """A key with room for tokens, waiting for the rate window to free one up rather than failing"""
+        while True:
+            key, delay = self._try_acquire(tokens, tried)
+            if key is not None:
+                return key
+            time.sleep(delay)
+
+    async def _acquire_async(self, tokens, tried):
+        while True:
+            key, delay = self._try_acquire(tokens, tried)
+            if key is not None:
+                return key
+            await asyncio.sleep(delay)
+
+    def _settle(self, key, estimated_tokens, response):
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None and getattr(usage, 'prompt_token_count', None):
+            self.pool.settle(key, estimated_tokens, usage.prompt_token_count + (usage.candidates_token_count or 0))
+
+    def _retry_on_next_key(self, key, error):
+        if is_quota_error(error):
+            self.pool.mark_exhausted(key)
+        elif is_invalid_key_error(error) and len(self.pool.keys) > 1:
+            self.pool.disable(key)
+        else:
+            return False
+        return self.key is None
+
+    def generate_content(self, prompt, generation_config=None):
+        tokens, tried = estimate_tokens(prompt), set()
+        while True:
+            key = self._acquire(tokens, tried)
+            try:
+                response = self._model(key).generate_content(prompt, generation_config=generation_config)
+            except Exception as e:
+                if not self._retry_on_next_key(key, e):
+                    raise
+                tried.add(key)
+                continue
+            self._settle(key, tokens, response)
+            return response
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        tokens, tried = estimate_tokens(prompt), set()
+        while True:
+            key = await self._acquire_async(tokens, tried)
+            model = self._model(key)
+            if model._async_client is None:
+                # Created here so the grpc channel binds to the shared event loop
+                model._async_client = self.pool.client(key, 'generative_async')
+            try:
+                response = await model.generate_content_async(prompt, generation_config=generation_config)
+            except Exception as e:
+                if not self._retry_on_next_key(key, e):
+                    raise
+                tried.add(key)
+                continue
+            self._settle(key, tokens, response)
+            return response
+
+    def create_cache(self, cache_model_name, context_text):
+        """Create a CachedContent on one pool key and return a model pinned to that key"""
+        # Caching is optional, so a full window is not worth waiting for: the caller falls back to inline context
+        key, _ = self._try_acquire(estimate_tokens(context_text), set())
+        if key is None:
+            raise Exception("429 Resource has been exhausted (e.g. check quota). No API key has room to create a cache.")
+        request = genai.caching.CachedContent._prepare_create_request(
+            model=f"models/{cache_model_name}",
+            contents=[context_text],
+            ttl=timedelta(minutes=CONTEXT_CACHE_TTL_MINUTES)
+        )
+        cache = genai.caching.CachedContent._from_obj(self.pool.client(key, 'cache').create_cached_content(request))
+        return PooledGenerativeModel(self.model_name, self.pool, cached_content=cache, key=key)
+
+def get_key_pool():
+    """The session's own key pool if the user entered a key, otherwise the server-owned pool"""
+    return st.session_state.get('key_pool') or server_key_pool()
+
+def create_model(model_name=DEFAULT_MODEL_NAME):
+    """Create a model for the configured LLM_BACKEND (gemini, mock or http)"""
+    if LLM_BACKEND == "mock":
+        return create_mock_model(model_name)
+    if LLM_BACKEND == "http":
+        return HttpGenerativeModel(MOCK_LLM_URL, model_name)
+    model = PooledGenerativeModel(model_name, get_key_pool())
+    recordings_path = os.getenv("LLM_RECORD_TO")
+    return RecordingModel(model, recordings_path) if recordings_path else model
+
+def set_default_model(model):
+    """Set the model used by generation calls made outside a Streamlit session (benchmarks, CI)"""
+    global _default_model
+    _default_model = model
+
+def get_model(task=None):
+    """Return the model routed for task, or the process default when there is no session"""
+    model = st.session_state.get('model')
+    if model is None:
+        return _default_model
+    if task is None:
+        return model
+    model_name = MODEL_ROUTES[task]['model']
+    if 'routed_models' not in st.session_state:
+        st.session_state.routed_models = {}
+    if model_name not in st.session_state.routed_models:
+        st.session_state.routed_models[model_name] = create_model(model_name)
+    return st.session_state.routed_models[model_name]
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+def finish_reason(response):
+    """Return the first candidate's finish reason name (STOP, MAX_TOKENS, ...) or None"""
+    candidates = getattr(response, 'candidates', None)
+    if not candidates:
+        return None
+    reason = candidates[0].finish_reason
+    return getattr(reason, 'name', reason)
+
+def trim_truncated_text(text):
+    """Drop the partial block a MAX_TOKENS cut-off leaves at the end of markdown text"""
+    for separator in ("\n\n", "\n", ". "):
+        cut = text.rfind(separator)
+        if cut > len(text) // 2:
+            return text[:cut + (1 if separator == ". " else 0)].rstrip()
+    return text.rstrip()
+
+def _usage_tokens(response, prompt, text):
+    """Return (uncached input, output, cached input) token counts for a response"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None and getattr(usage, 'prompt_token_count', None):
+        cached_tokens = getattr(usage, 'cached_content_token_count', 0) or 0
+        return usage.prompt_token_count - cached_tokens, usage.candidates_token_count or 0, cached_tokens
+    return estimate_tokens(prompt), estimate_tokens(text), 0
+
+@st.cache_resource
+def _route_stats_store():
+    """Per-route statistics shared by every session and rerun"""
+    return {'routes': {}, 'lock': threading.Lock()}
+
+def _route_stats(store, task, model_name, version):
+    stats = store['routes'].setdefault((task, version), {
+        'model': model_name,
+        'calls': 0,
+        'errors': 0,
+        'coalesced': 0,
+        'truncated': 0,
+        'input_tokens': 0,
+        'output_tokens': 0,
+        'cached_tokens': 0,
+        'cost_usd': 0.0,
+        'latencies': deque(maxlen=500)
+    })
+    stats['model'] = model_name
+    return stats
+
+def record_coalesced_call(task, version=None):
+    """Count a request that joined an identical in-flight call instead of sending its own"""
+    store = _route_stats_store()
+    with store['lock']:
+        _route_stats(store, task, MODEL_ROUTES[task]['model'], version)['coalesced'] += 1
+
+def record_route_call(task, model_name, latency, input_tokens, output_tokens, cached_tokens=0, error=False, version=None,
+                      truncated=False):
+    """Record one call for task's route, split by the prompt template version that produced it"""
+    input_price, output_price = MODEL_PRICING.get(model_name, (0.0, 0.0))
+    store = _route_stats_store()
+    with store['lock']:
+        stats = _route_stats(store, task, model_name, version)
+        stats['calls'] += 1
+        stats['errors'] += int(error)
+        stats['truncated'] += int(truncated)
+        stats['input_tokens'] += input_tokens
+        stats['output_tokens'] += output_tokens
+        stats['cached_tokens'] += cached_tokens
+        stats['cost_usd'] += (
+            input_tokens * input_price
+            + cached_tokens * input_price * CACHED_INPUT_DISCOUNT
+            + output_tokens * output_price
+        ) / 1_000_000
+        stats['latencies'].append(latency)
+
+def get_route_stats():
+    """Summarize per-route and prompt version latency percentiles, token usage and estimated cost"""
+    summary = []
+    store = _route_stats_store()
+    with store['lock']:
+        for (task, version), stats in store['routes'].items():
+            latencies = sorted(stats['latencies'])
+            summary.append({
+                'task': task,
+                'prompt': version,
+                'model': stats['model'],
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'coalesced': stats['coalesced'],
+                'truncated': stats['truncated'],
+                'p50_s': round(latencies[len(latencies) // 2], 3) if latencies else None,
+                'p95_s': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+                'input_tokens': stats['input_tokens'],
+                'output_tokens': stats['output_tokens'],
+                'cached_tokens': stats['cached_tokens'],
+                'cost_usd': round(stats['cost_usd'], 5)
+            })
+    return summary
+
+def create_cached_model(model, model_name, context_text):
+    """Cache context_text with the backend and return a model bound to it, or None if caching is unavailable"""
+    if hasattr(model, 'cache_context'):
+        return model.cache_context(context_text)
+    if LLM_BACKEND != "gemini" or estimate_tokens(context_text) < CONTEXT_CACHE_MIN_TOKENS or not hasattr(model, 'create_cache'):
+        return None
+    try:
+        return model.create_cache(CACHE_MODEL_VERSIONS.get(model_name, model_name), context_text)
+    except Exception:
+        return None
+
+def get_context_model(task, context):
+    """Return the model for task's route with the shared context cached, creating the cache once per model"""
+    if not context['cache']:
+        return None
+    model_name = MODEL_ROUTES[task]['model']
+    if model_name not in context['models']:
+        context['models'][model_name] = create_cached_model(get_model(task), model_name, context['text'])
+    return context['models'][model_name]
+
+@st.cache_resource
+def _async_runtime():
+    """Event loop shared by every session, run in a background thread, and the in-flight calls of each session"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+    runtime = {'loop': loop, 'sessions': {}, 'flights': {}, 'artifacts': _artifact_store(), 'lock': threading.Lock()}
+    loop.call_soon_threadsafe(_reap_closed_sessions, runtime)
+    return runtime
+
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+def _track_call(runtime, session_id, future):
+    with runtime['lock']:
+        runtime['sessions'].setdefault(session_id, set()).add(future)
+
+    def forget(done):
+        with runtime['lock']:
+            calls = runtime['sessions'].get(session_id)
+            if calls is not None:
+                calls.discard(done)
+                if not calls:
+                    del runtime['sessions'][session_id]
+    future.add_done_callback(forget)
+
+def _cancel_calls(runtime, session_id):
+    with runtime['lock']:
+        calls = list(runtime['sessions'].get(session_id, ()))
+    return sum(future.cancel() for future in calls)
+
+def cancel_session_calls():
+    """Cancel the current session's in-flight model calls and return how many were cancelled"""
+    return _cancel_calls(_async_runtime(), current_session_id())
+
+def is_known_session(streamlit_runtime, session_id):
+    """Whether Streamlit still holds the session: active, or disconnected but kept for the browser to reconnect to.
+
+    Runtimes without a session manager to ask report every session as known, leaving idle time to decide.
+    """
+    session_mgr = getattr(streamlit_runtime, '_session_mgr', None)
+    if session_mgr is None:
+        return True
+    return session_mgr.get_session_info(session_id) is not None
+
+def _reap_closed_sessions(runtime):
+    """Cancel calls whose browser session has gone away and evict idle sessions' artifacts, then reschedule itself on the loop"""
+    if Runtime.exists():
+        streamlit_runtime = Runtime.instance()
+        with runtime['lock']:
+            closed = [session_id for session_id in runtime['sessions']
+                      if session_id is not None and not streamlit_runtime.is_active_session(session_id)]
+        for session_id in closed:
+            _cancel_calls(runtime, session_id)
+        evict_idle_artifacts(runtime['artifacts'], streamlit_runtime.is_active_session, functools.partial(is_known_session, streamlit_runtime))
+    runtime['loop'].call_later(SESSION_REAP_INTERVAL_SECONDS, _reap_closed_sessions, runtime)
+
+def prepare_task_call(task, prompt, context=None):
+    """Resolve the model, final prompt and generation config for task.
+
+    With a shared context the prompt only carries the task instructions: it is sent through the
+    cached context when the backend supports it, otherwise the context is prepended inline.
+    Model lookup reads the session, so this runs on the script thread.
+    """
+    route = MODEL_ROUTES[task]
+    model = get_model(task)
+    if context is not None:
+        cached_model = get_context_model(task, context)
+        if cached_model is not None:
+            model = cached_model
+        else:
+            prompt = context['text'] + "\n\n" + prompt
+    generation_config = {key: route[key] for key in ('temperature', 'max_output_tokens', 'response_mime_type') if key in route}
+    return model, prompt, generation_config
+
+async def call_model_async(task, model, prompt, generation_config, timeout, version=None):
+    """Await a model call on the shared loop, handling a MAX_TOKENS cut-off as task's route asks"""
+    route = MODEL_ROUTES[task]
+    text, truncated = await _call_model_once(task, model, prompt, generation_config, timeout, version)
+    budget = generation_config.get('max_output_tokens')
+    if truncated and route.get('on_truncate') == 'retry' and budget and budget < MAX_OUTPUT_TOKENS_LIMIT:
+        generation_config = dict(generation_config, max_output_tokens=min(budget * 2, MAX_OUTPUT_TOKENS_LIMIT))
+        text, truncated = await _call_model_once(task, model, prompt, generation_config, timeout, version)
+    if truncated and route.get('on_truncate') == 'retry':
+        raise Exception(f"The {task} response was cut off at {generation_config.get('max_output_tokens')} output tokens")
+    if truncated and route.get('on_truncate', 'trim') == 'trim':
+        text = trim_truncated_text(text)
+    return text
+
+async def _call_model_once(task, model, prompt, generation_config, timeout, version):
+    """Await one model call, recording latency and usage for task's route and prompt version; return (text, truncated)"""
+    model_name = MODEL_ROUTES[task]['model']
+    if hasattr(model, 'generate_content_async'):
+        call = model.generate_content_async(prompt, generation_config=generation_config)
+    else:
+        call = asyncio.to_thread(model.generate_content, prompt, generation_config=generation_config)
+    started = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(call, timeout)
+        text = response.text
+    except TimeoutError:
+        record_route_call(task, model_name, time.perf_counter() - started, estimate_tokens(prompt), 0, error=True, version=version)
+        raise TimeoutError(f"The {task} request timed out after {timeout:g}s") from None
+    except Exception:
+        record_route_call(task, model_name, time.perf_counter() - started, estimate_tokens(prompt), 0, error=True, version=version)
+        raise
+    truncated = finish_reason(response) == 'MAX_TOKENS'
+    input_tokens, output_tokens, cached_tokens = _usage_tokens(response, prompt, text)
+    record_route_call(task, model_name, time.perf_counter() - started, input_tokens, output_tokens, cached_tokens,
+                      version=version, truncated=truncated)
+    return text, truncated
+
+async def _join_flight(runtime, flight_key, task, version, start_call):
+    """Await the in-flight call for flight_key, starting it if there is none, so identical requests share one call.
+
+    Runs on the event loop, which owns runtime['flights']. Each caller waits through a shield, so
+    cancelling one caller leaves the shared call running for the others; the call itself is
+    cancelled once nobody is waiting on it.
+    """
+    flight = runtime['flights'].get(flight_key)
+    if flight is None:
+        flight = {'call': asyncio.ensure_future(start_call()), 'waiters': 0}
+        runtime['flights'][flight_key] = flight
+
+        def land(_):
+            if runtime['flights'].get(flight_key) is flight:
+                del runtime['flights'][flight_key]
+        flight['call'].add_done_callback(land)
+    else:
+        record_coalesced_call(task, version)
+    flight['waiters'] += 1
+    try:
+        return await asyncio.shield(flight['call'])
+    finally:
+        flight['waiters'] -= 1
+        if not flight['waiters'] and not flight['call'].done():
+            flight['call'].cancel()
+
+def start_task(task, prompt, context=None):
+    """Schedule a generation on the shared event loop and return its concurrent.futures.Future.
+
+    Requests with the same model, generation config, cached context, API keys and prompt are
+    coalesced into one in-flight call whose result every caller receives.
+    """
+    model, prompt, generation_config = prepare_task_call(task, prompt, context)
+    runtime = _async_runtime()
+    timeout = MODEL_ROUTES[task].get('timeout', LLM_CALL_TIMEOUT)
+    version = prompt_version(task)
+    cached_context = context['key'] if context is not None and context['cache'] else None
+    # Only callers spending the same API keys may share a call, its bill and its errors
+    keys = prompt_hash(",".join(get_key_pool().keys)) if LLM_BACKEND == "gemini" else None
+    flight_key = prompt_hash(json.dumps([MODEL_ROUTES[task]['model'], generation_config, cached_context, keys, prompt], sort_keys=True))
+    future = asyncio.run_coroutine_threadsafe(
+        _join_flight(runtime, flight_key, task, version,
+                     lambda: call_model_async(task, model, prompt, generation_config, timeout, version)),
+        runtime['loop']
+    )
+    _track_call(runtime, current_session_id(), future)
+    return future
+
+def prefetch_tasks(context, requests):
+    """Start (task, prompt) calls against context concurrently; generate_for_task picks up their results"""
+    for task, prompt in requests:
+        context['pending'][(task, prompt)] = start_task(task, prompt, context)
+
+def generate_for_task(task, prompt, context=None):
+    """Send prompt to the model routed for task and wait for the text, reusing a call prefetched on context"""
+    future = context['pending'].pop((task, prompt), None) if context is not None else None
+    return (future or start_task(task, prompt, context)).result()
 
 def configure_api(api_key):
     """Configure the API and check if it's valid"""
     try:
-        genai.configure(api_key=api_key)
-        genai.list_models()
+        if LLM_BACKEND == "gemini" and api_key:
+            pool = ApiKeyPool([api_key])
+            pool.validate(api_key)
+            st.session_state.key_pool = pool
+        elif LLM_BACKEND == "gemini":
+            st.session_state.key_pool = None
+            if not validate_server_keys():
+                raise Exception("API key not valid: every server key was rejected")
         st.session_state.api_key_valid = True
-        st.session_state.model = genai.GenerativeModel('gemini-1.5-flash')
+        st.session_state.model = create_model()
+        st.session_state.routed_models = {}
         return True, "API key is valid"
     except Exception as e:
+        st.session_state.api_key_valid = False
         error_msg = str(e).lower()
         if "quota" in error_msg or "limit" in error_msg:
             return False, "API quota exceeded - please check your Google AI Studio quota"
-        elif "invalid" in error_msg or "malformed" in error_msg:
+        elif "invalid" in error_msg or "malformed" in error_msg or is_invalid_key_error(e):
             return False, "Invalid API key"
         else:
             return False, f"API error: {str(e)}"
 
 def check_api_key():
     """Check if we have a valid API key from env or user input"""
-    env_api_key = os.getenv("GOOGLE_API_KEY")
-    if env_api_key:
-        valid, message = configure_api(env_api_key)
+    if st.session_state.api_key_valid and st.session_state.model is not None:
+        return True
+    if LLM_BACKEND != "gemini":
+        valid, message = configure_api(None)
+        return valid
+    if SERVER_API_KEYS:
+        valid, message = configure_api(None)
         if valid:
             return True
         else:
@@ -140,216 +1445,572 @@ def show_api_key_input_in_sidebar():
     else:
         if st.session_state.user_api_key:
             st.info("API key not configured - Refresh the page again")
+
+def show_model_usage():
+    """Show per-route latency, token usage and estimated cost in the sidebar"""
+    stats = get_route_stats()
+    if not stats:
+        return
+    st.markdown("---")
+    with st.expander("Model Usage", expanded=False):
+        st.table(stats)
+        st.caption(f"Estimated total cost: ${sum(row['cost_usd'] for row in stats):.4f}")
+        if LLM_BACKEND == "gemini":
+            st.caption("API key usage in the current minute")
+            st.table(get_key_pool().usage())
+        reuse = jd_reuse_stats()
+        if reuse['lookups']:
+            st.caption(f"Results reused for {reuse['exact']} identical and {reuse['near']} near-duplicate job descriptions "
+                       f"out of {reuse['lookups']} optimizations ({reuse['hit_rate']:.0%} hit rate)")
 def create_resume_pdf(resume_data):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer, 
-        pagesize=letter,
-        rightMargin=40,
-        leftMargin=40,
-        topMargin=40,
-        bottomMargin=40
-    )
-    
+    """Render resume data in the legacy schema (professional_experience, technical_skills) with the classic template"""
+    converted = {key: value for key, value in resume_data.items() if key not in ('professional_experience', 'technical_skills')}
+    converted['work_experience'] = resume_data.get('professional_experience', [])
+    converted['skills'] = resume_data.get('technical_skills', [])
+    return BytesIO(render_resume_pdf(converted).data)
+
+def pdf_styles():
+    """Stylesheet shared by the resume, cover letter and report PDFs"""
     styles = getSampleStyleSheet()
-    styles['Title'].textColor = colors.HexColor("#2E5D9E")
-    styles['Title'].fontName = 'Helvetica-Bold'
-    
-    
     custom_styles = {
-        'ResumeHeader': ParagraphStyle(
-            name='ResumeHeader',
-            parent=styles['Title'],
-            fontSize=18,
-            leading=22,
-            alignment=TA_CENTER,
-            spaceAfter=6
-        ),
-        'ResumeContact': ParagraphStyle(
-            name='ResumeContact',
-            parent=styles['BodyText'],
-            fontSize=10,
-            leading=12,
-            alignment=TA_CENTER,
-            spaceAfter=16,
-            textColor=colors.HexColor("#444444")
-        ),
-        'ResumeRole': ParagraphStyle(
-            name='ResumeRole',
-            parent=styles['BodyText'],
-            fontSize=12,
-            leading=14,
-            alignment=TA_CENTER,
-            spaceAfter=16,
+        'Header': ParagraphStyle(
+            name='Header',
+            parent=styles['Heading1'],
+            fontSize=16,
+            leading=20,
             textColor=colors.HexColor("#2E5D9E"),
-            fontName='Helvetica-Bold'
+            fontName='Helvetica-Bold',
+            alignment=TA_CENTER,
+            spaceAfter=12
         ),
-        'ResumeSection': ParagraphStyle(
-            name='ResumeSection',
+        'SectionHeader': ParagraphStyle(
+            name='SectionHeader',
             parent=styles['Heading2'],
             fontSize=12,
             leading=14,
-            spaceAfter=6,
             textColor=colors.HexColor("#2E5D9E"),
+            fontName='Helvetica-Bold',
             underlineWidth=1,
             underlineColor=colors.HexColor("#2E5D9E"),
-            underlineOffset=-4,
-            underlineGap=2
+            spaceAfter=6
         ),
-        'ResumeJobTitle': ParagraphStyle(
-            name='ResumeJobTitle',
+        'JobTitle': ParagraphStyle(
+            name='JobTitle',
             parent=styles['BodyText'],
             fontSize=11,
             leading=13,
-            spaceAfter=2,
-            fontName='Helvetica-Bold'
+            fontName='Helvetica-Bold',
+            spaceAfter=2
         ),
-        'ResumeCompany': ParagraphStyle(
-            name='ResumeCompany',
+        'Company': ParagraphStyle(
+            name='Company',
             parent=styles['BodyText'],
             fontSize=10,
             leading=12,
-            spaceAfter=4,
             textColor=colors.HexColor("#555555"),
-            fontName='Helvetica-Oblique'
+            fontName='Helvetica-Oblique',
+            spaceAfter=4
         ),
-        'ResumeBullet': ParagraphStyle(
-            name='ResumeBullet',
+        'BulletPoint': ParagraphStyle(
+            name='BulletPoint',
             parent=styles['BodyText'],
+            fontSize=10,
+            leading=12,
             leftIndent=10,
             spaceAfter=4,
             bulletFontName='Helvetica',
             bulletFontSize=10
+        ),
+        'CoverBody': ParagraphStyle(
+            name='CoverBody',
+            parent=styles['BodyText'],
+            fontSize=11,
+            leading=14,
+            spaceAfter=12
+        ),
+        'SkillCategory': ParagraphStyle(
+            name='SkillCategory',
+            parent=styles['BodyText'],
+            fontSize=10,
+            leading=12,
+            fontName='Helvetica-Bold',
+            textColor=colors.HexColor("#2E5D9E"),
+            spaceAfter=4
         )
     }
-    
     for style_name, style in custom_styles.items():
         styles.add(style)
-    
-    story = []
-    
-    
-    story.append(Paragraph(resume_data['contact_info']['name'].upper(), styles['ResumeHeader']))
-    
-    
-    contact_parts = []
-    if 'email' in resume_data['contact_info']:
-        contact_parts.append(f"✉ {resume_data['contact_info']['email']}")
-    if 'phone' in resume_data['contact_info']:
-        contact_parts.append(f"📞 {resume_data['contact_info']['phone']}")
-    if 'location' in resume_data['contact_info']:
-        contact_parts.append(f"📍 {resume_data['contact_info']['location']}")
-    if 'linkedin' in resume_data['contact_info']:
-        contact_parts.append(f"🔗 {resume_data['contact_info']['linkedin']}")
-    
-    story.append(Paragraph(" | ".join(contact_parts), styles['ResumeContact']))
-    story.append(Paragraph(resume_data['target_role'].upper(), styles['ResumeRole']))
-    story.append(Spacer(1, 1))
-    story.append(Paragraph("<hr/>", styles['Normal']))
-    story.append(Spacer(1, 12))
-    
-    
-    story.append(Paragraph("PROFESSIONAL SUMMARY", styles['ResumeSection']))
-    story.append(Paragraph(resume_data['professional_summary'], styles['Normal']))
-    story.append(Spacer(1, 12))
-    
+    return styles
 
-    
-    
-    story.append(Paragraph("PROFESSIONAL EXPERIENCE", styles['ResumeSection']))
-    for exp in resume_data['professional_experience']:
-        story.append(Paragraph(exp['job_title'], styles['ResumeJobTitle']))
-        
-        company_info = []
-        if 'company' in exp:
-            company_info.append(f"<b>{exp['company']}</b>")
-        if 'dates' in exp:
-            company_info.append(exp['dates'])
-        if 'location' in exp:
-            company_info.append(exp['location'])
-        
-        story.append(Paragraph(" | ".join(company_info), styles['ResumeCompany']))
-        
-        bullet_points = []
-        for achievement in exp['achievements']:
-            bullet_points.append(
-                ListItem(
-                    Paragraph(achievement, styles['ResumeBullet']),
-                    bulletColor=colors.HexColor("#2E5D9E"),
-                    value="•",
-                    leftIndent=15
-                )
-            )
-        
-        story.append(ListFlowable(bullet_points, bulletType='bullet', leftIndent=20))
-        story.append(Spacer(1, 8))
-    
-    
-    story.append(Paragraph("EDUCATION", styles['ResumeSection']))
-    for edu in resume_data['education']:
-        edu_info = []
-        if 'degree' in edu:
-            edu_info.append(f"<b>{edu['degree']}</b>")
-        if 'institution' in edu:
-            edu_info.append(edu['institution'])
-        if 'year' in edu:
-            edu_info.append(f"({edu['year']})")
-        if 'honors' in edu and edu['honors']:
-            edu_info.append(f"<i>{edu['honors']}</i>")
-        
-        story.append(Paragraph(", ".join(edu_info), styles['Normal']))
-        story.append(Spacer(1, 4))
-    story.append(Spacer(1, 8))
-    
-    
-    if 'technical_skills' in resume_data and resume_data['technical_skills']:
-        story.append(Paragraph("TECHNICAL SKILLS", styles['ResumeSection']))
-        
-        skills = resume_data['technical_skills']
-        skill_data = []
-        for i in range(0, len(skills), 3):
-            row = skills[i:i+3]
-            while len(row) < 3:
-                row.append("")
-            skill_data.append(row)
-        
-        skill_table = Table(skill_data, colWidths=[doc.width/3]*3)
-        skill_table.setStyle(TableStyle([
-            ('VALIGN', (0,0), (-1,-1), 'TOP'),
-            ('LEFTPADDING', (0,0), (-1,-1), 0),
-            ('RIGHTPADDING', (0,0), (-1,-1), 0),
-            ('FONTSIZE', (0,0), (-1,-1), 9),
-            ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 2),
-        ]))
-        story.append(skill_table)
-        story.append(Spacer(1, 12))
-    
-    
-    if 'certifications' in resume_data and resume_data['certifications']:
-        story.append(Paragraph("CERTIFICATIONS", styles['ResumeSection']))
-        for cert in resume_data['certifications']:
-            story.append(Paragraph(f"• {cert}", styles['Normal']))
-        story.append(Spacer(1, 12))
-    
-    
-    if 'projects' in resume_data and resume_data['projects']:
-        story.append(Paragraph("PROJECTS", styles['ResumeSection']))
-        for proj in resume_data['projects']:
-            story.append(Paragraph(f"<b>{proj['name']}</b>", styles['ResumeJobTitle']))
-            story.append(Paragraph(proj['description'], styles['Normal']))
-            story.append(Paragraph(f"<font color='#555555'><i>Technologies: {', '.join(proj['technologies'])}</i></font>", styles['Normal']))
-            story.append(Spacer(1, 8))
-    
-    
-    story.append(Spacer(1, 20))
-    story.append(Paragraph("<font color='#888888' size=8>Generated by AI Job Search Assistant</font>", styles['Normal']))
-    
+PDF_PAGE_SIZES = {'letter': letter, 'A4': A4}
+# Resume layouts as data; compile_resume_layout turns one into styles and frame geometry for a page size and scale.
+# sidebar lists the sections set in a narrow left column; fit templates are always scaled to one page
+RESUME_TEMPLATES = {
+    'classic': {
+        'label': "Classic", 'font': 'Helvetica', 'bold_font': 'Helvetica-Bold', 'italic_font': 'Helvetica-Oblique',
+        'accent': "#2E5D9E", 'name_size': 16, 'section_size': 12, 'title_size': 11, 'body_size': 10,
+        'margin': 40, 'section_gap': 12, 'entry_gap': 8, 'skills': 'blocks', 'sidebar': (), 'footer': True, 'fit': False
+    },
+    'compact': {
+        'label': "Compact one-page", 'font': 'Helvetica', 'bold_font': 'Helvetica-Bold', 'italic_font': 'Helvetica-Oblique',
+        'accent': "#333333", 'name_size': 14, 'section_size': 10, 'title_size': 9.5, 'body_size': 9,
+        'margin': 28, 'section_gap': 6, 'entry_gap': 3, 'skills': 'inline', 'sidebar': (), 'footer': False, 'fit': True
+    },
+    'two_column': {
+        'label': "Two-column", 'font': 'Helvetica', 'bold_font': 'Helvetica-Bold', 'italic_font': 'Helvetica-Oblique',
+        'accent': "#1F6F5C", 'name_size': 18, 'section_size': 11, 'title_size': 10.5, 'body_size': 9.5,
+        'margin': 36, 'section_gap': 10, 'entry_gap': 6, 'skills': 'inline', 'sidebar': ('skills', 'education', 'certifications'),
+        'sidebar_width': 0.32, 'column_gap': 16, 'footer': False, 'fit': False
+    }
+}
+RESUME_SECTION_TITLES = {
+    'professional_summary': "PROFESSIONAL SUMMARY",
+    'work_experience': "PROFESSIONAL EXPERIENCE",
+    'education': "EDUCATION",
+    'skills': "SKILLS",
+    'projects': "PROJECTS",
+    'certifications': "CERTIFICATIONS"
+}
+# (type scale, spacing scale, cost) steps tried by fit-to-page: spacing tightens first, then the type shrinks, each
+# step costing more than the last. Every step is measured, never built
+RESUME_FIT_STEPS = (
+    (1.0, 1.0, 0.0), (1.0, 0.75, 0.25), (1.0, 0.5, 0.5), (0.95, 0.5, 1.5),
+    (0.9, 0.5, 3.0), (0.85, 0.5, 5.0), (0.8, 0.5, 8.0), (0.75, 0.5, 12.0)
+)
+# Fit never drops a position's best-scored bullets below this many; other bullets, projects and certifications are optional
+RESUME_FIT_KEEP_BULLETS = 2
+# Cost of dropping each kind of item, in the same currency as RESUME_FIT_STEPS. A bullet's cost is further weighted
+# by its score and by how recent its position is, so old, weak bullets go first
+RESUME_FIT_COSTS = {'bullet': 1.0, 'project': 1.0, 'certification': 1.5}
+RESUME_FIT_ITEM_NAMES = {'work_experience': "bullet", 'projects': "project", 'certifications': "certification"}
+FRAME_PADDING = 6
+
+@dataclass(frozen=True, slots=True)
+class ResumeLayout:
+    """A resume template compiled for one page size and scale.
+
+    frames holds (x, y, width, height) boxes: 'full' for the whole text area, 'sidebar' and 'main' for the
+    columns (a one-column layout has no sidebar). Frames themselves are stateful, so every build creates its own.
+    """
+    template: str
+    page_size: tuple
+    scale: float
+    spacing: float
+    styles: dict
+    accent: object
+    frames: dict
+    section_gap: float
+    entry_gap: float
+    skills: str
+    sidebar: tuple
+    footer: bool
+
+@dataclass(frozen=True, slots=True)
+class ResumePdf:
+    data: bytes
+    pages: int
+    scale: float
+    spacing: float
+    timings: dict
+    dropped: tuple = ()
+
+@dataclass(frozen=True, slots=True)
+class ResumeFitItem:
+    """Content fit-to-page may drop: a bullet (section 'work_experience') or a whole project or certification"""
+    section: str
+    entry: int
+    bullet: int | None
+    cost: float
+
+@dataclass(frozen=True, slots=True)
+class ResumeFitPlan:
+    """The layout and trimmed resume_data fit-to-page settled on, found by measuring only"""
+    layout: ResumeLayout
+    resume_data: dict
+    dropped: tuple
+    fits: bool
+    passes: int
+    measure_ms: float
+    search_ms: float
+
+@st.cache_resource
+def compile_resume_layout(template, page_size='letter', scale=1.0, spacing=None):
+    """Paragraph styles and frame geometry for a template, built once per (template, page size, scale, spacing).
+
+    scale sizes the type and spacing the gaps around it; spacing follows scale when not given.
+    """
+    spacing = scale if spacing is None else spacing
+    spec = RESUME_TEMPLATES[template]
+    accent = colors.HexColor(spec['accent'])
+    base = getSampleStyleSheet()['BodyText']
+
+    def style(name, size, font=None, **overrides):
+        values = {'fontName': font or spec['font'], 'fontSize': size * scale, 'leading': size * scale * 1.2, 'spaceBefore': 0, 'spaceAfter': 0}
+        values.update(overrides)
+        return ParagraphStyle(name=f"{template}-{name}", parent=base, **values)
+
+    alignment = TA_LEFT if spec['sidebar'] else TA_CENTER
+    styles = {
+        'name': style('name', spec['name_size'], spec['bold_font'], textColor=accent, alignment=alignment, spaceAfter=6 * spacing),
+        'contact': style('contact', spec['body_size'], alignment=alignment, textColor=colors.HexColor("#444444"), spaceAfter=4 * spacing),
+        'section': style('section', spec['section_size'], spec['bold_font'], textColor=accent,
+                         spaceBefore=spec['section_gap'] * spacing, spaceAfter=4 * spacing),
+        'title': style('title', spec['title_size'], spec['bold_font'], spaceAfter=2 * spacing),
+        'company': style('company', spec['body_size'], spec['italic_font'], textColor=colors.HexColor("#555555"), spaceAfter=3 * spacing),
+        'body': style('body', spec['body_size']),
+        'bullet': style('bullet', spec['body_size'], spaceAfter=2 * spacing),
+        'category': style('category', spec['body_size'], spec['bold_font'], textColor=accent, spaceAfter=2 * spacing),
+        'footer': style('footer', 8, textColor=colors.HexColor("#888888"), spaceBefore=20 * spacing)
+    }
+
+    width, height = PDF_PAGE_SIZES[page_size]
+    margin = spec['margin']
+    frames = {'full': (margin, margin, width - 2 * margin, height - 2 * margin)}
+    frames['main'] = frames['full']
+    if spec['sidebar']:
+        sidebar_width = (width - 2 * margin) * spec['sidebar_width']
+        frames['sidebar'] = (margin, margin, sidebar_width, height - 2 * margin)
+        frames['main'] = (margin + sidebar_width + spec['column_gap'], margin,
+                          width - 2 * margin - sidebar_width - spec['column_gap'], height - 2 * margin)
+    return ResumeLayout(template, (width, height), scale, spacing, styles, accent, frames, spec['section_gap'] * spacing,
+                        spec['entry_gap'] * spacing, spec['skills'], spec['sidebar'], spec['footer'])
+
+def resume_header_flowables(resume_data, layout):
+    contact = resume_data.get('contact_info', {})
+    flowables = []
+    if contact.get('name'):
+        flowables.append(Paragraph(html.escape(contact['name'].upper()), layout.styles['name']))
+    parts = [f"{icon} {html.escape(contact[key])}" for key, icon in (('email', "✉"), ('phone', "📞"), ('location', "📍"), ('linkedin', "🔗"))
+             if contact.get(key)]
+    if parts:
+        flowables.append(Paragraph(" | ".join(parts), layout.styles['contact']))
+    return flowables
+
+def resume_bullet_list(achievements, layout):
+    return ListFlowable(
+        [ListItem(Paragraph(html.escape(achievement), layout.styles['bullet']), bulletColor=layout.accent, value="•", leftIndent=15 * layout.scale)
+         for achievement in achievements],
+        bulletType='bullet', leftIndent=20 * layout.scale, bulletFontSize=layout.styles['bullet'].fontSize
+    )
+
+def resume_section_flowables(key, value, layout, width):
+    """Flowables for one resume section at the given column width, or [] when the section is empty"""
+    if not value:
+        return []
+    styles = layout.styles
+    flowables = [Paragraph(RESUME_SECTION_TITLES[key], styles['section'])]
+    if key == 'professional_summary':
+        flowables.append(Paragraph(html.escape(value), styles['body']))
+    elif key == 'work_experience':
+        for exp in value:
+            if exp.get('job_title'):
+                flowables.append(Paragraph(html.escape(exp['job_title']), styles['title']))
+            company_info = [f"<b>{html.escape(exp['company'])}</b>"] if exp.get('company') else []
+            company_info += [html.escape(exp[field]) for field in ('dates', 'location') if exp.get(field)]
+            if company_info:
+                flowables.append(Paragraph(" | ".join(company_info), styles['company']))
+            if exp.get('achievements'):
+                flowables.append(resume_bullet_list(exp['achievements'], layout))
+            flowables.append(Spacer(1, layout.entry_gap))
+    elif key == 'education':
+        for edu in value:
+            edu_info = [f"<b>{html.escape(edu['degree'])}</b>"] if edu.get('degree') else []
+            edu_info += [html.escape(edu['institution'])] if edu.get('institution') else []
+            edu_info += [f"({html.escape(edu['year'])})"] if edu.get('year') else []
+            edu_info += [f"<i>{html.escape(edu['honors'])}</i>"] if edu.get('honors') else []
+            if edu_info:
+                flowables.append(Paragraph(", ".join(edu_info), styles['body']))
+                flowables.append(Spacer(1, layout.entry_gap / 2))
+    elif key == 'skills':
+        if isinstance(value, dict):
+            for category, skills in value.items():
+                if not skills:
+                    continue
+                if layout.skills == 'inline':
+                    flowables.append(Paragraph(f"<b>{html.escape(category)}:</b> {html.escape(', '.join(skills))}", styles['body']))
+                else:
+                    flowables.append(Paragraph(html.escape(category.upper()), styles['category']))
+                    flowables.append(Paragraph(html.escape(", ".join(skills)), styles['body']))
+                flowables.append(Spacer(1, layout.entry_gap / 2))
+        elif layout.skills == 'inline':
+            flowables.append(Paragraph(html.escape(", ".join(value)), styles['body']))
+        else:
+            rows = [list(value[i:i + 3]) + [""] * (3 - len(value[i:i + 3])) for i in range(0, len(value), 3)]
+            skill_table = Table(rows, colWidths=[width / 3] * 3)
+            skill_table.setStyle(TableStyle([
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                ('LEFTPADDING', (0, 0), (-1, -1), 0),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+                ('FONTSIZE', (0, 0), (-1, -1), 9 * layout.scale),
+                ('FONTNAME', (0, 0), (-1, -1), styles['body'].fontName),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 2 * layout.scale),
+            ]))
+            flowables.append(skill_table)
+    elif key == 'projects':
+        for proj in value:
+            if proj.get('name'):
+                flowables.append(Paragraph(f"<b>{html.escape(proj['name'])}</b>", styles['title']))
+            if proj.get('description'):
+                flowables.append(Paragraph(html.escape(proj['description']), styles['body']))
+            if proj.get('technologies'):
+                flowables.append(Paragraph(f"<font color='#555555'><i>Technologies: {html.escape(', '.join(proj['technologies']))}</i></font>", styles['body']))
+            flowables.append(Spacer(1, layout.entry_gap))
+    elif key == 'certifications':
+        flowables.extend(Paragraph(f"• {html.escape(cert)}", styles['body']) for cert in value)
+    return flowables
+
+def resume_columns(resume_data, layout):
+    """The resume as {frame name: flowables} for the layout's header, sidebar and main column"""
+    inner = {name: box[2] - 2 * FRAME_PADDING for name, box in layout.frames.items()}
+    inner.setdefault('sidebar', inner['main'])
+    columns = {'header': resume_header_flowables(resume_data, layout), 'sidebar': [], 'main': []}
+    for _, key, _ in RESUME_SECTIONS:
+        column = 'sidebar' if key in layout.sidebar else 'main'
+        columns[column].extend(resume_section_flowables(key, resume_data.get(key), layout, inner[column]))
+    if layout.footer:
+        columns['main'].append(Paragraph("Generated by AI Resume Optimizer", layout.styles['footer']))
+    return columns
+
+def flowables_height(flowables, width, canv):
+    """Height the flowables take stacked in a frame of the given inner width, measured with wrap() and no rendering"""
+    height = 0
+    for i, flowable in enumerate(flowables):
+        height += flowable.wrapOn(canv, width, 1e6)[1] + flowable.getSpaceAfter() + (flowable.getSpaceBefore() if i else 0)
+    return height
+
+def resume_frame_boxes(layout, header_height):
+    """First-page frame boxes: the header across the top, the columns below it"""
+    if not layout.sidebar:
+        return {'main': layout.frames['full']}
+    full_x, full_y, full_width, full_height = layout.frames['full']
+    header_y = full_y + full_height - header_height - 2 * FRAME_PADDING
+    sidebar, main = layout.frames['sidebar'], layout.frames['main']
+    return {
+        'header': (full_x, header_y, full_width, header_height + 2 * FRAME_PADDING),
+        'sidebar': (sidebar[0], sidebar[1], sidebar[2], header_y - sidebar[1]),
+        'main': (main[0], main[1], main[2], header_y - main[1])
+    }
+
+def resume_first_page_boxes(columns, layout, canv):
+    """First-page frame boxes for built columns; a two-column header frame is sized to its measured height"""
+    if not layout.sidebar:
+        return resume_frame_boxes(layout, 0)
+    return resume_frame_boxes(layout, flowables_height(columns['header'], layout.frames['full'][2] - 2 * FRAME_PADDING, canv))
+
+def resume_overflow(columns, layout, canv):
+    """First-page boxes and, per column, how many points its flowables run past its box (negative when there is room)"""
+    boxes = resume_first_page_boxes(columns, layout, canv)
+    stacks = {'sidebar': columns['sidebar'], 'main': columns['main']} if layout.sidebar else {'main': columns['header'] + columns['main']}
+    return boxes, {name: flowables_height(stack, boxes[name][2] - 2 * FRAME_PADDING, canv) - (boxes[name][3] - 2 * FRAME_PADDING)
+                   for name, stack in stacks.items()}
+
+def resume_fit_items(resume_data, job_description=''):
+    """Everything fit-to-page may drop, each with what dropping it costs.
+
+    Each position keeps its RESUME_FIT_KEEP_BULLETS best-scored bullets; the rest cost more the higher they score
+    and the more recent their position. Projects and certifications are optional as a whole.
+    """
+    items = []
+    for position, scores in itertools.groupby(score_achievements(resume_data, job_description), key=lambda scored: scored.position):
+        ranked = sorted(scores, key=lambda scored: (-scored.score, scored.bullet))
+        items.extend(ResumeFitItem('work_experience', position, scored.bullet,
+                                   RESUME_FIT_COSTS['bullet'] * (0.5 + scored.score) / (1 + position))
+                     for scored in ranked[RESUME_FIT_KEEP_BULLETS:])
+    for section, kind in (('projects', 'project'), ('certifications', 'certification')):
+        items.extend(ResumeFitItem(section, entry, None, RESUME_FIT_COSTS[kind]) for entry in range(len(resume_data.get(section) or ())))
+    return items
+
+def trim_resume(resume_data, items):
+    """resume_data without the given fit items"""
+    drop = {(item.section, item.entry, item.bullet) for item in items}
+    trimmed = dict(resume_data)
+    if resume_data.get('work_experience'):
+        trimmed['work_experience'] = [
+            dict(exp, achievements=[achievement for j, achievement in enumerate(exp.get('achievements') or ()) if ('work_experience', i, j) not in drop])
+            for i, exp in enumerate(resume_data['work_experience'])
+        ]
+    for section in ('projects', 'certifications'):
+        if resume_data.get(section):
+            trimmed[section] = [entry for i, entry in enumerate(resume_data[section]) if (section, i, None) not in drop]
+    return trimmed
+
+def fit_column(section, layout):
+    return 'sidebar' if section in layout.sidebar else 'main'
+
+def measure_fit_fixed(resume_data, items, layout):
+    """First-page boxes and {column: points over its box} for the resume without any optional item.
+
+    Headings of sections whose every entry is optional are counted anyway, which can only overestimate.
+    """
+    canv = Canvas(BytesIO(), pagesize=layout.page_size)
+    boxes, overflow = resume_overflow(resume_columns(trim_resume(resume_data, items), layout), layout, canv)
+    for section in {item.section for item in items} - {'work_experience'}:
+        heading = Paragraph(RESUME_SECTION_TITLES[section], layout.styles['section'])
+        column = fit_column(section, layout)
+        overflow[column] += flowables_height([heading], boxes[column][2] - 2 * FRAME_PADDING, canv) + heading.getSpaceBefore()
+    return boxes, overflow
+
+def measure_fit_items(resume_data, items, layout, boxes):
+    """The height each optional item adds to its column, measured on its own with wrap()"""
+    canv = Canvas(BytesIO(), pagesize=layout.page_size)
+    heights = []
+    for item in items:
+        width = boxes[fit_column(item.section, layout)][2] - 2 * FRAME_PADDING
+        if item.section == 'work_experience':
+            flowables = [resume_bullet_list([resume_data['work_experience'][item.entry]['achievements'][item.bullet]], layout)]
+        else:
+            flowables = resume_section_flowables(item.section, [resume_data[item.section][item.entry]], layout, width)[1:]
+        heights.append(flowables_height(flowables, width, canv) + flowables[0].getSpaceBefore())
+    return heights
+
+def cheapest_cover(heights, costs, need):
+    """0/1 knapsack in covering form: the cheapest set of items whose whole-point heights add up to at least need,
+    or all of them when together they fall short. Returns (cost, indices).
+    """
+    need = min(need, sum(heights))
+    if need <= 0:
+        return 0.0, ()
+    # best[h] is the cheapest cost of freeing h points (need standing for "need or more")
+    best = [0.0] + [math.inf] * need
+    choices = []
+    for height, cost in zip(heights, costs):
+        updated = {}
+        for freed in range(need, -1, -1):
+            if best[freed] == math.inf:
+                continue
+            target = min(need, freed + height)
+            if best[freed] + cost < best[target]:
+                best[target] = best[freed] + cost
+                updated[target] = freed
+        choices.append(updated)
+    chosen, freed = [], need
+    for index in range(len(choices) - 1, -1, -1):
+        if freed in choices[index]:
+            chosen.append(index)
+            freed = choices[index][freed]
+    return best[need], tuple(reversed(chosen))
+
+def plan_resume_fit(resume_data, template, page_size='letter', job_description=''):
+    """Choose type size, spacing and what to drop so a resume fits one page, measuring but never rendering.
+
+    The resume without optional items only shrinks down RESUME_FIT_STEPS, so a binary search finds the first step
+    where it fits. From there each step measures every optional item once, and a knapsack per column picks the
+    cheapest items covering the overflow, until a step alone costs more than the best plan so far. When no step
+    fits, the last one is used with nothing dropped.
+    """
+    measure_seconds = search_seconds = 0.0
+    items = resume_fit_items(resume_data, job_description)
+    layouts, fixed, passes = {}, {}, 0
+
+    def measure(step, with_items=False):
+        nonlocal measure_seconds, passes
+        started = time.perf_counter()
+        if step not in fixed:
+            layouts[step] = compile_resume_layout(template, page_size, *RESUME_FIT_STEPS[step][:2])
+            fixed[step] = measure_fit_fixed(resume_data, items, layouts[step])
+            passes += 1
+        boxes, overflow = fixed[step]
+        heights = None
+        if with_items:
+            heights = measure_fit_items(resume_data, items, layouts[step], boxes)
+            passes += 1
+        measure_seconds += time.perf_counter() - started
+        return overflow, heights
+
+    # Most resumes fit without shrinking, so the search starts by trying the first step on its own
+    low, high, first = 1, len(RESUME_FIT_STEPS) - 1, None
+    if all(points <= 0 for points in measure(0)[0].values()):
+        first, high = 0, -1
+    while low <= high:
+        middle = (low + high) // 2
+        if all(points <= 0 for points in measure(middle)[0].values()):
+            first, high = middle, middle - 1
+        else:
+            low = middle + 1
+
+    best = None
+    for step in range(len(RESUME_FIT_STEPS) if first is None else first, len(RESUME_FIT_STEPS)):
+        cost = RESUME_FIT_STEPS[step][2]
+        if best is not None and cost >= best[0]:
+            break
+        overflow, heights = measure(step, with_items=True)
+        started = time.perf_counter()
+        dropped = []
+        for column, points in overflow.items():
+            candidates = [index for index, item in enumerate(items) if fit_column(item.section, layouts[step]) == column]
+            # points is the overflow with every item dropped, so keeping them all runs over by points plus their heights.
+            # Heights round down and the overflow up, so a cover always frees at least as much as measured; the
+            # fixed block fits at this step, so when rounding leaves the items short, dropping them all still fits
+            need = math.ceil(points + sum(heights[index] for index in candidates))
+            cover = cheapest_cover([int(heights[index]) for index in candidates], [items[index].cost for index in candidates], need)
+            cost += cover[0]
+            dropped.extend(candidates[index] for index in cover[1])
+        search_seconds += time.perf_counter() - started
+        if best is None or cost < best[0]:
+            best = (cost, layouts[step], tuple(items[index] for index in sorted(dropped)))
+    if best is None:
+        best = (None, compile_resume_layout(template, page_size, *RESUME_FIT_STEPS[-1][:2]), ())
+    _, layout, dropped = best
+    return ResumeFitPlan(layout, trim_resume(resume_data, dropped) if dropped else resume_data, dropped, first is not None,
+                         passes, round(measure_seconds * 1000, 2), round(search_seconds * 1000, 2))
+
+def describe_fit_drops(dropped):
+    """'2 bullets, 1 project' for the items fit-to-page dropped"""
+    counts = {}
+    for item in dropped:
+        counts[item.section] = counts.get(item.section, 0) + 1
+    return ", ".join(f"{count} {RESUME_FIT_ITEM_NAMES[section]}{'s' if count != 1 else ''}" for section, count in counts.items())
+
+def describe_fit(scale, spacing, dropped):
+    """What fitting changed, e.g. 'tighter spacing, 90% type, dropping 2 bullets', or '' when nothing"""
+    parts = ["tighter spacing"] if spacing < scale else []
+    parts += [f"{scale:.0%} type"] if scale < 1 else []
+    parts += [f"dropping {describe_fit_drops(dropped)}"] if dropped else []
+    return ", ".join(parts)
+
+def render_resume_pdf(resume_data, template='classic', page_size='letter', fit=False, job_description=''):
+    """Render a resume with a template on letter or A4 paper in a single build.
+
+    With fit (or a template declared 'fit'), plan_resume_fit first settles type size, spacing and what to drop by
+    measuring; job_description guides which bullets are worth keeping.
+    """
+    started = time.perf_counter()
+    plan = None
+    if fit or RESUME_TEMPLATES[template]['fit']:
+        plan = plan_resume_fit(resume_data, template, page_size, job_description)
+        layout, resume_data = plan.layout, plan.resume_data
+    else:
+        layout = compile_resume_layout(template, page_size)
+    columns = resume_columns(resume_data, layout)
+    # Lists measure their bullets on a canvas; nothing is drawn on this one
+    boxes = resume_first_page_boxes(columns, layout, Canvas(BytesIO(), pagesize=layout.page_size))
+    measured = time.perf_counter()
+
+    buffer = BytesIO()
+    doc = BaseDocTemplate(buffer, pagesize=layout.page_size, title=resume_data.get('contact_info', {}).get('name', ''))
+    if layout.sidebar:
+        story = [NextPageTemplate('later'), *columns['header'], FrameBreak(), *columns['sidebar'], FrameBreak(), *columns['main']]
+    else:
+        story = [NextPageTemplate('later'), *columns['header'], *columns['main']]
+    doc.addPageTemplates([
+        PageTemplate(id='first', frames=[Frame(*box, id=name) for name, box in boxes.items()]),
+        PageTemplate(id='later', frames=[Frame(*layout.frames['full'], id='full')])
+    ])
     doc.build(story)
-    buffer.seek(0)
-    return buffer
+    built = time.perf_counter()
+    search_ms = plan.search_ms if plan else 0.0
+    return ResumePdf(buffer.getvalue(), doc.page, layout.scale, layout.spacing, {
+        'measure_ms': round((measured - started) * 1000 - search_ms, 2),
+        'search_ms': search_ms,
+        'build_ms': round((built - measured) * 1000, 2),
+        'passes': plan.passes if plan else 0
+    }, plan.dropped if plan else ())
+
+def create_pdf_document(resume_data, is_resume=True, template='classic', page_size='letter', fit=False, job_description=''):
+    """A resume rendered with a template, or a cover letter when is_resume is False and resume_data is its text"""
+    if is_resume:
+        return BytesIO(render_resume_pdf(resume_data, template, page_size, fit, job_description).data)
 
-def create_pdf_document(resume_data, is_resume=True):
     buffer = BytesIO()
     doc = SimpleDocTemplate(
         buffer,
@@ -360,243 +2021,51 @@ def create_pdf_document(resume_data, is_resume=True):
         bottomMargin=40
     )
     
-    styles = getSampleStyleSheet()
-    custom_styles = {
-        'Header': ParagraphStyle(
-            name='Header',
-            parent=styles['Heading1'],
-            fontSize=16,
-            leading=20,
-            textColor=colors.HexColor("#2E5D9E"),
-            fontName='Helvetica-Bold',
-            alignment=TA_CENTER,
-            spaceAfter=12
-        ),
-        'SectionHeader': ParagraphStyle(
-            name='SectionHeader',
-            parent=styles['Heading2'],
-            fontSize=12,
-            leading=14,
-            textColor=colors.HexColor("#2E5D9E"),
-            fontName='Helvetica-Bold',
-            underlineWidth=1,
-            underlineColor=colors.HexColor("#2E5D9E"),
-            spaceAfter=6
-        ),
-        'JobTitle': ParagraphStyle(
-            name='JobTitle',
-            parent=styles['BodyText'],
-            fontSize=11,
-            leading=13,
-            fontName='Helvetica-Bold',
-            spaceAfter=2
-        ),
-        'Company': ParagraphStyle(
-            name='Company',
-            parent=styles['BodyText'],
-            fontSize=10,
-            leading=12,
-            textColor=colors.HexColor("#555555"),
-            fontName='Helvetica-Oblique',
-            spaceAfter=4
-        ),
-        'BulletPoint': ParagraphStyle(
-            name='BulletPoint',
-            parent=styles['BodyText'],
-            fontSize=10,
-            leading=12,
-            leftIndent=10,
-            spaceAfter=4,
-            bulletFontName='Helvetica',
-            bulletFontSize=10
-        ),
-        'CoverBody': ParagraphStyle(
-            name='CoverBody',
-            parent=styles['BodyText'],
-            fontSize=11,
-            leading=14,
-            spaceAfter=12
-        ),
-        'SkillCategory': ParagraphStyle(
-            name='SkillCategory',
-            parent=styles['BodyText'],
-            fontSize=10,
-            leading=12,
-            fontName='Helvetica-Bold',
-            textColor=colors.HexColor("#2E5D9E"),
-            spaceAfter=4
-        )
-    }
-    for style_name, style in custom_styles.items():
-        styles.add(style)
+    styles = pdf_styles()
     
     elements = []
     
-    if is_resume:
-        if 'contact_info' in resume_data and 'name' in resume_data['contact_info'] and resume_data['contact_info']['name']:
-            elements.append(Paragraph(resume_data['contact_info']['name'].upper(), styles['Header']))
-            
-            contact_parts = []
-            if 'email' in resume_data['contact_info'] and resume_data['contact_info']['email']:
-                contact_parts.append(f"✉ {resume_data['contact_info']['email']}")
-            if 'phone' in resume_data['contact_info'] and resume_data['contact_info']['phone']:
-                contact_parts.append(f"📞 {resume_data['contact_info']['phone']}")
-            if 'location' in resume_data['contact_info'] and resume_data['contact_info']['location']:
-                contact_parts.append(f"📍 {resume_data['contact_info']['location']}")
-            if 'linkedin' in resume_data['contact_info'] and resume_data['contact_info']['linkedin']:
-                contact_parts.append(f"🔗 {resume_data['contact_info']['linkedin']}")
-            
-            if contact_parts:
-                elements.append(Paragraph(" | ".join(contact_parts), styles['BodyText']))
-                elements.append(Spacer(1, 12))
+    if 'contact_info' in st.session_state.resume_data and 'name' in st.session_state.resume_data['contact_info']:
+        elements.append(Paragraph(st.session_state.resume_data['contact_info']['name'], styles['Header']))
         
-        if 'professional_summary' in resume_data and resume_data['professional_summary']:
-            elements.append(Paragraph("PROFESSIONAL SUMMARY", styles['SectionHeader']))
-            elements.append(Paragraph(resume_data['professional_summary'], styles['BodyText']))
-            elements.append(Spacer(1, 12))
+        contact_parts = []
+        if 'email' in st.session_state.resume_data['contact_info'] and st.session_state.resume_data['contact_info']['email']:
+            contact_parts.append(st.session_state.resume_data['contact_info']['email'])
+        if 'phone' in st.session_state.resume_data['contact_info'] and st.session_state.resume_data['contact_info']['phone']:
+            contact_parts.append(st.session_state.resume_data['contact_info']['phone'])
+        if 'location' in st.session_state.resume_data['contact_info'] and st.session_state.resume_data['contact_info']['location']:
+            contact_parts.append(st.session_state.resume_data['contact_info']['location'])
         
-        if 'work_experience' in resume_data and resume_data['work_experience']:
-            elements.append(Paragraph("PROFESSIONAL EXPERIENCE", styles['SectionHeader']))
-            for exp in resume_data['work_experience']:
-                if 'job_title' in exp and exp['job_title']:
-                    elements.append(Paragraph(exp['job_title'], styles['JobTitle']))
-                
-                company_info = []
-                if 'company' in exp and exp['company']:
-                    company_info.append(f"<b>{exp['company']}</b>")
-                if 'dates' in exp and exp['dates']:
-                    company_info.append(exp['dates'])
-                if 'location' in exp and exp['location']:
-                    company_info.append(exp['location'])
-                
-                if company_info:
-                    elements.append(Paragraph(" | ".join(company_info), styles['Company']))
-                
-                if 'achievements' in exp and exp['achievements']:
-                    bullets = []
-                    for achievement in exp['achievements']:
-                        bullets.append(
-                            ListItem(
-                                Paragraph(achievement, styles['BulletPoint']),
-                                bulletColor=colors.HexColor("#2E5D9E"),
-                                value="•",
-                                leftIndent=15
-                            )
-                        )
-                    
-                    elements.append(ListFlowable(bullets, bulletType='bullet', leftIndent=20))
-                elements.append(Spacer(1, 8))
+        if contact_parts:
+            elements.append(Paragraph(" | ".join(contact_parts), styles['BodyText']))
         
-        if 'education' in resume_data and resume_data['education']:
-            elements.append(Paragraph("EDUCATION", styles['SectionHeader']))
-            for edu in resume_data['education']:
-                edu_info = []
-                if 'degree' in edu and edu['degree']:
-                    edu_info.append(f"<b>{edu['degree']}</b>")
-                if 'institution' in edu and edu['institution']:
-                    edu_info.append(edu['institution'])
-                if 'year' in edu and edu['year']:
-                    edu_info.append(f"({edu['year']})")
-                if 'honors' in edu and edu['honors']:
-                    edu_info.append(f"<i>{edu['honors']}</i>")
-                
-                if edu_info:
-                    elements.append(Paragraph(", ".join(edu_info), styles['BodyText']))
-                    elements.append(Spacer(1, 4))
-            elements.append(Spacer(1, 8))
+        elements.append(Paragraph(datetime.now().strftime("%B %d, %Y"), styles['BodyText']))
+        elements.append(Spacer(1, 24))
+    
+    if hasattr(st.session_state, 'company_name') and st.session_state.company_name:
+        elements.append(Paragraph(st.session_state.company_name, styles['BodyText']))
+        elements.append(Paragraph("[Company Address]", styles['BodyText']))
+        elements.append(Spacer(1, 12))
+    
+    elements.append(Paragraph("Dear Hiring Manager,", styles['BodyText']))
+    elements.append(Spacer(1, 12))
+    
+    if isinstance(resume_data, str):
+        paragraphs = [p.strip() for p in resume_data.split('\n\n') if p.strip()]
+        closing_added = False
         
-
-        if 'skills' in resume_data and resume_data['skills']:
-            elements.append(Paragraph("SKILLS", styles['SectionHeader']))
-            
-            if isinstance(resume_data['skills'], dict):
-                for category, skills in resume_data['skills'].items():
-                    if skills: 
-                        elements.append(Paragraph(category.upper(), styles['SkillCategory']))
-                        elements.append(Paragraph(", ".join(skills), styles['BodyText']))
-                        elements.append(Spacer(1, 4))
-            else:
-                skill_data = []
-                for i in range(0, len(resume_data['skills']), 3):
-                    row = resume_data['skills'][i:i+3]
-                    while len(row) < 3:
-                        row.append("")
-                    skill_data.append(row)
-                
-                if skill_data:
-                    skill_table = Table(skill_data, colWidths=[doc.width/3]*3)
-                    skill_table.setStyle(TableStyle([
-                        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-                        ('LEFTPADDING', (0,0), (-1,-1), 0),
-                        ('RIGHTPADDING', (0,0), (-1,-1), 0),
-                        ('FONTSIZE', (0,0), (-1,-1), 9),
-                        ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
-                        ('BOTTOMPADDING', (0,0), (-1,-1), 2),
-                    ]))
-                    elements.append(skill_table)
+        for para in paragraphs:
+            if para.lower().startswith('sincerely'):
+                continue
             
+            elements.append(Paragraph(para, styles['CoverBody']))
             elements.append(Spacer(1, 12))
         
-
-        if 'projects' in resume_data and resume_data['projects']:
-            elements.append(Paragraph("PROJECTS", styles['SectionHeader']))
-            for proj in resume_data['projects']:
-                if 'name' in proj and proj['name']:
-                    elements.append(Paragraph(f"<b>{proj['name']}</b>", styles['JobTitle']))
-                if 'description' in proj and proj['description']:
-                    elements.append(Paragraph(proj['description'], styles['BodyText']))
-                if 'technologies' in proj and proj['technologies']:
-                    elements.append(Paragraph(f"<font color='#555555'><i>Technologies: {', '.join(proj['technologies'])}</i></font>", styles['BodyText']))
-                elements.append(Spacer(1, 8))
-
-        if 'certifications' in resume_data and resume_data['certifications']:
-            elements.append(Paragraph("CERTIFICATIONS", styles['SectionHeader']))
-            for cert in resume_data['certifications']:
-                elements.append(Paragraph(f"• {cert}", styles['BodyText']))
-            elements.append(Spacer(1, 12))
-    
-    else:
+        elements.append(Spacer(1, 24))
+        elements.append(Paragraph("Sincerely,", styles['BodyText']))
         if 'contact_info' in st.session_state.resume_data and 'name' in st.session_state.resume_data['contact_info']:
-            elements.append(Paragraph(st.session_state.resume_data['contact_info']['name'], styles['Header']))
-            
-            contact_parts = []
-            if 'email' in st.session_state.resume_data['contact_info'] and st.session_state.resume_data['contact_info']['email']:
-                contact_parts.append(st.session_state.resume_data['contact_info']['email'])
-            if 'phone' in st.session_state.resume_data['contact_info'] and st.session_state.resume_data['contact_info']['phone']:
-                contact_parts.append(st.session_state.resume_data['contact_info']['phone'])
-            if 'location' in st.session_state.resume_data['contact_info'] and st.session_state.resume_data['contact_info']['location']:
-                contact_parts.append(st.session_state.resume_data['contact_info']['location'])
-            
-            if contact_parts:
-                elements.append(Paragraph(" | ".join(contact_parts), styles['BodyText']))
-            
-            elements.append(Paragraph(datetime.now().strftime("%B %d, %Y"), styles['BodyText']))
-            elements.append(Spacer(1, 24))
-        
-        if hasattr(st.session_state, 'company_name') and st.session_state.company_name:
-            elements.append(Paragraph(st.session_state.company_name, styles['BodyText']))
-            elements.append(Paragraph("[Company Address]", styles['BodyText']))
-            elements.append(Spacer(1, 12))
-        
-        elements.append(Paragraph("Dear Hiring Manager,", styles['BodyText']))
-        elements.append(Spacer(1, 12))
-        
-        if isinstance(resume_data, str):
-            paragraphs = [p.strip() for p in resume_data.split('\n\n') if p.strip()]
-            closing_added = False
-            
-            for para in paragraphs:
-                if para.lower().startswith('sincerely'):
-                    continue
-                
-                elements.append(Paragraph(para, styles['CoverBody']))
-                elements.append(Spacer(1, 12))
-            
-            elements.append(Spacer(1, 24))
-            elements.append(Paragraph("Sincerely,", styles['BodyText']))
-            if 'contact_info' in st.session_state.resume_data and 'name' in st.session_state.resume_data['contact_info']:
-                elements.append(Paragraph(st.session_state.resume_data['contact_info']['name'], styles['BodyText']))
-    
+            elements.append(Paragraph(st.session_state.resume_data['contact_info']['name'], styles['BodyText']))
+
     elements.append(Spacer(1, 20))
     elements.append(Paragraph("<font color='#888888' size=8>Generated by AI Resume Optimizer</font>", styles['Normal']))
     
@@ -604,61 +2073,1024 @@ def create_pdf_document(resume_data, is_resume=True):
     buffer.seek(0)
     return buffer
 
-def create_docx_cover_letter(cover_letter_text):
-    """Create a DOCX document for the cover letter"""
+DOCX_DOCUMENT_PART = 'word/document.xml'
+DOCX_INVALID_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Paragraph XML filled in per cover letter; sizes are in half-points
+DOCX_COVER_PARAGRAPHS = {
+    'name': '<w:p><w:pPr><w:jc w:val="center"/><w:spacing w:after="0"/></w:pPr>'
+            '<w:r><w:rPr><w:b/><w:color w:val="2E5D9E"/><w:sz w:val="32"/></w:rPr><w:t xml:space="preserve">{}</w:t></w:r></w:p>',
+    'contact': '<w:p><w:pPr><w:pBdr><w:bottom w:val="single" w:sz="6" w:space="4" w:color="2E5D9E"/></w:pBdr><w:jc w:val="center"/></w:pPr>'
+               '<w:r><w:rPr><w:color w:val="555555"/><w:sz w:val="20"/></w:rPr><w:t xml:space="preserve">{}</w:t></w:r></w:p>',
+    'body': '<w:p><w:r><w:t xml:space="preserve">{}</w:t></w:r></w:p>'
+}
+
+@st.cache_resource
+def _cover_letter_docx_template():
+    """Styled cover letter package built once: a zip of every part but the body, and the body's XML around the paragraphs"""
     doc = Document()
     style = doc.styles['Normal']
     font = style.font
     font.name = 'Calibri'
     font.size = Pt(11)
+    buffer = BytesIO()
+    doc.save(buffer)
+
+    static = BytesIO()
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(static, 'w', zipfile.ZIP_DEFLATED) as package:
+        for info in source.infolist():
+            if info.filename != DOCX_DOCUMENT_PART:
+                package.writestr(info.filename, source.read(info))
+        document = source.read(DOCX_DOCUMENT_PART).decode('utf-8')
+    body_end = document.index('<w:sectPr')
+    return {'package': static.getvalue(), 'head': document[:body_end], 'tail': document[body_end:]}
+
+def docx_text(text):
+    return html.escape(DOCX_INVALID_XML_CHARS.sub('', text), quote=False)
+
+def create_docx_cover_letter(cover_letter_text, contact_info=None, date=None):
+    """Create a DOCX document for the cover letter, with a letterhead when contact_info is given.
+
+    Only word/document.xml is written per letter; the styled template parts are compressed once and copied as is.
+    """
+    template = _cover_letter_docx_template()
+    paragraphs = []
+    if contact_info and contact_info.get('name'):
+        paragraphs.append(DOCX_COVER_PARAGRAPHS['name'].format(docx_text(contact_info['name'])))
+        contact_parts = [contact_info[key] for key in ('email', 'phone', 'location', 'linkedin') if contact_info.get(key)]
+        paragraphs.append(DOCX_COVER_PARAGRAPHS['contact'].format(docx_text(" | ".join(contact_parts))))
+        paragraphs.append(DOCX_COVER_PARAGRAPHS['body'].format(docx_text(date or datetime.now().strftime("%B %d, %Y"))))
     for paragraph in cover_letter_text.split('\n'):
         if paragraph.strip():
-            doc.add_paragraph(paragraph)
+            paragraphs.append(DOCX_COVER_PARAGRAPHS['body'].format(docx_text(paragraph)))
+
+    buffer = BytesIO(template['package'])
+    buffer.seek(0, 2)
+    with zipfile.ZipFile(buffer, 'a', zipfile.ZIP_DEFLATED) as package:
+        package.writestr(DOCX_DOCUMENT_PART, template['head'] + "".join(paragraphs) + template['tail'])
+    buffer.seek(0)
+    return buffer
+
+MARKDOWN_LINE = re.compile(
+    r'(?P<rule>(?:-{3,}|\*{3,}|_{3,}))$'
+    r'|(?P<heading>#{1,6})\s+(?P<heading_text>.*)'
+    r'|[-*+]\s+(?P<bullet>.*)'
+    r'|(?P<number>\d+)[.)]\s+(?P<number_text>.*)'
+    r'|(?P<row>\|.*)'
+)
+MARKDOWN_TABLE_SEPARATOR = re.compile(r'^:?-+:?$')
+# Code spans and runs of emphasis delimiters; markdown_runs pairs the delimiters
+MARKDOWN_INLINE_TOKEN = re.compile(r'`[^`]+`|\*+|_+')
+MARKDOWN_HEADING_STYLES = {1: 'Header', 2: 'SectionHeader'}
+EXPORT_CACHE_SIZE = 512
+
+def markdown_blocks(markdown):
+    """Yield (kind, level, content) blocks from report markdown in a single pass over its lines.
+
+    kind is heading, bullet, number, row, rule or paragraph; level is the heading depth, list
+    nesting or item number; row content is the list of cells. Wrapped lines join one paragraph.
+    """
+    paragraph = []
+    for line in markdown.splitlines():
+        stripped = line.strip()
+        match = MARKDOWN_LINE.match(stripped) if stripped else None
+        if stripped and match is None:
+            paragraph.append(stripped)
+            continue
+        if paragraph:
+            yield 'paragraph', 0, " ".join(paragraph)
+            paragraph = []
+        if match is None:
+            continue
+        if match['rule']:
+            yield 'rule', 0, ""
+        elif match['heading']:
+            yield 'heading', len(match['heading']), match['heading_text'].strip('# ')
+        elif match['bullet'] is not None:
+            yield 'bullet', (len(line) - len(line.lstrip())) // 2, match['bullet']
+        elif match['number']:
+            yield 'number', int(match['number']), match['number_text']
+        else:
+            cells = [cell.strip() for cell in stripped.strip('|').split('|')]
+            if not all(MARKDOWN_TABLE_SEPARATOR.match(cell) for cell in cells):
+                yield 'row', 0, cells
+    if paragraph:
+        yield 'paragraph', 0, " ".join(paragraph)
+
+def markdown_runs(text):
+    """Split inline markdown into [(text, styles)] runs, styles a frozenset of 'bold', 'italic' and 'code'.
+
+    Emphasis delimiters are paired with a stack: a closer takes the nearest opener of the same character (two
+    characters for bold, one for italic), and openers left between them stay literal, as do unpaired delimiters.
+    Runs are flat, so overlapping markers like ***x*** or **a *b** c* never come out as crossed tags.
+    """
+    tokens, stack, position = [], [], 0
+    for match in MARKDOWN_INLINE_TOKEN.finditer(text):
+        if match.start() > position:
+            tokens.append(text[position:match.start()])
+        position = match.end()
+        token = match[0]
+        if token[0] == '`':
+            tokens.append({'code': token[1:-1]})
+            continue
+        before = text[match.start() - 1] if match.start() else " "
+        after = text[match.end()] if match.end() < len(text) else " "
+        can_open, can_close = not after.isspace(), not before.isspace()
+        if token[0] == '_':
+            # No intraword emphasis with underscores: snake_case stays literal
+            can_open, can_close = can_open and not before.isalnum(), can_close and not after.isalnum()
+        run = {'char': token[0], 'count': len(token), 'opens': [], 'closes': []}
+        tokens.append(run)
+        while can_close and run['count']:
+            for depth in range(len(stack) - 1, -1, -1):
+                if stack[depth]['char'] == run['char']:
+                    break
+            else:
+                break
+            opener = stack[depth]
+            del stack[depth + 1:]
+            used = 2 if opener['count'] >= 2 and run['count'] >= 2 else 1
+            style = 'bold' if used == 2 else 'italic'
+            opener['opens'].append(style)
+            run['closes'].append(style)
+            opener['count'] -= used
+            run['count'] -= used
+            if not opener['count']:
+                stack.pop()
+        if can_open and run['count']:
+            stack.append(run)
+    if position < len(text):
+        tokens.append(text[position:])
+
+    runs, active = [], {'bold': 0, 'italic': 0}
+
+    def emit(piece, code=False):
+        styles = frozenset([style for style, depth in active.items() if depth] + (['code'] if code else []))
+        if runs and runs[-1][1] == styles:
+            runs[-1] = (runs[-1][0] + piece, styles)
+        elif piece:
+            runs.append((piece, styles))
+
+    for token in tokens:
+        if isinstance(token, str):
+            emit(token)
+        elif 'code' in token:
+            emit(token['code'], code=True)
+        else:
+            for style in token['closes']:
+                active[style] -= 1
+            # Whatever was not paired stays literal; an opener's markers sit next to the text it opens
+            emit(token['char'] * token['count'])
+            for style in token['opens']:
+                active[style] += 1
+    return runs
+
+def markdown_inline(text):
+    """Convert inline markdown (bold, italic, code) to ReportLab paragraph markup"""
+    parts = []
+    for piece, styles in markdown_runs(text):
+        markup = html.escape(piece, quote=False)
+        if 'code' in styles:
+            markup = f"<font face='Courier'>{markup}</font>"
+        if 'italic' in styles:
+            markup = f"<i>{markup}</i>"
+        if 'bold' in styles:
+            markup = f"<b>{markup}</b>"
+        parts.append(markup)
+    return "".join(parts)
+
+def markdown_flowables(markdown, styles, width):
+    """Stream the flowables for report markdown, grouping consecutive list items and table rows"""
+    for kind, blocks in itertools.groupby(markdown_blocks(markdown), key=lambda block: block[0]):
+        if kind in ('bullet', 'number'):
+            items = [
+                ListItem(
+                    Paragraph(markdown_inline(text), styles['BulletPoint']),
+                    bulletColor=colors.HexColor("#2E5D9E"),
+                    value=level if kind == 'number' else "•",
+                    leftIndent=15 + (10 * level if kind == 'bullet' else 0)
+                )
+                for _, level, text in blocks
+            ]
+            yield ListFlowable(items, bulletType='1' if kind == 'number' else 'bullet', leftIndent=20)
+        elif kind == 'row':
+            rows = [cells for _, _, cells in blocks]
+            columns = max(len(cells) for cells in rows)
+            table = Table(
+                [[Paragraph(markdown_inline(cell), styles['BodyText']) for cell in cells] + [""] * (columns - len(cells)) for cells in rows],
+                colWidths=[width / columns] * columns,
+                repeatRows=1
+            )
+            table.setStyle(TableStyle([
+                ('VALIGN', (0,0), (-1,-1), 'TOP'),
+                ('GRID', (0,0), (-1,-1), 0.5, colors.HexColor("#CCCCCC")),
+                ('BACKGROUND', (0,0), (-1,0), colors.HexColor("#EEF2F8")),
+            ]))
+            yield table
+            yield Spacer(1, 8)
+        else:
+            for _, level, text in blocks:
+                if kind == 'rule':
+                    yield HRFlowable(width="100%", color=colors.HexColor("#CCCCCC"), spaceBefore=4, spaceAfter=8)
+                elif kind == 'heading':
+                    yield Paragraph(markdown_inline(text), styles[MARKDOWN_HEADING_STYLES.get(level, 'JobTitle')])
+                else:
+                    yield Paragraph(markdown_inline(text), styles['BodyText'])
+
+def create_markdown_pdf(markdown, title):
+    """Create a PDF of a markdown report (ATS analysis, interview prep) in the resume's styles"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        rightMargin=40,
+        leftMargin=40,
+        topMargin=40,
+        bottomMargin=40,
+        title=title
+    )
+    styles = pdf_styles()
+    elements = [Paragraph(html.escape(title), styles['Header'])]
+    elements.extend(markdown_flowables(markdown, styles, doc.width))
+    elements.append(Spacer(1, 20))
+    elements.append(Paragraph("<font color='#888888' size=8>Generated by AI Resume Optimizer</font>", styles['Normal']))
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+def add_markdown_runs(paragraph, text):
+    for piece, styles in markdown_runs(text):
+        run = paragraph.add_run(piece)
+        if 'bold' in styles:
+            run.bold = True
+        if 'italic' in styles:
+            run.italic = True
+        if 'code' in styles:
+            run.font.name = 'Courier New'
+
+def create_markdown_docx(markdown, title):
+    """Create a DOCX of a markdown report, using Word's heading, list and table styles"""
+    doc = Document()
+    style = doc.styles['Normal']
+    font = style.font
+    font.name = 'Calibri'
+    font.size = Pt(11)
+    doc.add_heading(title, level=0)
+    for kind, blocks in itertools.groupby(markdown_blocks(markdown), key=lambda block: block[0]):
+        if kind == 'row':
+            rows = [cells for _, _, cells in blocks]
+            table = doc.add_table(rows=len(rows), cols=max(len(cells) for cells in rows), style='Table Grid')
+            for row, cells in zip(table.rows, rows):
+                for cell, text in zip(row.cells, cells):
+                    add_markdown_runs(cell.paragraphs[0], text)
+            continue
+        for _, level, text in blocks:
+            if kind == 'heading':
+                add_markdown_runs(doc.add_heading(level=min(level, 3)), text)
+            elif kind == 'bullet':
+                add_markdown_runs(doc.add_paragraph(style='List Bullet 2' if level else 'List Bullet'), text)
+            elif kind == 'number':
+                # Numbered inline: Word's List Number style would continue counting across sections
+                paragraph = doc.add_paragraph()
+                paragraph.paragraph_format.left_indent = Pt(18)
+                paragraph.paragraph_format.first_line_indent = Pt(-18)
+                add_markdown_runs(paragraph, f"{level}. {text}")
+            elif kind == 'paragraph':
+                add_markdown_runs(doc.add_paragraph(), text)
     buffer = BytesIO()
     doc.save(buffer)
     buffer.seek(0)
     return buffer
 
-def optimize_resume_with_ai(resume_data, job_description, target_role):
-    if not st.session_state.model:
-        return None, "AI model not initialized. Please enter a valid Google API Key in the sidebar."
-        
-    prompt = f"""Transform this resume data into a professionally optimized resume for the target role. 
-Rephrase all content to be more impactful and achievement-oriented while maintaining accuracy.
+@dataclass(frozen=True, slots=True)
+class ArtifactHandle:
+    """Reference to a blob in the artifact store; kind is 'bytes', 'text' or 'json' and says how to decode it"""
+    digest: str
+    size: int
+    kind: str = 'bytes'
+
+@st.cache_resource
+def _artifact_store():
+    """Content-addressed blobs shared by every session: files under ARTIFACT_STORE_DIR, the recently used ones kept in memory.
+
+    blobs maps each digest to its size and owners (session ids, or 'exports'); a blob is deleted once no owner is left.
+    sessions maps each session id to the time it last used its artifacts. File I/O for a blob happens under one of
+    file_locks, picked by digest, never under the store lock; take the file lock first when holding both.
+
+    Each process writes under its own subdirectory of ARTIFACT_STORE_DIR, named by pid, since handles only live in
+    session state: the subdirectories of processes that are no longer running are orphans and are deleted here, while
+    those of other live processes sharing the directory are left alone.
+    """
+    remove_orphan_artifacts()
+    return {'dir': os.path.join(ARTIFACT_STORE_DIR, f"{os.getpid()}-{os.urandom(4).hex()}"), 'blobs': {},
+            'memory': OrderedDict(), 'memory_bytes': 0, 'sessions': {}, 'lock': threading.Lock(),
+            'file_locks': [threading.Lock() for _ in range(64)]}
+
+ARTIFACT_PROCESS_DIR_NAME = re.compile(r'^(\d+)-[0-9a-f]{8}$')
+ARTIFACT_FILE_NAME = re.compile(r'^[0-9a-f]{64}(?:\.tmp)?$')
+
+def process_is_running(pid):
+    """Whether pid names a live process on this host; on Windows signal 0 would be a Ctrl+C, so assume it does"""
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+def remove_orphan_artifacts():
+    """Delete blob files left by processes that are no longer running, touching nothing that is not named like one;
+    returns how many"""
+    removed = 0
+    for process_dir in os.listdir(ARTIFACT_STORE_DIR) if os.path.isdir(ARTIFACT_STORE_DIR) else ():
+        process_path = os.path.join(ARTIFACT_STORE_DIR, process_dir)
+        owner = ARTIFACT_PROCESS_DIR_NAME.match(process_dir)
+        # This process's own earlier directories may still back handles in live sessions after a cache clear
+        if (not owner or not os.path.isdir(process_path) or int(owner.group(1)) == os.getpid()
+                or process_is_running(int(owner.group(1)))):
+            continue
+        for shard in os.listdir(process_path):
+            shard_path = os.path.join(process_path, shard)
+            if not re.fullmatch(r'[0-9a-f]{2}', shard) or not os.path.isdir(shard_path):
+                continue
+            for name in os.listdir(shard_path):
+                if ARTIFACT_FILE_NAME.match(name) and name.startswith(shard):
+                    try:
+                        os.remove(os.path.join(shard_path, name))
+                        removed += 1
+                    except OSError:
+                        pass
+            try:
+                os.rmdir(shard_path)
+            except OSError:
+                pass
+        try:
+            os.rmdir(process_path)
+        except OSError:
+            pass
+    return removed
+
+def artifact_path(digest):
+    return os.path.join(_artifact_store()['dir'], digest[:2], digest)
+
+def _artifact_file_lock(store, digest):
+    return store['file_locks'][int(digest[:2], 16) % len(store['file_locks'])]
+
+def _keep_in_memory(store, digest, data):
+    """Add a blob to the in-memory LRU, spilling the least recently used past ARTIFACT_MEMORY_MB; call with the lock held"""
+    if digest in store['memory']:
+        store['memory'].move_to_end(digest)
+        return
+    store['memory'][digest] = data
+    store['memory_bytes'] += len(data)
+    while store['memory_bytes'] > ARTIFACT_MEMORY_MB * 1024 * 1024 and len(store['memory']) > 1:
+        _, spilled = store['memory'].popitem(last=False)
+        store['memory_bytes'] -= len(spilled)
+
+def put_artifact(data, owner, kind='bytes'):
+    """Store data for owner and return its handle; identical content is written to disk only once"""
+    digest = hashlib.sha256(data).hexdigest()
+    store = _artifact_store()
+    with _artifact_file_lock(store, digest):
+        with store['lock']:
+            blob = store['blobs'].get(digest)
+            if blob is not None:
+                blob['owners'].add(owner)
+                _keep_in_memory(store, digest, data)
+                return ArtifactHandle(digest, len(data), kind)
+        path = artifact_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+        with store['lock']:
+            store['blobs'][digest] = {'size': len(data), 'owners': {owner}}
+            _keep_in_memory(store, digest, data)
+    return ArtifactHandle(digest, len(data), kind)
+
+def read_artifact(handle):
+    """Return a blob's bytes from memory, or from disk when it was spilled; raises FileNotFoundError once it is deleted"""
+    store = _artifact_store()
+    with store['lock']:
+        data = store['memory'].get(handle.digest)
+        if data is not None:
+            store['memory'].move_to_end(handle.digest)
+            return data
+    with open(artifact_path(handle.digest), 'rb') as f:
+        data = f.read()
+    with store['lock']:
+        if handle.digest in store['blobs']:
+            _keep_in_memory(store, handle.digest, data)
+    return data
+
+def release_artifact(digest, owner):
+    """Drop owner's claim on a blob, deleting it from memory and disk once no owner is left"""
+    store = _artifact_store()
+    with _artifact_file_lock(store, digest):
+        with store['lock']:
+            blob = store['blobs'].get(digest)
+            if blob is None:
+                return
+            blob['owners'].discard(owner)
+            if blob['owners']:
+                return
+            del store['blobs'][digest]
+            data = store['memory'].pop(digest, None)
+            if data is not None:
+                store['memory_bytes'] -= len(data)
+        try:
+            os.remove(artifact_path(digest))
+        except FileNotFoundError:
+            pass
+
+def evict_idle_artifacts(store, is_active_session, is_known_session):
+    """Release the blobs of sessions that are gone and spill those of idle or disconnected sessions out of memory.
+
+    A session is gone once Streamlit no longer keeps it for reconnecting, or once it has been disconnected for longer
+    than ARTIFACT_IDLE_SECONDS; a dropped connection alone keeps its artifacts on disk. Takes the store itself because
+    it runs on the event loop thread, outside any script run. Returns (released, spilled).
+    """
+    now = time.time()
+    with store['lock']:
+        inactive = {session_id for session_id in store['sessions'] if not is_active_session(session_id)}
+        closed = {session_id for session_id in inactive
+                  if not is_known_session(session_id) or now - store['sessions'][session_id] > ARTIFACT_IDLE_SECONDS}
+        idle = {session_id for session_id, last_used in store['sessions'].items()
+                if session_id not in closed and (session_id in inactive or now - last_used > ARTIFACT_IDLE_SECONDS)}
+        for session_id in closed:
+            del store['sessions'][session_id]
+        claims = [(digest, owner) for digest, blob in store['blobs'].items() for owner in blob['owners'] & closed]
+        spilled = 0
+        for digest, blob in store['blobs'].items():
+            if digest in store['memory'] and blob['owners'] <= idle | closed:
+                store['memory_bytes'] -= len(store['memory'].pop(digest))
+                spilled += 1
+    for digest, owner in claims:
+        release_artifact(digest, owner)
+    return len(claims), spilled
+
+def touch_session_artifacts(session_id):
+    store = _artifact_store()
+    with store['lock']:
+        store['sessions'][session_id] = time.time()
+
+def session_artifact(name):
+    """The session's value of a generated artifact such as 'cover_letter', loaded through its handle"""
+    handle = st.session_state.artifacts.get(name)
+    if handle is None:
+        return SESSION_ARTIFACT_DEFAULTS[name]
+    touch_session_artifacts(current_session_id())
+    try:
+        data = read_artifact(handle)
+    except FileNotFoundError:
+        del st.session_state.artifacts[name]
+        return SESSION_ARTIFACT_DEFAULTS[name]
+    return json.loads(data) if handle.kind == 'json' else data.decode('utf-8')
+
+def set_session_artifact(name, value):
+    """Store a generated artifact in the artifact store and keep only its handle in session state"""
+    session_id = current_session_id()
+    # The event loop's reaper evicts closed and idle sessions' artifacts, so make sure it is running
+    _async_runtime()
+    artifacts = st.session_state.artifacts
+    previous = artifacts.pop(name, None)
+    if value != SESSION_ARTIFACT_DEFAULTS[name]:
+        kind = 'text' if isinstance(value, str) else 'json'
+        artifacts[name] = put_artifact(value.encode('utf-8') if kind == 'text' else json.dumps(value).encode('utf-8'), session_id, kind)
+        touch_session_artifacts(session_id)
+    if previous is not None and all(handle.digest != previous.digest for handle in artifacts.values()):
+        release_artifact(previous.digest, session_id)
+
+def release_session_artifacts():
+    session_id = current_session_id()
+    for handle in st.session_state.get('artifacts', {}).values():
+        release_artifact(handle.digest, session_id)
+    st.session_state.artifacts = {}
+
+def approx_size(value):
+    """Rough deep size in bytes of plain data: dicts, sequences, strings, bytes and scalars"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_size(key) + approx_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset, deque)):
+        size += sum(approx_size(item) for item in value)
+    return size
+
+def artifact_memory_report():
+    """Per-owner artifact bytes, split into resident in memory and spilled to disk, with the idle time of each session"""
+    store = _artifact_store()
+    now = time.time()
+    with store['lock']:
+        owners = {}
+        for digest, blob in store['blobs'].items():
+            for owner in blob['owners']:
+                row = owners.setdefault(owner, {'blobs': 0, 'bytes': 0, 'in_memory': 0})
+                row['blobs'] += 1
+                row['bytes'] += blob['size']
+                row['in_memory'] += blob['size'] if digest in store['memory'] else 0
+        sessions = dict(store['sessions'])
+    return [
+        {'owner': owner if owner == 'exports' or owner is None else owner[:8], **row,
+         'idle_s': round(now - sessions[owner]) if owner in sessions else None}
+        for owner, row in sorted(owners.items(), key=lambda item: -item[1]['bytes'])
+    ]
+
+def artifact_store_totals():
+    store = _artifact_store()
+    with store['lock']:
+        return {'blobs': len(store['blobs']), 'disk_bytes': sum(blob['size'] for blob in store['blobs'].values()),
+                'memory_bytes': store['memory_bytes'], 'sessions': len(store['sessions'])}
+
+@st.cache_resource
+def _export_cache():
+    """Handles of rendered report files shared by every session, keyed by format and content hash.
+
+    info holds small render details (page count, scale, timings) for some keys and is evicted with them.
+    """
+    return {'files': OrderedDict(), 'info': {}, 'lock': threading.Lock()}
+
+def cached_export(key, render):
+    """Return the file bytes cached under key, calling render() for them on a miss; the bytes live in the artifact store"""
+    cache = _export_cache()
+    with cache['lock']:
+        handle = cache['files'].get(key)
+        if handle is not None:
+            cache['files'].move_to_end(key)
+    if handle is not None:
+        try:
+            return read_artifact(handle)
+        except FileNotFoundError:
+            pass
+    data = render()
+    handle = put_artifact(data, 'exports')
+    with cache['lock']:
+        cache['files'][key] = handle
+        evicted = []
+        while len(cache['files']) > EXPORT_CACHE_SIZE:
+            evicted_key, evicted_handle = cache['files'].popitem(last=False)
+            cache['info'].pop(evicted_key, None)
+            evicted.append(evicted_handle)
+        kept = {kept_handle.digest for kept_handle in cache['files'].values()}
+    for old in evicted:
+        if old.digest not in kept:
+            release_artifact(old.digest, 'exports')
+    return data
+
+def export_resume_pdf(resume_data, template='classic', page_size='letter', fit=False, job_description=''):
+    """Resume PDF bytes and render info, rendered once per distinct resume and layout instead of on every rerun.
+
+    The info dict (pages, fit, what fitting changed, timings) is None when the bytes came back from disk after the
+    info was evicted. The job description only matters, and is only part of the key, when fitting.
+    """
+    fit = bool(fit or RESUME_TEMPLATES[template]['fit'])
+    key = ('resume_pdf', template, page_size, fit, prompt_hash(json.dumps(resume_data, sort_keys=True)),
+           prompt_hash(job_description) if fit else None)
+    cache = _export_cache()
+
+    def render():
+        pdf = render_resume_pdf(resume_data, template, page_size, fit, job_description)
+        with cache['lock']:
+            cache['info'][key] = {'pages': pdf.pages, 'fit': fit, 'changes': describe_fit(pdf.scale, pdf.spacing, pdf.dropped), **pdf.timings}
+        return pdf.data
+
+    data = cached_export(key, render)
+    with cache['lock']:
+        return data, cache['info'].get(key)
+
+def resume_pdf_caption(info):
+    """One line describing a rendered resume PDF for the download area, so nobody has to download it to count pages"""
+    if not info:
+        return ""
+    if info['fit'] and info['pages'] == 1:
+        summary = "✅ Fits on one page" + (f" ({info['changes']})" if info['changes'] else "")
+    elif info['fit'] and info['changes']:
+        summary = f"⚠️ {info['pages']} pages: too long for one page even with {info['changes']}"
+    elif info['fit']:
+        summary = f"⚠️ {info['pages']} pages: too long for one page, and fit-to-page found nothing to tighten or drop"
+    else:
+        summary = f"{info['pages']} page" + ("s" if info['pages'] != 1 else "")
+    timing = f"measured in {info['measure_ms'] + info['search_ms']:.0f} ms" + (f" ({info['passes']} passes)" if info['passes'] else "")
+    return f"{summary} · {timing}, built in {info['build_ms']:.0f} ms"
+
+def resume_layout_controls():
+    """Template, paper size and fit-to-page selectors shared by both resume download areas"""
+    st.selectbox(
+        "Resume Template",
+        options=list(RESUME_TEMPLATES),
+        format_func=lambda template: RESUME_TEMPLATES[template]['label'],
+        key="resume_template"
+    )
+    st.radio("Page Size", options=list(PDF_PAGE_SIZES), key="resume_page_size", horizontal=True)
+    st.checkbox(
+        "Fit to one page",
+        key="resume_fit",
+        disabled=RESUME_TEMPLATES[st.session_state.resume_template]['fit'],
+        help="Tightens spacing, shrinks the type and drops old or weak bullets, projects and certifications as needed "
+             "to fit one page, choosing by measuring rather than rendering; the compact template always does this"
+    )
+
+def optimized_resume_download(optimized_resume, label, key=None):
+    data, info = export_resume_pdf(
+        optimized_resume,
+        st.session_state.resume_template,
+        st.session_state.resume_page_size,
+        st.session_state.resume_fit,
+        st.session_state.job_description
+    )
+    st.download_button(
+        label=label,
+        data=data,
+        file_name=f"optimized_resume_{optimized_resume['contact_info']['name'].replace(' ', '_')}.pdf",
+        mime="application/pdf",
+        use_container_width=True,
+        key=key
+    )
+    caption = resume_pdf_caption(info)
+    if caption:
+        st.caption(caption)
+
+def export_markdown_report(markdown, title, kind):
+    """Return a markdown report rendered as 'pdf' or 'docx' bytes, rendering each distinct report only once"""
+    render = create_markdown_pdf if kind == 'pdf' else create_markdown_docx
+    return cached_export((kind, prompt_hash(title + "\n" + markdown)), lambda: render(markdown, title).getvalue())
+
+def export_cover_letter_docx(cover_letter_text, contact_info):
+    """Cover letter DOCX bytes with letterhead, generated once per distinct letter, contact details and date"""
+    date = datetime.now().strftime("%B %d, %Y")
+    key = ('cover_letter_docx', prompt_hash(json.dumps([cover_letter_text, contact_info, date], sort_keys=True)))
+    return cached_export(key, lambda: create_docx_cover_letter(cover_letter_text, contact_info, date).getvalue())
+
+PROMPT_TEMPLATE_DEFAULTS = {
+    'optimize': {'budget': 24000, 'truncate': 'job_description', 'text': """Transform this resume data into a professionally optimized resume for the target role. 
+Rephrase all content to be more impactful and achievement-oriented while maintaining accuracy.
+
+RESUME DATA:
+{resume_json}
+
+TARGET ROLE:
+{target_role}
+
+JOB DESCRIPTION:
+{job_description}
+
+INSTRUCTIONS:
+1. Rephrase all content to be more professional and impactful
+2. Focus on quantifiable achievements for work experience
+3. Use industry-standard terminology
+4. Maintain the original structure and information
+5. Output should be valid JSON with the same structure as input
+6. Do not add any new sections or information that wasn't in the original
+7. Do not include the job title in the resume content
+
+OUTPUT ONLY THE JSON:"""},
+    'rewrite_bullets': {'budget': 24000, 'truncate': 'job_description', 'text': """Rewrite the numbered WEAK RESUME BULLETS so each one is specific, achievement-oriented and relevant to the target role.
+
+TARGET ROLE:
+{target_role}
+
+JOB DESCRIPTION:
+{job_description}
+
+WEAK RESUME BULLETS:
+{bullets}
+
+INSTRUCTIONS:
+1. Start with a strong action verb, in the past tense unless the position is current
+2. Fix the issues listed under each bullet; otherwise strengthen its wording and make its scope clearer
+3. Keep every fact accurate; do not add numbers, percentages, tools or outcomes the bullet does not state
+4. Use the job description's terminology where it genuinely applies
+5. Keep each bullet under 35 words
+
+OUTPUT ONLY A JSON OBJECT MAPPING EACH BULLET NUMBER TO ITS REWRITTEN TEXT:"""},
+    'shared_context': {'budget': 24000, 'truncate': 'job_description', 'text': """RESUME DATA:
+{resume_json}
+
+JOB DESCRIPTION:
+{job_description}"""},
+    'cover_letter': {'text': """Using the RESUME DATA and JOB DESCRIPTION provided, write a professional cover letter for the candidate applying to {company}.
+
+INSTRUCTIONS:
+1. Address to "Hiring Manager" if name is unknown
+2. First paragraph should express interest in the position
+3. Middle paragraphs should highlight relevant qualifications
+4. Closing paragraph should express enthusiasm and request for interview
+5. Keep it concise (3-4 paragraphs total)
+6. Use professional but approachable tone
+7. Only include one "Sincerely" closing at the end
+8. Do not include any contact information in the body text
+
+COVER LETTER:"""},
+    'resume_ats': {'text': """Suggest CONTENT IMPROVEMENTS ONLY for the RESUME DATA against the JOB DESCRIPTION.
+Keyword coverage and formatting were already checked; these findings are context, do not repeat them:
+{findings}
+
+Write at most 5 markdown bullet points, without a heading, on how to strengthen the substance of the summary, achievements and projects for this role."""},
+    'cover_letter_ats': {'budget': 8000, 'truncate': 'job_description', 'text': """Analyze this cover letter for ATS (Applicant Tracking System) compliance against the job description.
+Provide specific recommendations to improve ATS scoring.
+
+COVER LETTER:
+{cover_letter}
+
+JOB DESCRIPTION:
+{job_description}
+
+FORMAT YOUR RESPONSE WITH THESE SECTIONS:
+1. Keyword Optimization
+2. Formatting Suggestions
+3. Content Improvements"""},
+    'interview_prep': {'text': """Generate interview preparation materials based on the RESUME DATA and JOB DESCRIPTION provided.
+{covered}
+WRITE ONLY THIS SECTION: the markdown heading below followed by a numbered list of {request}, one per line, without answers.
+## {section}"""},
+    'interview_answer': {'text': """Using the RESUME DATA and JOB DESCRIPTION provided, write a sample answer the candidate could give to this interview question.
+
+QUESTION:
+{question}
+
+Answer in the first person in at most 150 words, drawing on specific experience from the resume. Use the STAR format for behavioral questions.
+
+SAMPLE ANSWER:"""},
+    'combined': {'budget': 24000, 'truncate': 'job_description', 'text': """You are preparing a complete job application package for the target role.
 
 RESUME DATA:
-{json.dumps(resume_data, indent=2)}
+{resume_json}
 
 TARGET ROLE:
 {target_role}
 
+COMPANY:
+{company}
+
 JOB DESCRIPTION:
 {job_description}
 
-INSTRUCTIONS:
-1. Rephrase all content to be more professional and impactful
-2. Focus on quantifiable achievements for work experience
-3. Use industry-standard terminology
-4. Maintain the original structure and information
-5. Output should be valid JSON with the same structure as input
-6. Do not add any new sections or information that wasn't in the original
-7. Do not include the job title in the resume content
+Return a single JSON object with exactly these fields:
+- "optimized_resume": the resume data rephrased to be professional, impactful and achievement-oriented. Same JSON structure as the input, no new sections or information, and no job title in the resume content.
+- "cover_letter": a 3-4 paragraph cover letter addressed to "Hiring Manager" with one "Sincerely" closing and no contact information in the body.
+- "resume_ats_report": at most 5 markdown bullet points, without a heading, suggesting content improvements to the substance of the optimized resume for this role (keywords and formatting are checked separately).
+- "cover_letter_ats_report": markdown ATS compliance analysis of the cover letter with the same three sections.
+- "interview_prep": markdown starting with the heading "## Technical Questions" followed by a numbered list of 5 likely technical questions without answers.
 
-OUTPUT ONLY THE JSON:"""
-    
-    try:
-        response = st.session_state.model.generate_content(prompt, generation_config={"temperature": 0.3})
-        response_text = response.text.strip()
+OUTPUT ONLY THE JSON OBJECT WITH ALL FIVE FIELDS:"""}
+}
+
+TRUNCATION_MARKER = "\n[...truncated to fit the prompt budget]"
+
+@dataclass(frozen=True, slots=True)
+class PromptTemplate:
+    """A prompt parsed once into literal and field parts, identified by a hash of its text.
+
+    budget caps the rendered prompt in estimated tokens; when it is exceeded the value of the
+    truncate field is shortened to fit, so a template with a budget must name one of its fields as truncate.
+    """
+    name: str
+    text: str
+    variant: str = 'a'
+    weight: float = 1.0
+    budget: int | None = None
+    truncate: str | None = None
+    version: str = field(init=False)
+    fields: tuple = field(init=False)
+    _parts: tuple = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # Flatten into (is_field, literal text or field name) pairs so rendering is a single join
+        parts = []
+        for literal, name, _, _ in string.Formatter().parse(self.text):
+            if literal:
+                parts.append((False, literal))
+            if name:
+                parts.append((True, name))
+        object.__setattr__(self, '_parts', tuple(parts))
+        object.__setattr__(self, 'fields', tuple(dict.fromkeys(name for is_field, name in parts if is_field)))
+        object.__setattr__(self, 'version', f"{self.name}.{self.variant}-{prompt_hash(self.text)[:8]}")
+        if self.budget is not None and self.truncate not in self.fields:
+            raise ValueError(f"Prompt template {self.name}.{self.variant} has a budget, so truncate must name one of its "
+                             f"fields ({', '.join(self.fields) or 'none'}), not {self.truncate!r}")
+
+    def _join(self, values):
+        return ''.join([values[part] if is_field else part for is_field, part in self._parts])
+
+    def render(self, **values):
+        prompt = self._join(values)
+        if self.budget is None or estimate_tokens(prompt) <= self.budget:
+            return prompt
+        overflow = (estimate_tokens(prompt) - self.budget) * 4 + len(TRUNCATION_MARKER)
+        value = values[self.truncate]
+        values[self.truncate] = value[:max(0, len(value) - overflow)] + TRUNCATION_MARKER
+        return self._join(values)
+
+PROMPT_TEMPLATES = {}
+
+def load_prompt_templates():
+    """Compile the default templates, merged with PROMPT_TEMPLATES overrides (JSON text or a path to a JSON file).
+
+    An override replaces fields of the default variant and may add A/B variants, e.g.
+    {"cover_letter": {"variants": {"b": {"text": "...", "weight": 0.5}}}}
+    """
+    specs = copy.deepcopy(PROMPT_TEMPLATE_DEFAULTS)
+    override = os.getenv("PROMPT_TEMPLATES")
+    if override:
+        if os.path.exists(override):
+            with open(override, 'r', encoding='utf-8') as f:
+                override = f.read()
+        for name, spec in json.loads(override).items():
+            specs.setdefault(name, {}).update(spec)
+
+    PROMPT_TEMPLATES.clear()
+    for name, spec in specs.items():
+        default = PromptTemplate(name, spec['text'], budget=spec.get('budget'), truncate=spec.get('truncate'))
+        variants = {'a': default}
+        for variant, variant_spec in spec.get('variants', {}).items():
+            variants[variant] = replace(default, variant=variant, **{
+                key: variant_spec[key] for key in ('text', 'weight', 'budget', 'truncate') if key in variant_spec
+            })
+        PROMPT_TEMPLATES[name] = variants
+
+def get_prompt_template(name):
+    """Return the session's variant of a template, chosen by a stable hash of the session id and weighted by variant.
+
+    Non-default variant weights are fractions of sessions; outside a session the default variant is used.
+    """
+    variants = PROMPT_TEMPLATES[name]
+    if len(variants) == 1:
+        return variants['a']
+    session_id = current_session_id()
+    if session_id is None:
+        return variants['a']
+    bucket = int(prompt_hash(f"{session_id}:{name}")[:8], 16) / 0x100000000
+    for variant, template in variants.items():
+        if variant == 'a':
+            continue
+        bucket -= template.weight
+        if bucket < 0:
+            return template
+    return variants['a']
+
+def render_prompt(name, **values):
+    return get_prompt_template(name).render(**values)
 
-        if response_text.startswith("```json"):
-            response_text = response_text[7:].rstrip("`").strip()
-        elif response_text.startswith("```"):
-            response_text = response_text[3:].rstrip("`").strip()
+def prompt_version(name):
+    return get_prompt_template(name).version
+
+def prompt_set_version(names=tuple(PROMPT_TEMPLATE_DEFAULTS)):
+    """Short hash over the active versions of the named templates, for keying cached outputs"""
+    return prompt_hash("|".join(prompt_version(name) for name in names))[:12]
+
+load_prompt_templates()
+
+def parse_json_response(response_text):
+    """Parse a model response as JSON, dropping any markdown code fence around it"""
+    response_text = response_text.strip()
+    if response_text.startswith("```json"):
+        response_text = response_text[7:].rstrip("`").strip()
+    elif response_text.startswith("```"):
+        response_text = response_text[3:].rstrip("`").strip()
+    return json.loads(response_text)
+
+# Headings are matched in order, so "Preferred Qualifications" is a nice-to-have and "Benefits" boilerplate
+JD_SEGMENT_HEADINGS = [
+    ('boilerplate', re.compile(r"benefit|perk|compensation|salary|pay range|equal (?:employment )?opportunit|\beeo\b|accommodation"
+                               r"|diversity|inclusion|what we offer|why (?:join|work)|legal|privacy", re.IGNORECASE)),
+    ('nice_to_have', re.compile(r"nice[ -]to[ -]have|preferred|bonus|\bplus\b|desired|good to have", re.IGNORECASE)),
+    ('requirements', re.compile(r"requirement|qualification|must[ -]have|what you(?:'ll| will)? (?:need|bring)|who you are"
+                                r"|you have|skills|experience|about you", re.IGNORECASE)),
+    ('responsibilities', re.compile(r"responsibilit|what you(?:'ll| will) do|duties|day[ -]to[ -]day|your (?:role|impact)"
+                                    r"|the role|you will|in this role", re.IGNORECASE)),
+    ('company', re.compile(r"about|who we are|our (?:mission|story|team|values|culture)|company", re.IGNORECASE))
+]
+# Bare heading lines (no colon, '#' or '**') switch segments only on an exact match, so job titles never do
+JD_HEADING_VOCABULARY = {
+    'boilerplate': ("benefits", "perks", "perks and benefits", "benefits and perks", "compensation", "salary", "pay range",
+                    "compensation and benefits", "equal opportunity", "equal employment opportunity", "eeo statement",
+                    "accommodations", "diversity and inclusion", "diversity equity and inclusion", "what we offer",
+                    "why join us", "why work with us", "legal", "privacy notice"),
+    'nice_to_have': ("nice to have", "nice to haves", "preferred qualifications", "bonus points", "desired skills",
+                     "good to have", "preferred skills"),
+    'requirements': ("requirements", "qualifications", "minimum qualifications", "basic qualifications",
+                     "required qualifications", "must have", "must haves", "what you need", "what you will need",
+                     "what you ll need", "what you bring", "what you will bring", "what you ll bring", "who you are",
+                     "about you", "skills", "required skills", "experience"),
+    'responsibilities': ("responsibilities", "key responsibilities", "what you will do", "what you ll do", "duties",
+                         "day to day", "your role", "your impact", "the role", "about the role", "in this role"),
+    'company': ("about us", "about the company", "who we are", "our mission", "our story", "our team", "our values",
+                "our culture", "company overview")
+}
+JD_HEADING_SEGMENTS = {title: segment for segment, titles in JD_HEADING_VOCABULARY.items() for title in titles}
+JD_HEADING = re.compile(r"^(?:#{1,6}\s*)?(?:\*\*)?(?P<title>[A-Za-z][^.!?:]{1,58}?)(?:\*\*)?\s*(?P<colon>:)?(?:\*\*)?$")
+JD_BOILERPLATE_LINE = re.compile(
+    r"equal opportunity|regardless of (?:race|gender|age|sex)|without regard to|reasonable accommodation|e-verify"
+    r"|protected veteran|sexual orientation|value diversity|401\(?k\)?|paid time off|\bpto\b|health insurance",
+    re.IGNORECASE
+)
+JD_LINE_KEY = re.compile(r"[\W_]+")
+JD_PROMPT_SEGMENTS = ('summary', 'responsibilities', 'requirements', 'nice_to_have', 'company')
+JD_ROLE_SEGMENTS = ('summary', 'responsibilities', 'requirements', 'nice_to_have')
+# Segments of the job description each prompt template receives; others get JD_PROMPT_SEGMENTS
+JD_TASK_SEGMENTS = {
+    'optimize': JD_ROLE_SEGMENTS,
+    'cover_letter_ats': JD_ROLE_SEGMENTS
+}
+JD_CACHE_SIZE = 256
+
+@dataclass(frozen=True, slots=True)
+class JobPosting:
+    """A job description split into segments; lines holds (segment, line) in posting order without repeats"""
+    lines: tuple
+    source_chars: int
+
+    def text(self, segments=JD_PROMPT_SEGMENTS):
+        return "\n".join(line for segment, line in self.lines if segment in segments)
+
+    def segment_chars(self):
+        chars = {}
+        for segment, line in self.lines:
+            chars[segment] = chars.get(segment, 0) + len(line) + 1
+        return chars
+
+def jd_heading_segment(line):
+    """The segment a heading line starts, or None when the line is not a heading"""
+    match = JD_HEADING.match(line)
+    if not match or len(match['title'].split()) > 6:
+        return None
+    title = match['title']
+    if not (match['colon'] or line.startswith(('#', '**'))):
+        return JD_HEADING_SEGMENTS.get(JD_LINE_KEY.sub(" ", title.lower()).strip())
+    for segment, pattern in JD_SEGMENT_HEADINGS:
+        if pattern.search(title):
+            return segment
+    return None
+
+def segment_job_description(job_description):
+    """Split a pasted job description into summary, responsibilities, requirements, nice_to_have, company and boilerplate.
+
+    Lines before the first recognised heading are the summary; boilerplate lines are caught anywhere by their wording
+    except the first line, which is usually the job title and is never boilerplate.
+    """
+    lines, seen = [], set()
+    segment = 'summary'
+    for raw in job_description.splitlines():
+        line = raw.strip()
+        key = JD_LINE_KEY.sub(" ", line.lower()).strip()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        heading = jd_heading_segment(line)
+        if not lines:
+            segment = heading if heading not in (None, 'boilerplate') else segment
+            lines.append((segment, line))
+            continue
+        segment = heading or segment
+        lines.append(('boilerplate' if JD_BOILERPLATE_LINE.search(line) else segment, line))
+    return JobPosting(tuple(lines), len(job_description))
+
+@st.cache_resource
+def _job_postings():
+    """Segmented job descriptions shared by every session, keyed by the job description hash"""
+    return {'postings': OrderedDict(), 'lock': threading.Lock()}
+
+def preprocess_job_description(job_description):
+    cache = _job_postings()
+    key = prompt_hash(job_description)
+    with cache['lock']:
+        posting = cache['postings'].get(key)
+        if posting is not None:
+            cache['postings'].move_to_end(key)
+            return posting
+    posting = segment_job_description(job_description)
+    with cache['lock']:
+        cache['postings'][key] = posting
+        while len(cache['postings']) > JD_CACHE_SIZE:
+            cache['postings'].popitem(last=False)
+    return posting
+
+def job_description_for(task, job_description):
+    """The part of the job description worth sending to a task's prompt: never boilerplate or repeated lines"""
+    if not JD_PREPROCESSING:
+        return job_description
+    text = preprocess_job_description(job_description).text(JD_TASK_SEGMENTS.get(task, JD_PROMPT_SEGMENTS))
+    return text or job_description
+
+def build_optimize_prompt(resume_data, job_description, target_role):
+    return render_prompt('optimize', resume_json=resume_json(resume_data), target_role=target_role,
+                         job_description=job_description_for('optimize', job_description))
+
+def optimize_resume_with_ai(resume_data, job_description, target_role, rewrite=None):
+    if not get_model():
+        return None, "AI model not initialized. Please enter a valid Google API Key in the sidebar."
+    if (rewrite or REWRITE_MODE) == 'weak_bullets':
+        return rewrite_weak_bullets(resume_data, job_description, target_role)
         
-        optimized_data = json.loads(response_text)
+    prompt = build_optimize_prompt(resume_data, job_description, target_role)
+    
+    try:
+        optimized_data = parse_json_response(generate_for_task('optimize', prompt))
         
-        if not isinstance(optimized_data, dict) or 'contact_info' not in optimized_data:
-            return None, "Optimization failed - unexpected response format"
+        errors = validate_resume_data(optimized_data)
+        if errors:
+            return None, f"Optimization failed - unexpected response format ({errors[0]})"
         
         return optimized_data, None
 
@@ -667,35 +3099,37 @@ OUTPUT ONLY THE JSON:"""
     except Exception as e:
         return None, f"{str(e)}"
 
-def generate_cover_letter_with_ai(resume_data, job_description, company_name):
-    if not st.session_state.model:
-        st.session_state.api_key_valid = False
-        st.session_state.show_api_instructions = True
-        return ""
-        
-    prompt = f"""Write a professional cover letter for the candidate applying to {company_name or "the company"}.
+def build_shared_context_text(resume_data, job_description):
+    return render_prompt('shared_context', resume_json=resume_json(resume_data),
+                         job_description=job_description_for('shared_context', job_description))
 
-RESUME DATA:
-{json.dumps(resume_data, indent=2)}
+def create_shared_context(resume_data, job_description, cache=True):
+    """Build the resume + job description context shared by the downstream task prompts.
 
-JOB DESCRIPTION:
-{job_description}
+    With cache=False the context is sent inline with every prompt instead of through a cached context.
+    """
+    text = build_shared_context_text(resume_data, job_description)
+    return {'key': prompt_hash(text), 'text': text, 'models': {}, 'cache': cache, 'pending': {}}
 
-INSTRUCTIONS:
-1. Address to "Hiring Manager" if name is unknown
-2. First paragraph should express interest in the position
-3. Middle paragraphs should highlight relevant qualifications
-4. Closing paragraph should express enthusiasm and request for interview
-5. Keep it concise (3-4 paragraphs total)
-6. Use professional but approachable tone
-7. Only include one "Sincerely" closing at the end
-8. Do not include any contact information in the body text
+def build_cover_letter_instructions(company_name):
+    return render_prompt('cover_letter', company=company_name or "the company")
+
+def build_cover_letter_prompt(resume_data, job_description, company_name):
+    return build_shared_context_text(resume_data, job_description) + "\n\n" + build_cover_letter_instructions(company_name)
+
+def generate_cover_letter_with_ai(resume_data, job_description, company_name, context=None):
+    if not get_model():
+        st.session_state.api_key_valid = False
+        st.session_state.show_api_instructions = True
+        return ""
 
-COVER LETTER:"""
+    if context is None:
+        prompt = build_cover_letter_prompt(resume_data, job_description, company_name)
+    else:
+        prompt = build_cover_letter_instructions(company_name)
     
     try:
-        response = st.session_state.model.generate_content(prompt)
-        return response.text
+        return generate_for_task('cover_letter', prompt, context=context)
     except Exception as e:
         error_msg = str(e).lower()
         if "api key" in error_msg or "400" in error_msg or "quota" in error_msg or "invalid" in error_msg:
@@ -705,29 +3139,238 @@ COVER LETTER:"""
             st.error(f"Error generating cover letter: {str(e)}")
         return ""
 
-def analyze_ats_compliance(resume_data, job_description):
-    if not st.session_state.model:
+ATS_QUANTIFIED_SHARE = 0.5
+# Date styles a position's dates can be written in; mixing them reads as sloppy and confuses some parsers
+ATS_DATE_STYLES = [
+    ('Mon YYYY', re.compile(r"^(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.? \d{4}$", re.IGNORECASE)),
+    ('MM/YYYY', re.compile(r"^\d{1,2}/\d{4}$")),
+    ('YYYY-MM', re.compile(r"^\d{4}-\d{2}$")),
+    ('YYYY', re.compile(r"^\d{4}$")),
+    ('Present', re.compile(r"^(?:present|current|now)$", re.IGNORECASE))
+]
+ATS_DATE_RANGE = re.compile(r"\s*(?:-|–|—|\bto\b)\s*")
+
+def ats_date_style(date):
+    return next((name for name, pattern in ATS_DATE_STYLES if pattern.match(date.strip())), None)
+
+LINT_BULLET_WORDS = (6, 35)
+LINT_REPEATED_VERB = 3
+LINT_CURRENT_DATES = re.compile(r"\b(?:present|current|now)\b", re.IGNORECASE)
+LINT_IRREGULAR_PAST = frozenset("""
+built led ran won made drove grew wrote took gave began set cut spoke brought taught sold held kept sent spent found met
+chose rebuilt rewrote overcame oversaw undertook upheld withdrew sped stood split shut fought thought sought
+""".split())
+LINT_WEAK_OPENERS = frozenset("i we my our the a an this that it responsible worked helped assisted participated involved duties tasked handled".split())
+# Every per-bullet feature as one alternation, so all bullets are scanned in a single regex pass
+# The first-letter lookaheads let the engine skip most word boundaries without trying every alternative
+LINT_FEATURES = re.compile(
+    r"(?P<passive>\b(?=[wbiag])(?:was|were|been|being|is|are|got)\s+(?:\w+ly\s+)?(?:\w+ed|\w+en|"
+    + "|".join(sorted(LINT_IRREGULAR_PAST)) + r")\b)"
+    r"|(?P<metric>[\d%$]|\b(?=[otfsenhd])(?:one|two|three|four|five|six|seven|eight|nine|ten|twice|double[ds]?|triple[ds]?|half)\b)",
+    re.IGNORECASE
+)
+LINT_MESSAGES = {
+    'passive_voice': "Passive voice; say who did what",
+    'no_metric': "No number, percentage or amount to show impact",
+    'too_short': "Too short to show impact",
+    'too_long': "Over {high} words; split or tighten it",
+    'weak_opener': "Does not open with a strong action verb",
+    'repeated_verb': "'{verb}' opens {count} bullets; vary the verbs",
+    'tense': "{tense} tense where the rest of this position uses {expected} tense",
+    'date_format': "Dates written as {style} while most positions use {expected}"
+}
+
+@dataclass(frozen=True, slots=True)
+class LintFinding:
+    """One linter finding; bullet is None for findings about the whole entry, such as its dates"""
+    rule: str
+    section: str
+    entry: int
+    bullet: int
+    message: str
+
+def bullet_tense(verb):
+    if verb.endswith('ed') or verb in LINT_IRREGULAR_PAST:
+        return 'past'
+    if verb.endswith('ing'):
+        return None
+    return 'present'
+
+def lint_resume(resume_data):
+    """Check every work experience achievement and project description in one pass and return LintFindings.
+
+    Per-bullet features come from a single LINT_FEATURES scan over the joined bullets; repeated
+    opening verbs, mixed tenses and date styles are then judged across bullets and positions.
+    """
+    resume = as_resume(resume_data)
+    bullets = [('work_experience', i, j, text) for i, position in enumerate(resume.work_experience or ())
+               for j, text in enumerate(position.achievements)]
+    bullets += [('projects', i, None, project.description) for i, project in enumerate(resume.projects or ()) if project.description]
+    findings = []
+
+    starts, offset = [], 0
+    for bullet in bullets:
+        starts.append(offset)
+        offset += len(bullet[3]) + 1
+    passive, metric = set(), set()
+    for match in LINT_FEATURES.finditer("\n".join(bullet[3] for bullet in bullets)):
+        (passive if match.lastgroup == 'passive' else metric).add(bisect.bisect_right(starts, match.start()) - 1)
+
+    low, high = LINT_BULLET_WORDS
+    openers = [bullet[3].split(maxsplit=1)[0].strip(",.;:") if bullet[3].strip() else "" for bullet in bullets]
+    verb_counts = {}
+    for opener in openers:
+        verb_counts[opener.lower()] = verb_counts.get(opener.lower(), 0) + 1
+    seen_verbs = set()
+    tenses = {}
+    for index, (section, entry, number, text) in enumerate(bullets):
+        words = len(text.split())
+        if index in passive:
+            findings.append(LintFinding('passive_voice', section, entry, number, LINT_MESSAGES['passive_voice']))
+        if index not in metric:
+            findings.append(LintFinding('no_metric', section, entry, number, LINT_MESSAGES['no_metric']))
+        if words < low:
+            findings.append(LintFinding('too_short', section, entry, number, LINT_MESSAGES['too_short']))
+        elif words > high:
+            findings.append(LintFinding('too_long', section, entry, number, LINT_MESSAGES['too_long'].format(high=high)))
+        verb = openers[index].lower()
+        if not openers[index][:1].isupper() or verb in LINT_WEAK_OPENERS:
+            findings.append(LintFinding('weak_opener', section, entry, number, LINT_MESSAGES['weak_opener']))
+            continue
+        if verb in seen_verbs and verb_counts[verb] >= LINT_REPEATED_VERB:
+            findings.append(LintFinding('repeated_verb', section, entry, number,
+                                        LINT_MESSAGES['repeated_verb'].format(verb=openers[index], count=verb_counts[verb])))
+        seen_verbs.add(verb)
+        if section == 'work_experience' and bullet_tense(verb):
+            tenses.setdefault(entry, []).append((number, bullet_tense(verb)))
+
+    # Tense: a past position reads in the past tense; any position should not mix tenses
+    for i, position_tenses in tenses.items():
+        known = [tense for _, tense in position_tenses]
+        current = bool(LINT_CURRENT_DATES.search(resume.work_experience[i].dates))
+        expected = max(('past', 'present'), key=known.count) if current else 'past'
+        for number, tense in position_tenses:
+            if tense != expected:
+                findings.append(LintFinding('tense', 'work_experience', i, number,
+                                            LINT_MESSAGES['tense'].format(tense=tense.capitalize(), expected=expected)))
+
+    styles = {}
+    for i, position in enumerate(resume.work_experience or ()):
+        parts = {ats_date_style(part) or 'other' for part in ATS_DATE_RANGE.split(position.dates.strip()) if part} - {'Present'}
+        styles[i] = ", ".join(sorted(parts)) if parts else 'nothing'
+    if styles:
+        expected = max(styles.values(), key=list(styles.values()).count)
+        for i, style in styles.items():
+            if style != expected or style in ('other', 'nothing'):
+                findings.append(LintFinding('date_format', 'work_experience', i, None,
+                                            LINT_MESSAGES['date_format'].format(style=style, expected=expected)))
+    return findings
+
+def ats_formatting_checks(resume, findings=None):
+    """Deterministic ATS formatting checks as (passed, message) pairs, built on the resume linter's findings"""
+    checks = []
+    contact = resume.contact_info
+    missing_contact = [label for label, value in (("email", contact.email), ("phone", contact.phone)) if not value]
+    checks.append((not missing_contact, "Contact details include email and phone" if not missing_contact
+                   else f"Add your {' and '.join(missing_contact)} so recruiters can reach you"))
+    for label, value in (("Professional Summary", resume.professional_summary), ("Work Experience", resume.work_experience),
+                         ("Education", resume.education), ("Skills", resume.skills)):
+        if value is not None:
+            checks.append((bool(value), f"{label} section is present" if value else f"{label} section is empty"))
+
+    findings = lint_resume(resume) if findings is None else findings
+    counts = {}
+    for finding in findings:
+        if finding.section == 'work_experience':
+            counts[finding.rule] = counts.get(finding.rule, 0) + 1
+    bullets = sum(len(position.achievements) for position in resume.work_experience or ())
+    if bullets:
+        low, high = LINT_BULLET_WORDS
+        short, long = counts.get('too_short', 0), counts.get('too_long', 0)
+        checks.append((not short and not long, f"All {bullets} bullets are {low}-{high} words" if not short and not long
+                       else f"Of {bullets} bullets: {short} under {low} words, {long} over {high}; aim for one or two lines each"))
+        weak = counts.get('weak_opener', 0)
+        checks.append((not weak, "Every bullet starts with an action verb" if not weak
+                       else f"{weak} of {bullets} bullets do not start with a strong action verb"))
+        quantified = bullets - counts.get('no_metric', 0)
+        checks.append((quantified >= ATS_QUANTIFIED_SHARE * bullets,
+                       f"{quantified} of {bullets} bullets are quantified with numbers, percentages or amounts"))
+    if resume.work_experience:
+        mismatched = counts.get('date_format', 0)
+        checks.append((not mismatched, "Dates use one consistent format" if not mismatched
+                       else f"{mismatched} positions use a different or missing date format; use one format throughout"))
+    return checks
+
+def resume_ats_text(resume):
+    """Every free-text value of a resume, for keyword matching"""
+    parts = [resume.professional_summary or ""]
+    for position in resume.work_experience or ():
+        parts.append(position.job_title)
+        parts.extend(position.achievements)
+    skills = resume.skills or ()
+    parts.extend(itertools.chain.from_iterable(values for _, values in skills) if resume.skills_by_category else skills)
+    for project in resume.projects or ():
+        parts.extend([project.name, project.description, *project.technologies])
+    parts.extend(resume.certifications or ())
+    parts.extend(entry.degree for entry in resume.education or ())
+    return "\n".join(parts)
+
+def local_ats_findings(resume_data, job_description):
+    """Keyword coverage and formatting checks computed without the model"""
+    resume = as_resume(resume_data)
+    matcher = jd_keyword_matcher(job_description)
+    found = matcher.scan(resume_ats_text(resume))
+    return {
+        'matched': [keyword for index, keyword in enumerate(matcher.keywords) if index in found],
+        'missing': [keyword for index, keyword in enumerate(matcher.keywords) if index not in found],
+        'checks': ats_formatting_checks(resume)
+    }
+
+def summarize_ats_findings(findings):
+    """One compact line per finding, given to the model as context for content suggestions"""
+    lines = [f"Keyword coverage: {len(findings['matched'])}/{len(findings['matched']) + len(findings['missing'])}"
+             + (f"; missing: {', '.join(findings['missing'])}" if findings['missing'] else "")]
+    lines.extend(message for passed, message in findings['checks'] if not passed)
+    return "\n".join(f"- {line}" for line in lines)
+
+def format_ats_report(findings, content_improvements):
+    """The full ATS report: locally computed keyword and formatting sections plus the model's content section"""
+    total = len(findings['matched']) + len(findings['missing'])
+    keyword_lines = [f"**Coverage:** {len(findings['matched'])}/{total} job description key phrases ({len(findings['matched']) / total:.0%})"
+                     if total else "**Coverage:** no key phrases found in the job description"]
+    if findings['matched']:
+        keyword_lines.append(f"- Matched: {', '.join(findings['matched'])}")
+    if findings['missing']:
+        keyword_lines.append(f"- Missing: {', '.join(f'`{keyword}`' for keyword in findings['missing'])}")
+        keyword_lines.append("- Work the missing terms you genuinely have into your summary, bullets or skills, using the posting's exact wording.")
+    formatting_lines = [f"- {'✅' if passed else '⚠️'} {message}" for passed, message in findings['checks']]
+    return (
+        "## 1. Keyword Optimization\n" + "\n".join(keyword_lines)
+        + "\n\n## 2. Formatting Suggestions\n" + "\n".join(formatting_lines)
+        + "\n\n## 3. Content Improvements\n" + content_improvements.strip()
+    )
+
+def build_ats_instructions(findings=None):
+    return render_prompt('resume_ats', findings=summarize_ats_findings(findings) if findings else "- none")
+
+def build_ats_prompt(resume_data, job_description, findings=None):
+    return build_shared_context_text(resume_data, job_description) + "\n\n" + build_ats_instructions(findings)
+
+def analyze_ats_compliance(resume_data, job_description, context=None):
+    """ATS report with keyword and formatting sections computed locally and only content improvements from the model"""
+    if not get_model():
         st.session_state.api_key_valid = False
         st.session_state.show_api_instructions = True
         return ""
-        
-    prompt = f"""Analyze this resume for ATS (Applicant Tracking System) compliance against the job description.
-Provide specific recommendations to improve ATS scoring.
-
-RESUME DATA:
-{json.dumps(resume_data, indent=2)}
-
-JOB DESCRIPTION:
-{job_description}
 
-FORMAT YOUR RESPONSE WITH THESE SECTIONS:
-1. Keyword Optimization
-2. Formatting Suggestions
-3. Content Improvements"""
+    findings = local_ats_findings(resume_data, job_description)
+    if context is None:
+        prompt = build_ats_prompt(resume_data, job_description, findings)
+    else:
+        prompt = build_ats_instructions(findings)
     
     try:
-        response = st.session_state.model.generate_content(prompt)
-        return response.text
+        return format_ats_report(findings, generate_for_task('resume_ats', prompt, context=context))
     except Exception as e:
         error_msg = str(e).lower()
         if "api key" in error_msg or "400" in error_msg or "quota" in error_msg or "invalid" in error_msg:
@@ -737,29 +3380,20 @@ FORMAT YOUR RESPONSE WITH THESE SECTIONS:
         else:
             return f"Error generating ATS analysis: {str(e)}"
 
+def build_cover_letter_ats_prompt(cover_letter, job_description):
+    return render_prompt('cover_letter_ats', cover_letter=cover_letter,
+                         job_description=job_description_for('cover_letter_ats', job_description))
+
 def analyze_cover_letter_ats(cover_letter, job_description):
-    if not st.session_state.model:
+    if not get_model():
         st.session_state.api_key_valid = False
         st.session_state.show_api_instructions = True
         return ""
         
-    prompt = f"""Analyze this cover letter for ATS (Applicant Tracking System) compliance against the job description.
-Provide specific recommendations to improve ATS scoring.
-
-COVER LETTER:
-{cover_letter}
-
-JOB DESCRIPTION:
-{job_description}
-
-FORMAT YOUR RESPONSE WITH THESE SECTIONS:
-1. Keyword Optimization
-2. Formatting Suggestions
-3. Content Improvements"""
+    prompt = build_cover_letter_ats_prompt(cover_letter, job_description)
     
     try:
-        response = st.session_state.model.generate_content(prompt)
-        return response.text
+        return generate_for_task('cover_letter_ats', prompt)
     except Exception as e:
         error_msg = str(e).lower()
         if "api key" in error_msg or "400" in error_msg or "quota" in error_msg or "invalid" in error_msg:
@@ -769,28 +3403,57 @@ FORMAT YOUR RESPONSE WITH THESE SECTIONS:
         else:
             return f"Error generating cover letter ATS analysis: {str(e)}"
 
-def generate_interview_prep(resume_data, job_description):
-    if not st.session_state.model:
+def interview_prep_sections(markdown):
+    """Split interview prep markdown into (heading, questions, body) per "## " section, skipping any preamble"""
+    sections = []
+    for block in re.split(r'^## ', markdown, flags=re.MULTILINE)[1:]:
+        heading, _, body = block.partition("\n")
+        questions = [question.replace("**", "").strip()
+                     for question in re.findall(r'^\s*(?:\d+[.)]|[-*])\s+(.+)$', body, re.MULTILINE)]
+        sections.append((heading.strip(), questions, body.strip()))
+    return sections
+
+def interview_prep_questions(markdown):
+    return list(dict.fromkeys(question for _, questions, _ in interview_prep_sections(markdown) for question in questions))
+
+def interview_prep_pages_loaded(markdown):
+    """Count the leading INTERVIEW_PREP_PAGES sections present in the interview prep markdown"""
+    loaded = 0
+    for section, _, _ in INTERVIEW_PREP_PAGES:
+        if f"## {section}" not in markdown:
+            break
+        loaded += 1
+    return loaded
+
+def with_interview_prep_heading(text, page=0):
+    """Make sure a generated page starts with its section heading so pages can be counted"""
+    text = text.strip()
+    heading = f"## {INTERVIEW_PREP_PAGES[page][0]}"
+    return text if text.startswith(heading) else f"{heading}\n{text}"
+
+def build_interview_prep_instructions(page=0, previous=""):
+    section, request, _ = INTERVIEW_PREP_PAGES[page]
+    questions = interview_prep_questions(previous)
+    covered = "\nQUESTIONS ALREADY COVERED (do not repeat them):\n" + "\n".join(f"- {q}" for q in questions) + "\n" if questions else ""
+    return render_prompt('interview_prep', section=section, request=request, covered=covered)
+
+def build_interview_prep_prompt(resume_data, job_description, page=0, previous=""):
+    return build_shared_context_text(resume_data, job_description) + "\n\n" + build_interview_prep_instructions(page, previous)
+
+def generate_interview_prep(resume_data, job_description, context=None, page=0, previous=""):
+    """Generate one INTERVIEW_PREP_PAGES section; previous is the markdown already shown, whose questions are not repeated"""
+    if not get_model():
         st.session_state.api_key_valid = False
         st.session_state.show_api_instructions = True
         return ""
-        
-    prompt = f"""Generate interview preparation materials based on this resume and job description.
-
-RESUME DATA:
-{json.dumps(resume_data, indent=2)}
-
-JOB DESCRIPTION:
-{job_description}
 
-INCLUDE THESE SECTIONS:
-1. 10 Likely Technical Questions with Sample Answers
-2. 5 Behavioral Questions with Sample Answers
-3. Questions to Ask the Interviewer"""
+    if context is None:
+        prompt = build_interview_prep_prompt(resume_data, job_description, page, previous)
+    else:
+        prompt = build_interview_prep_instructions(page, previous)
     
     try:
-        response = st.session_state.model.generate_content(prompt)
-        return response.text
+        return with_interview_prep_heading(generate_for_task('interview_prep', prompt, context=context), page)
     except Exception as e:
         error_msg = str(e).lower()
         if "api key" in error_msg or "400" in error_msg or "quota" in error_msg or "invalid" in error_msg:
@@ -800,6 +3463,844 @@ INCLUDE THESE SECTIONS:
         else:
             return f"Error generating interview prep: {str(e)}"
 
+def build_interview_answer_instructions(question):
+    return render_prompt('interview_answer', question=question)
+
+@st.cache_resource
+def _interview_answer_store():
+    """Sample answer futures shared by every session, keyed by (resume hash, JD hash, question, prompt version)"""
+    return {'answers': OrderedDict(), 'lock': threading.Lock()}
+
+def get_interview_context(resume, job_description):
+    """The session's shared context for answer prompts, rebuilt only when the resume or job description changes"""
+    key = (resume.content_hash(), prompt_hash(job_description))
+    cached = st.session_state.get('interview_context')
+    if cached is None or cached[0] != key:
+        cached = (key, create_shared_context(resume, job_description, cache=CONTEXT_CACHING))
+        st.session_state.interview_context = cached
+    return cached[1]
+
+def interview_answer_futures(resume, job_description, questions, start=()):
+    """Return {question: future} for each question with a sample answer, starting the missing ones listed in start.
+
+    Questions not in start only pick up answers already in the store, so nothing is generated until it is asked for.
+    Failed answers stay cached so a persistent error is not retried on every poll; forget_interview_answer retries one.
+    """
+    store = _interview_answer_store()
+    resume_hash, job_hash, version = resume.content_hash(), prompt_hash(job_description), prompt_version('interview_answer')
+    futures = {}
+    for question in questions:
+        key = (resume_hash, job_hash, question, version)
+        with store['lock']:
+            future = store['answers'].get(key)
+            if future is not None and future.cancelled():
+                future = None
+            if future is not None:
+                store['answers'].move_to_end(key)
+        if future is None:
+            if question not in start or not get_model():
+                continue
+            future = start_task('interview_answer', build_interview_answer_instructions(question),
+                                get_interview_context(resume, job_description))
+            with store['lock']:
+                store['answers'][key] = future
+                while len(store['answers']) > INTERVIEW_ANSWER_CACHE_SIZE:
+                    store['answers'].popitem(last=False)
+        futures[question] = future
+    return futures
+
+def forget_interview_answer(resume, job_description, question):
+    store = _interview_answer_store()
+    with store['lock']:
+        store['answers'].pop((resume.content_hash(), prompt_hash(job_description), question, prompt_version('interview_answer')), None)
+
+def interview_prep_answers(resume, job_description, markdown):
+    """Answer futures for the questions in markdown's answered sections; only ones the user asked for are started"""
+    questions = [question for heading, section_questions, _ in interview_prep_sections(markdown)
+                 if heading in ANSWERED_INTERVIEW_SECTIONS for question in section_questions]
+    return interview_answer_futures(resume, job_description, questions,
+                                    start=st.session_state.get('requested_answers', set()))
+
+def interview_prep_export_markdown(markdown, answers):
+    """Interview prep markdown with every finished sample answer written under its question"""
+    blocks = []
+    for heading, questions, body in interview_prep_sections(markdown):
+        blocks.append(f"## {heading}")
+        if heading not in ANSWERED_INTERVIEW_SECTIONS or not questions:
+            blocks.append(body)
+            continue
+        for i, question in enumerate(questions, 1):
+            blocks.append(f"### {i}. {question}")
+            future = answers.get(question)
+            if future is not None and future.done() and not future.cancelled() and future.exception() is None:
+                blocks.append(future.result())
+    return "\n\n".join(blocks) if blocks else markdown
+
+KEYWORD_TOKEN = re.compile(r"[A-Za-z][A-Za-z0-9]*(?:[+#]+|(?:[./-][A-Za-z0-9]+)+)?|[.,;:!?()\[\]\n•·|]")
+KEYWORD_STOPWORDS = frozenset("""
+a about above across after all also an and any are as at be been being both but by can candidate candidates company
+could day degree do does each eg etc excellent experience expertise familiarity for from good great growing have having help ideal in
+including into is it its join just knowledge least looking make may more most must new nice not of on or other our
+own per plus preferred proficiency proficient qualifications related required requirements responsibilities role
+seeking should skills so strong such team that the their them they this through to understanding up using we well what
+use when where which while who will with within work working would year years you your
+""".split())
+KEYWORD_LIMIT = 30
+
+def extract_jd_keywords(job_description, limit=KEYWORD_LIMIT):
+    """Pick the key phrases of a job description: frequent or capitalized terms and two-word phrases.
+
+    Phrases never span punctuation or stopwords; a word is dropped when it only appears inside chosen phrases.
+    """
+    scores, counts, first_seen = {}, {}, {}
+    previous = None
+    for position, token in enumerate(KEYWORD_TOKEN.findall(job_description)):
+        word = token.lower()
+        if len(token) == 1 and not token.isalpha() or word in KEYWORD_STOPWORDS:
+            previous = None
+            continue
+        notable = token[0].isupper() or not token.isalpha()
+        terms = [(word, 2 if notable else 1)]
+        if previous is not None:
+            # Two capitalized words ("Machine Learning") are a phrase at once, others once repeated
+            terms.append((f"{previous[0]} {word}", 3 if previous[1] and notable else 0))
+        for term, weight in terms:
+            counts[term] = counts.get(term, 0) + 1
+            scores[term] = scores.get(term, 0) + weight
+            first_seen.setdefault(term, position)
+        previous = (word, notable)
+    for term, count in counts.items():
+        if " " in term and count > 1:
+            scores[term] = max(scores[term], 3 * count)
+    ranked = sorted((term for term in scores if scores[term] and (len(term) > 1 or not term.isalpha())),
+                    key=lambda term: (-scores[term], first_seen[term]))[:limit]
+    phrases = [term for term in ranked if " " in term]
+    return [term for term in ranked
+            if " " in term or sum(counts[phrase] for phrase in phrases if term in phrase.split()) < counts[term]]
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over lowercase key phrases, matching whole words in one pass over the text"""
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state] += ((index, len(keyword)),)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0) if state else 0
+                self.output[child] += self.output[self.fail[child]]
+
+    def scan(self, text):
+        """Return the indexes of the keywords found in text as whole words"""
+        text = text.lower()
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        end = len(text)
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index, length in output[state]:
+                start = position - length + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (position + 1 == end or not text[position + 1].isalnum()):
+                    found.add(index)
+        return found
+
+@st.cache_resource
+def _keyword_matchers():
+    """Keyword matchers shared by every session, keyed by the job description hash"""
+    return {'matchers': OrderedDict(), 'lock': threading.Lock()}
+
+def jd_keyword_matcher(job_description):
+    """Matcher over the key phrases of the job description's role segments, built once per job description"""
+    cache = _keyword_matchers()
+    key = prompt_hash(job_description)
+    with cache['lock']:
+        matcher = cache['matchers'].get(key)
+        if matcher is not None:
+            cache['matchers'].move_to_end(key)
+            return matcher
+    matcher = KeywordMatcher(extract_jd_keywords(preprocess_job_description(job_description).text(JD_ROLE_SEGMENTS)))
+    with cache['lock']:
+        cache['matchers'][key] = matcher
+        while len(cache['matchers']) > JD_CACHE_SIZE:
+            cache['matchers'].popitem(last=False)
+    return matcher
+
+def get_keyword_matcher(job_description):
+    """The matcher for the session's job description, resetting the session's field hits when it changes"""
+    matcher = jd_keyword_matcher(job_description)
+    if st.session_state.get('keyword_matcher') is not matcher:
+        st.session_state.keyword_matcher = matcher
+        st.session_state.keyword_hits = {}
+    return matcher
+
+def resume_keyword_fields(resume_data):
+    """The free-text fields checked for job description keywords, as {field id: text}"""
+    fields = {'summary': resume_data.get('professional_summary', '')}
+    for i, exp in enumerate(resume_data.get('work_experience', [])):
+        fields[f'position_{i}'] = " ".join([exp.get('job_title', '')] + exp.get('achievements', []))
+    skills = resume_data.get('skills', {})
+    fields['skills'] = ", ".join(itertools.chain.from_iterable(skills.values()) if isinstance(skills, dict) else skills)
+    return fields
+
+def keyword_field_hits(matcher, field, text):
+    """Keyword indexes found in one field, rescanning only when its text changed since the last run"""
+    hits = st.session_state.keyword_hits
+    cached = hits.get(field)
+    if cached is not None and cached[0] == text:
+        return cached[1]
+    started = time.perf_counter()
+    found = frozenset(matcher.scan(text))
+    st.session_state.keyword_scan_us = (time.perf_counter() - started) * 1e6
+    hits[field] = (text, found)
+    return found
+
+def keyword_coverage(resume_data, job_description):
+    """Return (matcher, found keyword indexes) over the resume's free-text fields"""
+    matcher = get_keyword_matcher(job_description)
+    fields = resume_keyword_fields(resume_data)
+    for stale in st.session_state.keyword_hits.keys() - fields.keys():
+        del st.session_state.keyword_hits[stale]
+    found = set()
+    for field, text in fields.items():
+        found |= keyword_field_hits(matcher, field, text)
+    return matcher, found
+
+# Score lost per issue when ranking achievements for selective rewriting; no_jd_keyword is scored by the keyword matcher
+BULLET_SCORE_PENALTIES = {
+    'no_metric': 0.35,
+    'weak_opener': 0.25,
+    'too_short': 0.2,
+    'no_jd_keyword': 0.2,
+    'passive_voice': 0.15,
+    'too_long': 0.1,
+    'tense': 0.05,
+    'repeated_verb': 0.05
+}
+# Issues that still rank a bullet for rewriting but are not listed to the model: asking it to add a metric invites made-up numbers
+REWRITE_UNLISTED_ISSUES = frozenset({'no_metric'})
+
+@dataclass(frozen=True, slots=True)
+class BulletScore:
+    position: int
+    bullet: int
+    score: float
+    issues: tuple
+
+def score_achievements(resume_data, job_description):
+    """Score every work experience achievement from 0 to 1 on metrics, wording and job description keyword overlap"""
+    resume = as_resume(resume_data)
+    matcher = jd_keyword_matcher(job_description)
+    issues = {}
+    for finding in lint_resume(resume):
+        if finding.section == 'work_experience' and finding.bullet is not None and finding.rule in BULLET_SCORE_PENALTIES:
+            issues.setdefault((finding.entry, finding.bullet), []).append(finding.rule)
+    scores = []
+    for i, position in enumerate(resume.work_experience or ()):
+        for j, text in enumerate(position.achievements):
+            rules = issues.get((i, j), [])
+            if matcher.keywords and not matcher.scan(text):
+                rules.append('no_jd_keyword')
+            score = max(0.0, 1.0 - sum(BULLET_SCORE_PENALTIES[rule] for rule in rules))
+            scores.append(BulletScore(i, j, round(score, 2), tuple(rules)))
+    return scores
+
+def build_rewrite_bullets_prompt(resume, weak, job_description, target_role):
+    lines = []
+    for number, scored in enumerate(weak, 1):
+        position = resume.work_experience[scored.position]
+        lines.append(f"{number}. {position.achievements[scored.bullet]}")
+        issues = [rule.replace('_', ' ') for rule in scored.issues if rule not in REWRITE_UNLISTED_ISSUES]
+        lines.append(f"   Position: {position.job_title} ({position.dates or 'undated'}); "
+                     f"issues: {', '.join(issues) or 'none listed'}")
+    return render_prompt('rewrite_bullets', target_role=target_role, bullets="\n".join(lines),
+                         job_description=job_description_for('optimize', job_description))
+
+def rewrite_weak_bullets(resume_data, job_description, target_role):
+    """Rewrite only achievements scoring below BULLET_REWRITE_THRESHOLD, in one call, and return (resume_data, error).
+
+    Everything else, including any bullet the model leaves out of its answer, is kept verbatim.
+    """
+    resume = as_resume(resume_data)
+    weak = [scored for scored in score_achievements(resume, job_description) if scored.score < BULLET_REWRITE_THRESHOLD]
+    optimized_data = resume.to_dict()
+    if not weak:
+        return optimized_data, None
+
+    try:
+        rewrites = parse_json_response(generate_for_task('rewrite_bullets', build_rewrite_bullets_prompt(resume, weak, job_description, target_role)))
+    except json.JSONDecodeError:
+        return None, "Failed to parse the rewritten bullets - invalid JSON format"
+    except Exception as e:
+        return None, f"{str(e)}"
+    if not isinstance(rewrites, dict):
+        return None, "Bullet rewrite failed - unexpected response format"
+
+    for number, scored in enumerate(weak, 1):
+        text = rewrites.get(str(number))
+        if isinstance(text, str) and text.strip():
+            optimized_data['work_experience'][scored.position]['achievements'][scored.bullet] = text.strip()
+    return optimized_data, None
+
+def filter_resume_sections(resume_data, selected_sections):
+    """Keep contact info, target role and the sections the user chose to include"""
+    filtered_resume = {
+        'contact_info': resume_data['contact_info'],
+        'target_role': resume_data['target_role']
+    }
+    for label, key, default in RESUME_SECTIONS:
+        if label in selected_sections:
+            filtered_resume[key] = resume_data.get(key, default())
+    return filtered_resume
+
+def build_combined_prompt(resume_data, job_description, target_role, company_name):
+    return render_prompt(
+        'combined',
+        resume_json=resume_json(resume_data),
+        target_role=target_role,
+        company=company_name or "the company",
+        job_description=job_description_for('combined', job_description)
+    )
+
+def run_one_shot_pipeline(resume_data, job_description, target_role, company_name):
+    """Generate every artifact with one structured call, falling back to individual calls for missing fields"""
+    if not get_model():
+        return None, "AI model not initialized. Please enter a valid Google API Key in the sidebar."
+
+    # The optimized resume comes back about as long as it went in, next to the other four fields
+    if estimate_tokens(resume_json(resume_data)) + ONE_SHOT_TEXT_TOKENS > MODEL_ROUTES['combined']['max_output_tokens']:
+        st.info("This resume is too long for one combined response, so each part is generated separately")
+        return run_fan_out_pipeline(resume_data, job_description, target_role, company_name)
+
+    prompt = build_combined_prompt(resume_data, job_description, target_role, company_name)
+    try:
+        combined = parse_json_response(generate_for_task('combined', prompt))
+    except json.JSONDecodeError:
+        combined = None
+    except Exception as e:
+        if not is_truncation_error(e):
+            return None, f"{str(e)}"
+        st.warning(f"{e}, so each part is generated separately")
+        return run_fan_out_pipeline(resume_data, job_description, target_role, company_name)
+
+    optimized_resume = combined.get('optimized_resume') if isinstance(combined, dict) else None
+    if validate_resume_data(optimized_resume):
+        st.warning("The combined response had no usable optimized resume, so each part is generated separately")
+        return run_fan_out_pipeline(resume_data, job_description, target_role, company_name)
+    optimized = Resume.from_dict(optimized_resume)
+
+    def text_field(name):
+        value = combined.get(name)
+        return value.strip() if isinstance(value, str) and value.strip() else None
+
+    context = None
+    findings = local_ats_findings(optimized, job_description)
+    missing = [(task, instructions) for name, task, instructions in (
+        ('cover_letter', 'cover_letter', build_cover_letter_instructions(company_name)),
+        ('resume_ats_report', 'resume_ats', build_ats_instructions(findings)),
+        ('interview_prep', 'interview_prep', build_interview_prep_instructions())
+    ) if not text_field(name)]
+    if missing:
+        context = create_shared_context(optimized, job_description, cache=CONTEXT_CACHING)
+        prefetch_tasks(context, missing)
+
+    cover_letter = text_field('cover_letter') or generate_cover_letter_with_ai(optimized, job_description, company_name, context)
+    results = {
+        'optimized_resume': optimized_resume,
+        'cover_letter': cover_letter,
+        # The combined report analyzed the combined letter, so a regenerated letter gets its own analysis
+        'cover_letter_ats': ((text_field('cover_letter') and text_field('cover_letter_ats_report'))
+                             or analyze_cover_letter_ats(cover_letter, job_description)),
+        'ats_report': (format_ats_report(findings, text_field('resume_ats_report')) if text_field('resume_ats_report')
+                       else analyze_ats_compliance(optimized, job_description, context)),
+        'interview_prep': (with_interview_prep_heading(text_field('interview_prep')) if text_field('interview_prep')
+                           else generate_interview_prep(optimized, job_description, context))
+    }
+    return results, None
+
+def run_optimization_pipeline(resume_data, job_description, target_role, company_name, mode=None, rewrite=None):
+    """Run one optimization in the given pipeline and rewrite modes and return (results, error).
+
+    Rewriting only weak bullets needs its own optimize call, so it always runs the fan-out pipeline.
+    """
+    resume_data = as_resume(resume_data)
+    rewrite = rewrite or REWRITE_MODE
+    if (mode or PIPELINE_MODE) == "one_shot" and rewrite == 'full':
+        return run_one_shot_pipeline(resume_data, job_description, target_role, company_name)
+    return run_fan_out_pipeline(resume_data, job_description, target_role, company_name, rewrite)
+
+MINHASH_PERMUTATIONS = 128
+# 32 bands of 4 rows make any pair above ~0.6 similarity a candidate; candidates are then checked against the threshold
+LSH_BANDS = 32
+JD_SHINGLE_WORDS = 3
+JD_RESULT_CACHE_SIZE = 256
+_minhash_rng = np.random.default_rng(2024)
+MINHASH_A = _minhash_rng.integers(1, 2**63, size=MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+MINHASH_B = _minhash_rng.integers(0, 2**63, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+def jd_minhash(job_description):
+    """MinHash signature over word 3-gram shingles of the preprocessed job description, so boilerplate never counts"""
+    words = re.findall(r"\w+", preprocess_job_description(job_description).text().lower())
+    shingles = {" ".join(words[i:i + JD_SHINGLE_WORDS]) for i in range(max(1, len(words) - JD_SHINGLE_WORDS + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    # Multiply-shift hashing: uint64 arithmetic wraps, the high 32 bits are the permuted value
+    return ((hashes[:, None] * MINHASH_A + MINHASH_B) >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+def jd_band_keys(namespace, signature):
+    return [(namespace, band, rows.tobytes()) for band, rows in enumerate(signature.reshape(LSH_BANDS, -1))]
+
+@st.cache_resource
+def _jd_result_index():
+    """Pipeline results shared by every session, found by exact job description hash or through LSH buckets"""
+    return {'entries': OrderedDict(), 'buckets': {}, 'stats': {'lookups': 0, 'exact': 0, 'near': 0}, 'lock': threading.Lock()}
+
+def find_similar_results(namespace, job_description, signature):
+    """Return (results, similarity) of an earlier run for this namespace and a near-duplicate job description"""
+    index = _jd_result_index()
+    with index['lock']:
+        index['stats']['lookups'] += 1
+        key = (namespace, prompt_hash(job_description))
+        if key in index['entries']:
+            index['stats']['exact'] += 1
+            index['entries'].move_to_end(key)
+            return index['entries'][key]['results'], 1.0
+        candidates = set()
+        for band_key in jd_band_keys(namespace, signature):
+            candidates.update(index['buckets'].get(band_key, ()))
+        similarity, best = max(((float(np.mean(index['entries'][candidate]['signature'] == signature)), candidate)
+                                for candidate in candidates), default=(0.0, None))
+        if best is None or similarity < JD_SIMILARITY_THRESHOLD:
+            return None, similarity
+        index['stats']['near'] += 1
+        index['entries'].move_to_end(best)
+        return index['entries'][best]['results'], similarity
+
+def remember_results(namespace, job_description, signature, results):
+    index = _jd_result_index()
+    key = (namespace, prompt_hash(job_description))
+    band_keys = jd_band_keys(namespace, signature)
+    with index['lock']:
+        index['entries'][key] = {'signature': signature, 'results': copy.deepcopy(results), 'bands': band_keys}
+        index['entries'].move_to_end(key)
+        for band_key in band_keys:
+            index['buckets'].setdefault(band_key, set()).add(key)
+        while len(index['entries']) > JD_RESULT_CACHE_SIZE:
+            evicted, entry = index['entries'].popitem(last=False)
+            for band_key in entry['bands']:
+                bucket = index['buckets'].get(band_key)
+                if bucket is not None:
+                    bucket.discard(evicted)
+                    if not bucket:
+                        del index['buckets'][band_key]
+
+def jd_reuse_stats():
+    stats = dict(_jd_result_index()['stats'])
+    stats['hit_rate'] = (stats['exact'] + stats['near']) / stats['lookups'] if stats['lookups'] else 0.0
+    return stats
+
+def results_complete(results):
+    """Whether every artifact was generated; failed text steps come back as '' or an 'Error generating' message"""
+    return all(value and not (isinstance(value, str) and value.startswith("Error generating")) for value in results.values())
+
+def run_deduplicated_pipeline(resume_data, job_description, target_role, company_name, mode=None, rewrite=None, reuse=True):
+    """Run the pipeline unless this resume was already optimized for the same or a near-duplicate job description.
+
+    Returns (results, error, similarity); similarity is set when earlier results were reused. Only complete results
+    are remembered, and reuse=False always runs the pipeline, replacing what was remembered for this job description.
+    """
+    namespace = prompt_hash(json.dumps([as_resume(resume_data).content_hash(), target_role, company_name,
+                                        rewrite or REWRITE_MODE, prompt_set_version()]))
+    signature = jd_minhash(job_description)
+    if reuse:
+        results, similarity = find_similar_results(namespace, job_description, signature)
+        if results is not None:
+            return copy.deepcopy(results), None, similarity
+    results, error = run_optimization_pipeline(resume_data, job_description, target_role, company_name, mode, rewrite)
+    if results is not None and results_complete(results):
+        remember_results(namespace, job_description, signature, results)
+    return results, error, None
+
+def run_fan_out_pipeline(resume_data, job_description, target_role, company_name, rewrite=None):
+    """Run every generation step as its own call, the independent ones concurrently, and return (results, error)"""
+    optimized_resume, error = optimize_resume_with_ai(resume_data, job_description, target_role, rewrite)
+    if optimized_resume is None:
+        return None, error
+
+    optimized = Resume.from_dict(optimized_resume)
+    context = create_shared_context(optimized, job_description, cache=CONTEXT_CACHING)
+    prefetch_tasks(context, [
+        ('cover_letter', build_cover_letter_instructions(company_name)),
+        ('resume_ats', build_ats_instructions(local_ats_findings(optimized, job_description))),
+        ('interview_prep', build_interview_prep_instructions())
+    ])
+    cover_letter = generate_cover_letter_with_ai(optimized, job_description, company_name, context)
+    results = {
+        'optimized_resume': optimized_resume,
+        'cover_letter': cover_letter,
+        'cover_letter_ats': analyze_cover_letter_ats(cover_letter, job_description),
+        'ats_report': analyze_ats_compliance(optimized, job_description, context),
+        'interview_prep': generate_interview_prep(optimized, job_description, context)
+    }
+    return results, None
+
+def optimize_and_store(reuse=True):
+    """Optimize the session's resume and store every generated artifact in session state.
+
+    reuse=False regenerates everything instead of reusing results for the same or a similar job description.
+    """
+    filtered_resume = filter_resume_sections(st.session_state.resume_data, st.session_state.selected_sections)
+    results, error, similarity = run_deduplicated_pipeline(
+        filtered_resume,
+        st.session_state.job_description,
+        st.session_state.resume_data['target_role'],
+        st.session_state.company_name,
+        st.session_state.pipeline_mode,
+        st.session_state.rewrite_mode,
+        reuse
+    )
+
+    if results is None:
+        if "API key" in error or "model not initialized" in error or "400" in error or "API_KEY" in error:
+            st.session_state.api_key_valid = False
+            st.session_state.show_api_instructions = True
+            st.rerun()
+        else:
+            st.error(f"Error optimizing resume: {error}")
+    else:
+        for key, value in results.items():
+            set_session_artifact(key, value)
+        st.session_state.pop('interview_prep_error', None)
+        st.session_state.show_comparison = True
+        if not results_complete(results):
+            st.session_state.incomplete_results = True
+        elif st.session_state.get('active_profile'):
+            save_profile_results(
+                st.session_state.active_profile,
+                results_cache_key(filtered_resume, st.session_state.job_description, st.session_state.company_name),
+                results
+            )
+        if similarity is not None:
+            st.toast(f"Reused the results for a {similarity:.0%} similar job description")
+        st.success("✅ Resume optimization completed!")
+        st.rerun()
+
+def profile_slug(name):
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or 'profile'
+
+def profile_path(name):
+    return os.path.join(PROFILE_STORE_DIR, f"{profile_slug(name)}.json")
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_STORE_DIR):
+        return []
+    return sorted(name[:-5] for name in os.listdir(PROFILE_STORE_DIR) if name.endswith('.json'))
+
+def read_profile(name):
+    path = profile_path(name)
+    if not os.path.exists(path):
+        return {'name': name, 'versions': [], 'results': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def read_profile_for_view(name):
+    """read_profile for the saved profiles panel, reusing this session's last read while the file is unchanged"""
+    try:
+        stat = os.stat(profile_path(name))
+    except OSError:
+        return read_profile(name)
+    key = (name, stat.st_mtime_ns, stat.st_size)
+    cached = st.session_state.get('profile_view')
+    if cached is None or cached[0] != key:
+        cached = (key, read_profile(name))
+        st.session_state.profile_view = cached
+    return cached[1]
+
+def profile_export_json(name):
+    """Pretty-printed profile for download, built only when the export button is clicked"""
+    return json.dumps(read_profile(name), indent=2)
+
+def write_profile(profile):
+    """Write a profile atomically so a crash mid-save never leaves a truncated file"""
+    os.makedirs(PROFILE_STORE_DIR, exist_ok=True)
+    path = profile_path(profile['name'])
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(profile, f)
+    os.replace(f"{path}.tmp", path)
+
+def diff_payload(old, new, path=()):
+    """Return the ([path, value] changes, removed paths) that turn old into new, descending into dicts and same-length lists"""
+    changes, removed = [], []
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key in old:
+                child_changes, child_removed = diff_payload(old[key], value, path + (key,))
+                changes += child_changes
+                removed += child_removed
+            else:
+                changes.append([list(path + (key,)), value])
+        removed += [list(path + (key,)) for key in old if key not in new]
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for i, (old_item, new_item) in enumerate(zip(old, new)):
+            child_changes, child_removed = diff_payload(old_item, new_item, path + (i,))
+            changes += child_changes
+            removed += child_removed
+    elif old != new:
+        changes.append([list(path), new])
+    return changes, removed
+
+def apply_delta(payload, delta):
+    """Apply a diff_payload delta in place and return the payload"""
+    for path, value in delta['set']:
+        if not path:
+            return copy.deepcopy(value)
+        target = payload
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] = copy.deepcopy(value)
+    for path in delta['unset']:
+        target = payload
+        for key in path[:-1]:
+            target = target[key]
+        del target[path[-1]]
+    return payload
+
+def profile_payload(profile, version=None):
+    """Rebuild a profile version (1-based, latest by default) from its nearest snapshot and the deltas after it"""
+    versions = profile['versions'][:version or len(profile['versions'])]
+    start = max(i for i, entry in enumerate(versions) if 'snapshot' in entry)
+    payload = copy.deepcopy(versions[start]['snapshot'])
+    for entry in versions[start + 1:]:
+        payload = apply_delta(payload, entry['delta'])
+    return payload
+
+def session_profile_payload():
+    return {
+        'resume_data': st.session_state.resume_data,
+        'job_description': st.session_state.job_description,
+        'company_name': st.session_state.company_name,
+        'selected_sections': list(st.session_state.selected_sections)
+    }
+
+def save_profile_version(name, payload, saved_at=None):
+    """Append payload as a new version of the named profile and return its version number; unchanged payloads are not stored again"""
+    profile = read_profile(name)
+    versions = profile['versions']
+    digest = prompt_hash(json.dumps(payload, sort_keys=True))
+    if versions and versions[-1]['hash'] == digest:
+        return len(versions)
+
+    entry = {'saved_at': saved_at or datetime.now().isoformat(timespec='seconds'), 'hash': digest}
+    if len(versions) % PROFILE_SNAPSHOT_EVERY == 0:
+        entry['snapshot'] = copy.deepcopy(payload)
+    else:
+        changes, removed = diff_payload(profile_payload(profile), payload)
+        entry['delta'] = {'set': changes, 'unset': removed}
+    versions.append(entry)
+    write_profile(profile)
+    return len(versions)
+
+def results_cache_key(filtered_resume, job_description, company_name):
+    """Key optimization results by the resume content hash, a hash of the job and the prompt versions that produced them"""
+    job_hash = prompt_hash(f"{company_name}\n{job_description}")
+    return f"{as_resume(filtered_resume).content_hash()[:16]}:{job_hash[:16]}:{prompt_set_version()}"
+
+def save_profile_results(name, key, results):
+    profile = read_profile(name)
+    if not profile['versions']:
+        return
+    profile['results'].pop(key, None)
+    profile['results'][key] = {field: results[field] for field in PROFILE_RESULT_FIELDS}
+    while len(profile['results']) > PROFILE_MAX_RESULTS:
+        del profile['results'][next(iter(profile['results']))]
+    write_profile(profile)
+
+def load_profile_into_session(name, version=None):
+    """Restore a saved profile version and any results cached for it without calling the model"""
+    profile = read_profile(name)
+    if not profile['versions']:
+        st.session_state.profile_status = ('error', f"Profile '{name}' not found")
+        return
+    payload, error = normalize_profile_payload(profile_payload(profile, version))
+    if error:
+        st.session_state.profile_status = ('error', f"Profile '{name}' could not be loaded: {error}")
+        return
+
+    for key in [key for key in st.session_state if isinstance(key, str) and EDITOR_WIDGET_KEY.match(key)]:
+        del st.session_state[key]
+    for label, key in SECTION_CHECKBOXES.items():
+        st.session_state[key] = label in payload['selected_sections']
+
+    st.session_state.resume_data = payload['resume_data']
+    st.session_state.job_description = payload['job_description']
+    st.session_state.company_name = payload['company_name']
+    st.session_state.selected_sections = payload['selected_sections']
+    st.session_state.active_profile = profile['name']
+
+    filtered_resume = filter_resume_sections(payload['resume_data'], payload['selected_sections'])
+    cached = profile['results'].get(results_cache_key(filtered_resume, payload['job_description'], payload['company_name']))
+    for key in PROFILE_RESULT_FIELDS:
+        set_session_artifact(key, cached[key] if cached else SESSION_ARTIFACT_DEFAULTS[key])
+    st.session_state.show_comparison = bool(cached)
+    version_label = version or len(profile['versions'])
+    st.session_state.profile_status = (
+        'success', f"Loaded '{profile['name']}' v{version_label}" + (" with cached results" if cached else "")
+    )
+
+def normalize_profile_payload(payload):
+    """Return (payload, error): a profile payload with its resume completed and its other fields coerced, or why it is unusable"""
+    if not isinstance(payload, dict):
+        return None, "version must be a JSON object"
+    errors = validate_resume_data(payload.get('resume_data'))
+    if errors:
+        return None, "; ".join(errors[:5])
+    labels = [label for label, _, _ in RESUME_SECTIONS]
+    sections = payload.get('selected_sections')
+    if isinstance(sections, list):
+        sections = [label for label in labels if label in sections]
+    else:
+        sections = [label for label, key, _ in RESUME_SECTIONS if key in payload['resume_data']]
+    return {
+        'resume_data': complete_resume_data(payload['resume_data']),
+        'job_description': _coerce_string(payload.get('job_description')),
+        'company_name': _coerce_string(payload.get('company_name')),
+        'selected_sections': sections
+    }, None
+
+def imported_results(results):
+    """The cached results of an imported profile that are shaped like ones save_profile_results writes"""
+    if not isinstance(results, dict):
+        return {}
+    return {key: entry for key, entry in results.items()
+            if isinstance(entry, dict) and all(field in entry for field in PROFILE_RESULT_FIELDS)
+            and (entry['optimized_resume'] is None or not validate_resume_data(entry['optimized_resume']))
+            and all(isinstance(entry[field], str) for field in PROFILE_RESULT_FIELDS if field != 'optimized_resume')}
+
+def import_profile(text):
+    """Import an exported profile, or a bare resume_data JSON object, into the store and return (name, error).
+
+    Every version is rebuilt and saved again through save_profile_version, so nothing from the file is stored unchecked.
+    """
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        return None, f"Invalid JSON: {e}"
+    if not isinstance(data, dict):
+        return None, "Profile must be a JSON object"
+
+    if 'versions' in data:
+        if not isinstance(data['versions'], list) or not data['versions']:
+            return None, "Profile has no versions"
+        payloads = []
+        for number in range(1, len(data['versions']) + 1):
+            try:
+                payload, error = normalize_profile_payload(profile_payload(data, number))
+            except (KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+                payload, error = None, f"corrupt history ({e})"
+            if error:
+                return None, f"Version {number}: {error}"
+            saved_at = data['versions'][number - 1].get('saved_at')
+            payloads.append((payload, saved_at if isinstance(saved_at, str) else None))
+        name = _coerce_string(data.get('name')).strip() or 'imported'
+        results = imported_results(data.get('results'))
+    else:
+        payload, error = normalize_profile_payload({'resume_data': data})
+        if error:
+            return None, error
+        payloads = [(payload, None)]
+        name = _coerce_string((data.get('contact_info') or {}).get('name')).strip() or 'imported'
+        results = {}
+
+    # A new profile keeps the imported history; an existing one only gains the latest version
+    for payload, saved_at in payloads if not os.path.exists(profile_path(name)) else payloads[-1:]:
+        save_profile_version(name, payload, saved_at)
+    profile = read_profile(name)
+    profile['results'].update(results)
+    write_profile(profile)
+    return name, None
+
+def show_profiles():
+    with st.expander("💾 Saved Profiles"):
+        if st.session_state.get('profile_status'):
+            kind, message = st.session_state.pop('profile_status')
+            getattr(st, kind)(message)
+
+        default_name = st.session_state.get('active_profile') or st.session_state.resume_data['contact_info']['name']
+        name = st.text_input(
+            "Profile Name",
+            key="profile_name",
+            placeholder=default_name or "e.g. Backend roles",
+            help="Leave empty to save to the current profile or under your name"
+        ).strip() or default_name.strip()
+        if st.button("Save Profile", use_container_width=True):
+            if not name:
+                st.error("Please enter a profile name")
+                return
+            version = save_profile_version(name, session_profile_payload())
+            st.session_state.active_profile = name
+            if session_artifact('optimized_resume'):
+                filtered_resume = filter_resume_sections(st.session_state.resume_data, st.session_state.selected_sections)
+                save_profile_results(
+                    name,
+                    results_cache_key(filtered_resume, st.session_state.job_description, st.session_state.company_name),
+                    {field: session_artifact(field) for field in PROFILE_RESULT_FIELDS}
+                )
+            st.success(f"Saved '{name}' v{version}")
+
+        profiles = list_profiles()
+        if not profiles:
+            st.caption("No saved profiles yet")
+        else:
+            selected = st.selectbox("Profile", options=profiles, key="profile_select")
+            profile = read_profile_for_view(selected)
+            versions = profile['versions']
+            version = st.selectbox(
+                "Version",
+                options=list(range(len(versions), 0, -1)),
+                format_func=lambda v: f"v{v} · {versions[v - 1]['saved_at'].replace('T', ' ')}",
+                key="profile_version_select"
+            )
+            st.button(
+                "Load Profile",
+                use_container_width=True,
+                on_click=load_profile_into_session,
+                args=(profile['name'], version)
+            )
+            st.download_button(
+                label="📤 Export Profile (JSON)",
+                data=functools.partial(profile_export_json, selected),
+                file_name=f"{selected}.json",
+                mime="application/json",
+                use_container_width=True
+            )
+
+        uploaded = st.file_uploader("Import Profile", type=['json'], key="profile_import")
+        if uploaded is not None and st.button("Import", use_container_width=True):
+            imported, error = import_profile(uploaded.getvalue().decode('utf-8'))
+            if error:
+                st.error(f"Could not import profile: {error}")
+            else:
+                st.success(f"Imported '{imported}'")
+
 def contact_info_form():
     st.subheader("Contact Information")
     cols = st.columns([1, 1])
@@ -850,6 +4351,107 @@ def job_info_form():
         key="job_desc_input",
         help="Paste the job description you're applying for"
     )
+    if JD_PREPROCESSING and st.session_state.job_description.strip():
+        posting = preprocess_job_description(st.session_state.job_description)
+        chars = posting.segment_chars()
+        sent = sum(chars.get(segment, 0) for segment in JD_PROMPT_SEGMENTS)
+        found = ", ".join(f"{segment.replace('_', ' ')} {count}" for segment, count in chars.items())
+        st.caption(f"Prompts get {sent:,} of {posting.source_chars:,} characters; boilerplate and repeated lines are left out ({found} chars)")
+
+def keyword_coverage_meter():
+    """Live share of the job description's key phrases that appear in the resume, with the missing ones"""
+    if not st.session_state.job_description.strip():
+        return
+    matcher, found = keyword_coverage(st.session_state.resume_data, st.session_state.job_description)
+    if not matcher.keywords:
+        return
+    coverage = len(found) / len(matcher.keywords)
+    st.progress(coverage, text=f"JD keyword coverage: {len(found)}/{len(matcher.keywords)} ({coverage:.0%})")
+    missing = [keyword for index, keyword in enumerate(matcher.keywords) if index not in found]
+    if missing:
+        st.caption("Missing: " + " ".join(f"`{keyword}`" for keyword in missing))
+    if 'keyword_scan_us' in st.session_state:
+        st.caption(f"Last field rescan: {st.session_state.keyword_scan_us:.0f} µs")
+
+def position_keyword_caption(i):
+    """Keywords matched by one position, rescanned when that position is updated"""
+    if not st.session_state.job_description.strip():
+        return
+    matcher = get_keyword_matcher(st.session_state.job_description)
+    fields = resume_keyword_fields({'work_experience': st.session_state.resume_data['work_experience'][i:i + 1]})
+    found = keyword_field_hits(matcher, f'position_{i}', fields['position_0'])
+    if found:
+        st.caption("JD keywords: " + ", ".join(matcher.keywords[index] for index in sorted(found)))
+
+def session_lint_findings():
+    """Lint findings for the session's resume and how long linting took, recomputed only when the resume changes"""
+    resume = Resume.from_dict(st.session_state.resume_data)
+    cached = st.session_state.get('lint_findings')
+    if cached is None or cached[0] != resume.content_hash():
+        started = time.perf_counter()
+        findings = lint_resume(resume)
+        cached = (resume.content_hash(), findings, (time.perf_counter() - started) * 1e6)
+        st.session_state.lint_findings = cached
+    return cached[1], cached[2]
+
+def session_page_fit():
+    """Fit-to-page plan summary for the session's resume, replanned only when the resume, layout or job description changes"""
+    resume = Resume.from_dict(st.session_state.resume_data)
+    key = (resume.content_hash(), st.session_state.resume_template, st.session_state.resume_page_size,
+           prompt_hash(st.session_state.job_description))
+    cached = st.session_state.get('page_fit')
+    if cached is None or cached[0] != key:
+        plan = plan_resume_fit(st.session_state.resume_data, st.session_state.resume_template,
+                               st.session_state.resume_page_size, st.session_state.job_description)
+        cached = (key, plan.fits, describe_fit(plan.layout.scale, plan.layout.spacing, plan.dropped), plan.measure_ms + plan.search_ms)
+        st.session_state.page_fit = cached
+    return cached[1], cached[2], cached[3]
+
+def page_fit_indicator():
+    """Whether the resume being built fits one page with the chosen template, and what fitting it would take"""
+    resume_data = st.session_state.resume_data
+    if not resume_data.get('work_experience') and not resume_data.get('professional_summary'):
+        return
+    fits, changes, millis = session_page_fit()
+    template = RESUME_TEMPLATES[st.session_state.resume_template]['label']
+    if fits and not changes:
+        st.caption(f"📄 Fits on one {st.session_state.resume_page_size} page as the {template} template · checked in {millis:.0f} ms")
+    elif fits:
+        st.caption(f"📄 Fits on one {st.session_state.resume_page_size} page as the {template} template with fit-to-page: "
+                   f"{changes} · checked in {millis:.0f} ms")
+    else:
+        st.caption(f"📄 Too long for one {st.session_state.resume_page_size} page as the {template} template, even with fit-to-page "
+                   f"· checked in {millis:.0f} ms")
+
+def lint_location(finding):
+    return f"Bullet {finding.bullet + 1}" if finding.bullet is not None else ("Dates" if finding.section == 'work_experience' else "Description")
+
+def resume_lint_panel():
+    """Per-bullet linter findings across work experience and projects"""
+    resume_data = st.session_state.resume_data
+    if not resume_data.get('work_experience') and not resume_data.get('projects'):
+        return
+    findings, micros = session_lint_findings()
+    with st.expander(f"🧹 Resume Linter: {len(findings)} finding{'s' if len(findings) != 1 else ''}", expanded=False):
+        st.caption(f"Checked every bullet in {micros:.0f} µs")
+        if not findings:
+            st.markdown("No issues found")
+        for (section, entry), entry_findings in itertools.groupby(
+            sorted(findings, key=lambda f: (f.section != 'work_experience', f.entry, f.bullet if f.bullet is not None else -1)),
+            key=lambda f: (f.section, f.entry)
+        ):
+            item = resume_data[section][entry]
+            title = f"{item.get('job_title', '')} at {item.get('company', '')}" if section == 'work_experience' else item.get('name', 'Project')
+            st.markdown(f"**{title}**")
+            st.markdown("\n".join(f"- {lint_location(finding)}: {finding.message}" for finding in entry_findings))
+
+def position_lint_caption(i):
+    """Linter findings for one position, refreshed when that position is updated"""
+    findings, _ = session_lint_findings()
+    messages = [f"{lint_location(finding)}: {finding.message}" for finding in findings
+                if finding.section == 'work_experience' and finding.entry == i]
+    if messages:
+        st.caption("⚠️ " + " · ".join(messages))
 
 def professional_summary_form():
     st.subheader("Professional Summary")
@@ -860,176 +4462,314 @@ def professional_summary_form():
         key="summary_input"
     )
 
-def work_experience_form():
-    st.subheader("Work Experience")
+def live_panels_key():
+    """What the keyword meter, linter and page fit indicator depend on"""
+    return (Resume.from_dict(st.session_state.resume_data).content_hash(), prompt_hash(st.session_state.job_description),
+            st.session_state.resume_template, st.session_state.resume_page_size)
 
-    if 'resume_data' not in st.session_state:
-        st.session_state.resume_data = {'work_experience': []}
-
-    if 'reset_new_position_form' not in st.session_state:
-        st.session_state.reset_new_position_form = False
-    if st.session_state.reset_new_position_form:
-        st.session_state["new_job_title_input"] = ""
-        st.session_state["new_company_input"] = ""
-        st.session_state["new_dates_input"] = ""
-        st.session_state["new_location_input"] = ""
-        st.session_state["new_achievements_input"] = ""
-        st.session_state.reset_new_position_form = False 
+def live_panels_stale():
+    return st.session_state.get('live_panels_key') != live_panels_key()
 
-    with st.expander("Add New Position", expanded=False):
-        cols = st.columns([1, 1])
-        with cols[0]:
-            new_job_title = st.text_input("Job Title", key="new_job_title_input")
-            new_company = st.text_input("Company", key="new_company_input")
-            new_dates = st.text_input("Dates (e.g., Jan 2020 - Present)", key="new_dates_input")
-        with cols[1]:
-            new_location = st.text_input("Location", key="new_location_input")
-            new_achievements = st.text_area(
-                "Achievements (one per line)",
-                height=100,
-                key="new_achievements_input",
-                help="Focus on quantifiable results and impact"
+def section_fragment(fn):
+    """Run a section editor as an st.fragment so its buttons only rerun that editor, timing fragment-only reruns.
+
+    A fragment rerun that changes the resume reruns the app so the live panels outside the editors catch up.
+    """
+    @functools.wraps(fn)
+    def timed_editor(*args, **kwargs):
+        fragment_only = is_fragment_run()
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            if fragment_only:
+                record_run_time('fragment', time.perf_counter() - started)
+        if fragment_only and live_panels_stale():
+            st.rerun()
+        return result
+    return st.fragment(timed_editor)
+
+def is_fragment_run():
+    ctx = get_script_run_ctx()
+    return bool(ctx is not None and getattr(ctx, 'fragment_ids_this_run', None))
+
+def rerun_section():
+    """Rerun only the current section editor, or the whole app when not inside a fragment rerun or the live panels are stale"""
+    if is_fragment_run() and not live_panels_stale():
+        st.rerun(scope="fragment")
+    st.rerun()
+
+def render_interview_prep(resume, job_description, answers):
+    """Show each interview prep section, with a sample answer per question as soon as it is ready"""
+    markdown = session_artifact('interview_prep')
+    sections = interview_prep_sections(markdown)
+    if not sections:
+        st.markdown(markdown)
+        return
+    for heading, questions, body in sections:
+        st.markdown(f"#### {heading}")
+        if heading not in ANSWERED_INTERVIEW_SECTIONS or not questions:
+            st.markdown(body)
+            continue
+        for i, question in enumerate(questions):
+            with st.expander(question):
+                future = answers.get(question)
+                if future is None and not get_model():
+                    st.caption("Enter a valid API key to generate sample answers")
+                elif future is None:
+                    if st.button("✍️ Write a sample answer", key=f"write_answer_{heading}_{i}"):
+                        st.session_state.setdefault('requested_answers', set()).add(question)
+                        st.rerun()
+                elif not future.done():
+                    st.caption("⏳ Writing a sample answer...")
+                elif future.cancelled() or future.exception() is not None:
+                    st.warning(f"Could not generate a sample answer: {future.exception() if not future.cancelled() else 'cancelled'}")
+                    if st.button("Retry", key=f"retry_answer_{heading}_{i}"):
+                        forget_interview_answer(resume, job_description, question)
+                        st.rerun()
+                else:
+                    st.markdown(future.result())
+
+def show_interview_prep():
+    """Render the question list right away and poll in a fragment until every requested sample answer has arrived"""
+    resume = Resume.from_dict(session_artifact('optimized_resume'))
+    job_description = st.session_state.job_description
+    answers = interview_prep_answers(resume, job_description, session_artifact('interview_prep'))
+    pending = any(not future.done() for future in answers.values())
+
+    @st.fragment(run_every=1.0 if pending else None)
+    def interview_answers():
+        current = interview_prep_answers(resume, job_description, session_artifact('interview_prep')) if is_fragment_run() else answers
+        render_interview_prep(resume, job_description, current)
+        if is_fragment_run() and all(future.done() for future in current.values()):
+            # Stop polling: a full rerun redraws the fragment without run_every and refreshes the downloads
+            st.rerun()
+    interview_answers()
+    return answers
+
+def show_report_downloads(markdown, title, file_stem):
+    """PDF and DOCX download buttons for a markdown report; a format that fails to render gets a message instead"""
+    name = st.session_state.resume_data['contact_info']['name'].replace(' ', '_') or "report"
+    formats = (
+        ('pdf', "📥 Download (PDF)", "application/pdf"),
+        ('docx', "📄 Download (DOCX)", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+    )
+    for column, (kind, label, mime) in zip(st.columns(2), formats):
+        with column:
+            try:
+                data = export_markdown_report(markdown, title, kind)
+            except Exception as e:
+                st.warning(f"Could not render this report as {kind.upper()}: {e}")
+                continue
+            st.download_button(
+                label=label,
+                data=data,
+                file_name=f"{file_stem}_{name}.{kind}",
+                mime=mime,
+                key=f"{file_stem}_{kind}",
+                use_container_width=True
             )
 
-        if st.button("Add Position", key="add_position"):
-            if new_job_title or new_company:
-                st.session_state.resume_data['work_experience'].append({
-                    'job_title': new_job_title,
-                    'company': new_company,
-                    'dates': new_dates,
-                    'location': new_location,
-                    'achievements': [a.strip() for a in new_achievements.split('\n') if a.strip()]
-                })
-                st.session_state.reset_new_position_form = True
-                st.rerun()
-    for i, exp in enumerate(st.session_state.resume_data['work_experience']):
-        with st.expander(f"{exp.get('job_title', 'Untitled')} at {exp.get('company', 'Unknown')}", expanded=False):
+def record_run_time(scope, seconds):
+    if 'run_profile' not in st.session_state:
+        st.session_state.run_profile = {'full': deque(maxlen=50), 'fragment': deque(maxlen=50)}
+    st.session_state.run_profile[scope].append(seconds)
+
+def show_session_memory():
+    """Show this session's footprint and the artifact store's memory and disk use across sessions"""
+    session_id = current_session_id()
+    totals = artifact_store_totals()
+    if not totals['blobs']:
+        return
+    artifacts = st.session_state.artifacts
+    state_bytes = sum(approx_size(value) for key, value in st.session_state.items() if key != 'artifacts'
+                      and isinstance(value, (str, bytes, dict, list, tuple, int, float, bool, type(None))))
+    with st.expander("Session Memory", expanded=False):
+        st.caption(f"This session: {state_bytes / 1024:.1f} KB in session state, "
+                   f"{sum(handle.size for handle in artifacts.values()) / 1024:.1f} KB in {len(artifacts)} stored artifacts")
+        st.caption(f"Artifact store: {totals['memory_bytes'] / 1024 ** 2:.1f} of {ARTIFACT_MEMORY_MB:g} MB in memory, "
+                   f"{totals['disk_bytes'] / 1024 ** 2:.1f} MB on disk across {totals['sessions']} sessions")
+        st.table([dict(row, owner=f"{row['owner']} (you)" if session_id and row['owner'] == session_id[:8] else row['owner'])
+                  for row in artifact_memory_report()])
+
+def show_run_profile():
+    """Compare full script runs with fragment-only section editor reruns"""
+    profile = st.session_state.get('run_profile')
+    if not profile or not profile['full']:
+        return
+    resume = st.session_state.resume_data
+    entries = sum(len(resume.get(key, [])) for key in ('work_experience', 'education', 'projects'))
+    full_ms = sum(profile['full']) / len(profile['full']) * 1000
+    with st.expander("Performance", expanded=False):
+        st.markdown(f"**Full script run:** {full_ms:.0f} ms avg over {len(profile['full'])} runs")
+        if profile['fragment']:
+            fragment_ms = sum(profile['fragment']) / len(profile['fragment']) * 1000
+            saved_ms = full_ms - fragment_ms
+            st.markdown(f"**Section editor rerun:** {fragment_ms:.0f} ms avg over {len(profile['fragment'])} edits")
+            st.markdown(f"**Saved per edit:** {saved_ms:.0f} ms ({saved_ms / full_ms * 100:.0f}%) with {entries} entries")
+        else:
+            st.caption(f"Edit a section to compare editor reruns with full runs ({entries} entries)")
+
+def _split_lines(text):
+    return [line.strip() for line in text.split('\n') if line.strip()]
+
+def _split_commas(text):
+    return [item.strip() for item in text.split(',') if item.strip()]
+
+@section_fragment
+def work_experience_form():
+    st.subheader("Work Experience")
+
+    with st.expander("Add New Position", expanded=False):
+        with st.form("add_position_form", clear_on_submit=True, border=False):
             cols = st.columns([1, 1])
             with cols[0]:
-                updated_job_title = st.text_input(
-                    "Job Title",
-                    value=exp.get('job_title', ''),
-                    key=f"job_title_{i}"
-                )
-                updated_company = st.text_input(
-                    "Company",
-                    value=exp.get('company', ''),
-                    key=f"company_{i}"
-                )
-                updated_dates = st.text_input(
-                    "Dates",
-                    value=exp.get('dates', ''),
-                    key=f"dates_{i}"
-                )
+                new_job_title = st.text_input("Job Title", key="new_job_title_input")
+                new_company = st.text_input("Company", key="new_company_input")
+                new_dates = st.text_input("Dates (e.g., Jan 2020 - Present)", key="new_dates_input")
             with cols[1]:
-                updated_location = st.text_input(
-                    "Location",
-                    value=exp.get('location', ''),
-                    key=f"location_{i}"
-                )
-                updated_achievements = st.text_area(
-                    "Achievements",
-                    value="\n".join(exp.get('achievements', [])),
+                new_location = st.text_input("Location", key="new_location_input")
+                new_achievements = st.text_area(
+                    "Achievements (one per line)",
                     height=100,
-                    key=f"achievements_{i}"
+                    key="new_achievements_input",
+                    help="Focus on quantifiable results and impact"
                 )
 
-            cols = st.columns([1, 1])
-            with cols[0]:
-                if st.button("Update", key=f"update_{i}"):
-                    st.session_state.resume_data['work_experience'][i] = {
-                        'job_title': updated_job_title,
-                        'company': updated_company,
-                        'dates': updated_dates,
-                        'location': updated_location,
-                        'achievements': [a.strip() for a in updated_achievements.split('\n') if a.strip()]
-                    }
-                    st.rerun()
-            with cols[1]:
-                if st.button("Remove", key=f"remove_{i}"):
-                    st.session_state.resume_data['work_experience'].pop(i)
-                    st.rerun()
+            if st.form_submit_button("Add Position"):
+                if new_job_title or new_company:
+                    st.session_state.resume_data['work_experience'].append({
+                        'job_title': new_job_title,
+                        'company': new_company,
+                        'dates': new_dates,
+                        'location': new_location,
+                        'achievements': _split_lines(new_achievements)
+                    })
+                    rerun_section()
+
+    for i, exp in enumerate(st.session_state.resume_data['work_experience']):
+        with st.expander(f"{exp.get('job_title', 'Untitled')} at {exp.get('company', 'Unknown')}", expanded=False):
+            position_keyword_caption(i)
+            position_lint_caption(i)
+            with st.form(f"position_form_{i}", border=False):
+                cols = st.columns([1, 1])
+                with cols[0]:
+                    updated_job_title = st.text_input(
+                        "Job Title",
+                        value=exp.get('job_title', ''),
+                        key=f"job_title_{i}"
+                    )
+                    updated_company = st.text_input(
+                        "Company",
+                        value=exp.get('company', ''),
+                        key=f"company_{i}"
+                    )
+                    updated_dates = st.text_input(
+                        "Dates",
+                        value=exp.get('dates', ''),
+                        key=f"dates_{i}"
+                    )
+                with cols[1]:
+                    updated_location = st.text_input(
+                        "Location",
+                        value=exp.get('location', ''),
+                        key=f"location_{i}"
+                    )
+                    updated_achievements = st.text_area(
+                        "Achievements",
+                        value="\n".join(exp.get('achievements', [])),
+                        height=100,
+                        key=f"achievements_{i}"
+                    )
+
+                cols = st.columns([1, 1])
+                with cols[0]:
+                    if st.form_submit_button("Update", key=f"update_{i}"):
+                        st.session_state.resume_data['work_experience'][i] = {
+                            'job_title': updated_job_title,
+                            'company': updated_company,
+                            'dates': updated_dates,
+                            'location': updated_location,
+                            'achievements': _split_lines(updated_achievements)
+                        }
+                        rerun_section()
+                with cols[1]:
+                    if st.form_submit_button("Remove", key=f"remove_{i}"):
+                        st.session_state.resume_data['work_experience'].pop(i)
+                        rerun_section()
 
 
+@section_fragment
 def education_form():
     st.subheader("Education")
-    
-    if 'resume_data' not in st.session_state:
-        st.session_state.resume_data = {}
+
     if 'education' not in st.session_state.resume_data:
         st.session_state.resume_data['education'] = []
-    if 'reset_new_education_form' not in st.session_state:
-        st.session_state.reset_new_education_form = False
-
-    if st.session_state.reset_new_education_form:
-        st.session_state["new_degree"] = ""
-        st.session_state["new_institution"] = ""
-        st.session_state["new_year"] = ""
-        st.session_state["new_honors"] = ""
-        st.session_state.reset_new_education_form = False
 
     with st.expander("Add Education", expanded=False):
-        cols = st.columns([1, 1])
-        with cols[0]:
-            new_degree = st.text_input("Degree", key="new_degree")
-            new_institution = st.text_input("Institution", key="new_institution")
-        with cols[1]:
-            new_year = st.text_input("Year", key="new_year")
-            new_honors = st.text_input("Honors/Awards (optional)", key="new_honors")
-        
-        if st.button("Add Education", key="add_education"):
-            if new_degree or new_institution:
-                st.session_state.resume_data['education'].append({
-                    'degree': new_degree,
-                    'institution': new_institution,
-                    'year': new_year,
-                    'honors': new_honors
-                })
-                st.session_state.reset_new_education_form = True
-                st.rerun()
-
-    for i, edu in enumerate(st.session_state.resume_data['education']):
-        with st.expander(f"{edu.get('degree', 'Degree')} from {edu.get('institution', 'Institution')}", expanded=False):
-            cols = st.columns([1, 1])
-            with cols[0]:
-                updated_degree = st.text_input(
-                    "Degree", 
-                    value=edu.get('degree', ''),
-                    key=f"degree_{i}"
-                )
-                updated_institution = st.text_input(
-                    "Institution", 
-                    value=edu.get('institution', ''),
-                    key=f"institution_{i}"
-                )
-            with cols[1]:
-                updated_year = st.text_input(
-                    "Year", 
-                    value=edu.get('year', ''),
-                    key=f"year_{i}"
-                )
-                updated_honors = st.text_input(
-                    "Honors/Awards", 
-                    value=edu.get('honors', ''),
-                    key=f"honors_{i}"
-                )
-            
+        with st.form("add_education_form", clear_on_submit=True, border=False):
             cols = st.columns([1, 1])
             with cols[0]:
-                if st.button("Update", key=f"update_edu_{i}"):
-                    st.session_state.resume_data['education'][i] = {
-                        'degree': updated_degree,
-                        'institution': updated_institution,
-                        'year': updated_year,
-                        'honors': updated_honors
-                    }
-                    st.rerun()
+                new_degree = st.text_input("Degree", key="new_degree")
+                new_institution = st.text_input("Institution", key="new_institution")
             with cols[1]:
-                if st.button("Remove", key=f"remove_edu_{i}"):
-                    st.session_state.resume_data['education'].pop(i)
-                    st.rerun()
+                new_year = st.text_input("Year", key="new_year")
+                new_honors = st.text_input("Honors/Awards (optional)", key="new_honors")
 
+            if st.form_submit_button("Add Education"):
+                if new_degree or new_institution:
+                    st.session_state.resume_data['education'].append({
+                        'degree': new_degree,
+                        'institution': new_institution,
+                        'year': new_year,
+                        'honors': new_honors
+                    })
+                    rerun_section()
 
+    for i, edu in enumerate(st.session_state.resume_data['education']):
+        with st.expander(f"{edu.get('degree', 'Degree')} from {edu.get('institution', 'Institution')}", expanded=False):
+            with st.form(f"education_form_{i}", border=False):
+                cols = st.columns([1, 1])
+                with cols[0]:
+                    updated_degree = st.text_input(
+                        "Degree", 
+                        value=edu.get('degree', ''),
+                        key=f"degree_{i}"
+                    )
+                    updated_institution = st.text_input(
+                        "Institution", 
+                        value=edu.get('institution', ''),
+                        key=f"institution_{i}"
+                    )
+                with cols[1]:
+                    updated_year = st.text_input(
+                        "Year", 
+                        value=edu.get('year', ''),
+                        key=f"year_{i}"
+                    )
+                    updated_honors = st.text_input(
+                        "Honors/Awards", 
+                        value=edu.get('honors', ''),
+                        key=f"honors_{i}"
+                    )
+
+                cols = st.columns([1, 1])
+                with cols[0]:
+                    if st.form_submit_button("Update", key=f"update_edu_{i}"):
+                        st.session_state.resume_data['education'][i] = {
+                            'degree': updated_degree,
+                            'institution': updated_institution,
+                            'year': updated_year,
+                            'honors': updated_honors
+                        }
+                        rerun_section()
+                with cols[1]:
+                    if st.form_submit_button("Remove", key=f"remove_edu_{i}"):
+                        st.session_state.resume_data['education'].pop(i)
+                        rerun_section()
+
+
+@section_fragment
 def skills_form():
     st.subheader("Skills")
     if not isinstance(st.session_state.resume_data['skills'], dict):
@@ -1037,294 +4777,248 @@ def skills_form():
             'Technical': [],
             'Soft': []
         }
-    
-    current_tech_skills = ", ".join(st.session_state.resume_data['skills'].get('Technical', []))
-    updated_tech_skills = st.text_area(
-        "Technical Skills (comma separated)", 
-        value=current_tech_skills,
-        height=60,
-        key="tech_skills_input",
-        help="List your technical skills and technologies"
-    )
-    
-    current_soft_skills = ", ".join(st.session_state.resume_data['skills'].get('Soft', []))
-    updated_soft_skills = st.text_area(
-        "Soft Skills (comma separated)", 
-        value=current_soft_skills,
-        height=60,
-        key="soft_skills_input",
-        help="List your soft skills and personal attributes"
-    )
-    
-    if st.button("Save Skills", key="save_skills"):
-        st.session_state.resume_data['skills'] = {
-            'Technical': [s.strip() for s in updated_tech_skills.split(',') if s.strip()],
-            'Soft': [s.strip() for s in updated_soft_skills.split(',') if s.strip()]
-        }
-        st.rerun()
 
+    with st.form("skills_form", border=False):
+        current_tech_skills = ", ".join(st.session_state.resume_data['skills'].get('Technical', []))
+        updated_tech_skills = st.text_area(
+            "Technical Skills (comma separated)", 
+            value=current_tech_skills,
+            height=60,
+            key="tech_skills_input",
+            help="List your technical skills and technologies"
+        )
+
+        current_soft_skills = ", ".join(st.session_state.resume_data['skills'].get('Soft', []))
+        updated_soft_skills = st.text_area(
+            "Soft Skills (comma separated)", 
+            value=current_soft_skills,
+            height=60,
+            key="soft_skills_input",
+            help="List your soft skills and personal attributes"
+        )
+
+        if st.form_submit_button("Save Skills"):
+            st.session_state.resume_data['skills'] = {
+                'Technical': _split_commas(updated_tech_skills),
+                'Soft': _split_commas(updated_soft_skills)
+            }
+            rerun_section()
+
+@section_fragment
 def projects_form():
     st.subheader("Projects")
 
-    if 'resume_data' not in st.session_state:
-        st.session_state.resume_data = {}
     if 'projects' not in st.session_state.resume_data:
         st.session_state.resume_data['projects'] = []
-    if 'reset_new_project_form' not in st.session_state:
-        st.session_state.reset_new_project_form = False
-
-    if st.session_state.reset_new_project_form:
-        st.session_state["new_project_name"] = ""
-        st.session_state["new_project_desc"] = ""
-        st.session_state["new_project_tech"] = ""
-        st.session_state.reset_new_project_form = False
 
     with st.expander("Add Project", expanded=False):
-        new_project_name = st.text_input("Project Name", key="new_project_name")
-        new_project_desc = st.text_area(
-            "Description", 
-            height=80,
-            key="new_project_desc",
-            help="Describe the project and your role"
-        )
-        new_project_tech = st.text_input(
-            "Technologies (comma separated)", 
-            key="new_project_tech",
-            help="List the technologies/tools used"
-        )
-
-        if st.button("Add Project", key="add_project"):
-            if new_project_name or new_project_desc:
-                st.session_state.resume_data['projects'].append({
-                    'name': new_project_name,
-                    'description': new_project_desc,
-                    'technologies': [t.strip() for t in new_project_tech.split(',') if t.strip()]
-                })
-                st.session_state.reset_new_project_form = True
-                st.rerun()
-
-    for i, proj in enumerate(st.session_state.resume_data['projects']):
-        with st.expander(f"{proj.get('name', 'Untitled Project')}", expanded=False):
-            updated_name = st.text_input(
-                "Project Name", 
-                value=proj.get('name', ''),
-                key=f"project_name_{i}"
-            )
-            updated_desc = st.text_area(
+        with st.form("add_project_form", clear_on_submit=True, border=False):
+            new_project_name = st.text_input("Project Name", key="new_project_name")
+            new_project_desc = st.text_area(
                 "Description", 
-                value=proj.get('description', ''),
                 height=80,
-                key=f"project_desc_{i}"
+                key="new_project_desc",
+                help="Describe the project and your role"
             )
-            updated_tech = st.text_input(
-                "Technologies", 
-                value=", ".join(proj.get('technologies', [])) if proj.get('technologies') else "",
-                key=f"project_tech_{i}"
+            new_project_tech = st.text_input(
+                "Technologies (comma separated)", 
+                key="new_project_tech",
+                help="List the technologies/tools used"
             )
 
-            cols = st.columns([1, 1])
-            with cols[0]:
-                if st.button("Update", key=f"update_proj_{i}"):
-                    st.session_state.resume_data['projects'][i] = {
-                        'name': updated_name,
-                        'description': updated_desc,
-                        'technologies': [t.strip() for t in updated_tech.split(',') if t.strip()]
-                    }
-                    st.rerun()
-            with cols[1]:
-                if st.button("Remove", key=f"remove_proj_{i}"):
-                    st.session_state.resume_data['projects'].pop(i)
-                    st.rerun()
+            if st.form_submit_button("Add Project"):
+                if new_project_name or new_project_desc:
+                    st.session_state.resume_data['projects'].append({
+                        'name': new_project_name,
+                        'description': new_project_desc,
+                        'technologies': _split_commas(new_project_tech)
+                    })
+                    rerun_section()
+
+    for i, proj in enumerate(st.session_state.resume_data['projects']):
+        with st.expander(f"{proj.get('name', 'Untitled Project')}", expanded=False):
+            with st.form(f"project_form_{i}", border=False):
+                updated_name = st.text_input(
+                    "Project Name", 
+                    value=proj.get('name', ''),
+                    key=f"project_name_{i}"
+                )
+                updated_desc = st.text_area(
+                    "Description", 
+                    value=proj.get('description', ''),
+                    height=80,
+                    key=f"project_desc_{i}"
+                )
+                updated_tech = st.text_input(
+                    "Technologies", 
+                    value=", ".join(proj.get('technologies', [])) if proj.get('technologies') else "",
+                    key=f"project_tech_{i}"
+                )
+
+                cols = st.columns([1, 1])
+                with cols[0]:
+                    if st.form_submit_button("Update", key=f"update_proj_{i}"):
+                        st.session_state.resume_data['projects'][i] = {
+                            'name': updated_name,
+                            'description': updated_desc,
+                            'technologies': _split_commas(updated_tech)
+                        }
+                        rerun_section()
+                with cols[1]:
+                    if st.form_submit_button("Remove", key=f"remove_proj_{i}"):
+                        st.session_state.resume_data['projects'].pop(i)
+                        rerun_section()
 
 
+@section_fragment
 def certifications_form():
     st.subheader("Certifications")
-    current_certs = "\n".join(st.session_state.resume_data['certifications']) if st.session_state.resume_data['certifications'] else ""
-    updated_certs = st.text_area(
-        "List your certifications (one per line)", 
-        value=current_certs,
-        height=60,
-        key="certs_input",
-        help="Include certification name, issuing organization, and year if applicable"
-    )
-    
-    if st.button("Save Certifications", key="save_certs"):
-        st.session_state.resume_data['certifications'] = [c.strip() for c in updated_certs.split('\n') if c.strip()]
-        st.rerun()
+    with st.form("certifications_form", border=False):
+        current_certs = "\n".join(st.session_state.resume_data['certifications']) if st.session_state.resume_data['certifications'] else ""
+        updated_certs = st.text_area(
+            "List your certifications (one per line)", 
+            value=current_certs,
+            height=60,
+            key="certs_input",
+            help="Include certification name, issuing organization, and year if applicable"
+        )
+
+        if st.form_submit_button("Save Certifications"):
+            st.session_state.resume_data['certifications'] = _split_lines(updated_certs)
+            rerun_section()
+
+COMPARISON_SECTIONS = [
+    ('professional_summary', 'Professional Summary'),
+    ('work_experience', 'Work Experience'),
+    ('education', 'Education'),
+    ('skills', 'Skills'),
+    ('projects', 'Projects'),
+    ('certifications', 'Certifications')
+]
+
+def _collect_skills(skills):
+    collected = set()
+    if isinstance(skills, dict):
+        for cat in skills:
+            collected.update(skills[cat])
+    else:
+        collected.update(skills)
+    return collected
+
+def build_comparison_data(original, optimized):
+    """Compute the validation findings and side-by-side rows shown in the comparison tab"""
+    data = {
+        'added_sections': sorted(set(optimized.keys()) - set(original.keys())),
+        'added_skills': None,
+        'added_certifications': None,
+        'added_projects': None,
+        'sections': []
+    }
+
+    if 'skills' in original and 'skills' in optimized:
+        data['added_skills'] = sorted(_collect_skills(optimized['skills']) - _collect_skills(original['skills']))
+
+    if 'certifications' in original and 'certifications' in optimized:
+        data['added_certifications'] = sorted(set(optimized['certifications']) - set(original['certifications']))
+
+    if 'projects' in original and 'projects' in optimized:
+        original_projects = {p['name'].lower() for p in original['projects'] if 'name' in p}
+        optimized_projects = {p['name'].lower() for p in optimized['projects'] if 'name' in p}
+        data['added_projects'] = sorted(optimized_projects - original_projects)
+
+    for section_key, section_name in COMPARISON_SECTIONS:
+        if section_key in original or section_key in optimized:
+            if section_key in ('work_experience', 'education', 'projects'):
+                original_items = original.get(section_key, [])
+                optimized_items = optimized.get(section_key, [])
+                rows = [
+                    (original_items[i] if i < len(original_items) else None,
+                     optimized_items[i] if i < len(optimized_items) else None)
+                    for i in range(max(len(original_items), len(optimized_items)))
+                ]
+            else:
+                rows = [(original.get(section_key), optimized.get(section_key))]
+            data['sections'].append((section_key, section_name, rows))
+
+    return data
+
+def _render_comparison_item(section_key, item):
+    if section_key == 'professional_summary':
+        st.write(item if item is not None else "N/A")
+    elif item is None:
+        st.write("N/A")
+    elif section_key == 'work_experience':
+        st.write(f"**{item.get('job_title', '')}**")
+        st.write(f"{item.get('company', '')} | {item.get('dates', '')}")
+        for ach in item.get('achievements', []):
+            st.write(f"- {ach}")
+    elif section_key == 'education':
+        st.write(f"**{item.get('degree', '')}**")
+        st.write(f"{item.get('institution', '')} | {item.get('year', '')}")
+        if item.get('honors'):
+            st.write(f"Honors: {item.get('honors')}")
+    elif section_key == 'projects':
+        st.write(f"**{item.get('name', '')}**")
+        st.write(item.get('description', ''))
+        if item.get('technologies'):
+            st.write(f"Technologies: {', '.join(item['technologies'])}")
+    elif not item:
+        st.write("N/A")
+    elif isinstance(item, dict):
+        for cat, skills in item.items():
+            st.write(f"**{cat}**: {', '.join(skills)}")
+    else:
+        st.write(", ".join(item) if isinstance(item, list) else item)
 
 def create_comparison_view(original, optimized):
-    sections = [
-        ('professional_summary', 'Professional Summary'),
-        ('work_experience', 'Work Experience'),
-        ('education', 'Education'),
-        ('skills', 'Skills'),
-        ('projects', 'Projects'),
-        ('certifications', 'Certifications')
-    ]
-    
+    data = build_comparison_data(original, optimized)
+
     st.subheader("Content Validation")
-    original_sections = set(original.keys())
-    optimized_sections = set(optimized.keys())
-    added_sections = optimized_sections - original_sections
-    
-    if added_sections:
-        st.warning(f"⚠️ The optimized resume added these sections that weren't in the original: {', '.join(added_sections)}")
+    if data['added_sections']:
+        st.warning(f"⚠️ The optimized resume added these sections that weren't in the original: {', '.join(data['added_sections'])}")
     else:
         st.success("✅ No new sections were added to the optimized resume")
-    
-    if 'skills' in original and 'skills' in optimized:
-        original_skills = set()
-        optimized_skills = set()
-        
-        if isinstance(original['skills'], dict):
-            for cat in original['skills']:
-                original_skills.update(original['skills'][cat])
-        else:
-            original_skills.update(original['skills'])
-        
-        if isinstance(optimized['skills'], dict):
-            for cat in optimized['skills']:
-                optimized_skills.update(optimized['skills'][cat])
-        else:
-            optimized_skills.update(optimized['skills'])
-        
-        added_skills = optimized_skills - original_skills
-        if added_skills:
-            st.warning(f"⚠️ The optimized resume added these skills that weren't in the original: {', '.join(added_skills)}")
+
+    if data['added_skills'] is not None:
+        if data['added_skills']:
+            st.warning(f"⚠️ The optimized resume added these skills that weren't in the original: {', '.join(data['added_skills'])}")
         else:
             st.success("✅ No new skills were added to the optimized resume")
-    
-    if 'certifications' in original and 'certifications' in optimized:
-        original_certs = set(original['certifications'])
-        optimized_certs = set(optimized['certifications'])
-        added_certs = optimized_certs - original_certs
-        
-        if added_certs:
-            st.warning(f"⚠️The optimized resume added these certifications that weren't in the original: {', '.join(added_certs)}")
+
+    if data['added_certifications'] is not None:
+        if data['added_certifications']:
+            st.warning(f"⚠️The optimized resume added these certifications that weren't in the original: {', '.join(data['added_certifications'])}")
         else:
             st.success("✅ No new certifications were added to the optimized resume")
-    
-    if 'projects' in original and 'projects' in optimized:
-        original_projects = {p['name'].lower() for p in original['projects'] if 'name' in p}
-        optimized_projects = {p['name'].lower() for p in optimized['projects'] if 'name' in p}
-        added_projects = optimized_projects - original_projects
-        
-        if added_projects:
-            st.warning(f"⚠️ The optimized resume added these projects that weren't in the original: {', '.join(added_projects)}")
+
+    if data['added_projects'] is not None:
+        if data['added_projects']:
+            st.warning(f"⚠️ The optimized resume added these projects that weren't in the original: {', '.join(data['added_projects'])}")
         else:
             st.success("✅ No new projects were added to the optimized resume")
-    
+
     st.markdown("---")
-    
-    for section_key, section_name in sections:
-        if section_key in original or section_key in optimized:
-            st.subheader(section_name)
-            
-            if section_key == 'professional_summary':
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown("**Original**")
-                    st.write(original.get(section_key, "N/A"))
-                with col2:
-                    st.markdown("**Optimized**")
-                    st.write(optimized.get(section_key, "N/A"))
-            
-            elif section_key in ['work_experience', 'education']:
-                max_len = max(len(original.get(section_key, [])), 
-                             len(optimized.get(section_key, [])))
-                
-                for i in range(max_len):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.markdown("**Original**")
-                        if i < len(original.get(section_key, [])):
-                            item = original[section_key][i]
-                            if section_key == 'work_experience':
-                                st.write(f"**{item.get('job_title', '')}**")
-                                st.write(f"{item.get('company', '')} | {item.get('dates', '')}")
-                                for ach in item.get('achievements', []):
-                                    st.write(f"- {ach}")
-                            else: 
-                                st.write(f"**{item.get('degree', '')}**")
-                                st.write(f"{item.get('institution', '')} | {item.get('year', '')}")
-                                if item.get('honors'):
-                                    st.write(f"Honors: {item.get('honors')}")
-                        else:
-                            st.write("N/A")
-                    
-                    with col2:
-                        st.markdown("**Optimized**")
-                        if i < len(optimized.get(section_key, [])):
-                            item = optimized[section_key][i]
-                            if section_key == 'work_experience':
-                                st.write(f"**{item.get('job_title', '')}**")
-                                st.write(f"{item.get('company', '')} | {item.get('dates', '')}")
-                                for ach in item.get('achievements', []):
-                                    st.write(f"- {ach}")
-                            else: 
-                                st.write(f"**{item.get('degree', '')}**")
-                                st.write(f"{item.get('institution', '')} | {item.get('year', '')}")
-                                if item.get('honors'):
-                                    st.write(f"Honors: {item.get('honors')}")
-                        else:
-                            st.write("N/A")
-            
-            elif section_key in ['skills', 'certifications']:
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown("**Original**")
-                    if original.get(section_key):
-                        if isinstance(original[section_key], dict):
-                            for cat, skills in original[section_key].items():
-                                st.write(f"**{cat}**: {', '.join(skills)}")
-                        else:
-                            st.write(", ".join(original[section_key]) if isinstance(original[section_key], list) 
-                                    else original[section_key])
-                    else:
-                        st.write("N/A")
-                with col2:
-                    st.markdown("**Optimized**")
-                    if optimized.get(section_key):
-                        if isinstance(optimized[section_key], dict):
-                            for cat, skills in optimized[section_key].items():
-                                st.write(f"**{cat}**: {', '.join(skills)}")
-                        else:
-                            st.write(", ".join(optimized[section_key]) if isinstance(optimized[section_key], list) 
-                                    else optimized[section_key])
-                    else:
-                        st.write("N/A")
-            
-            elif section_key == 'projects':
-                max_len = max(len(original.get(section_key, [])), 
-                             len(optimized.get(section_key, [])))
-                
-                for i in range(max_len):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.markdown("**Original**")
-                        if i < len(original.get(section_key, [])):
-                            proj = original[section_key][i]
-                            st.write(f"**{proj.get('name', '')}**")
-                            st.write(proj.get('description', ''))
-                            if proj.get('technologies'):
-                                st.write(f"Technologies: {', '.join(proj['technologies'])}")
-                        else:
-                            st.write("N/A")
-                    
-                    with col2:
-                        st.markdown("**Optimized**")
-                        if i < len(optimized.get(section_key, [])):
-                            proj = optimized[section_key][i]
-                            st.write(f"**{proj.get('name', '')}**")
-                            st.write(proj.get('description', ''))
-                            if proj.get('technologies'):
-                                st.write(f"Technologies: {', '.join(proj['technologies'])}")
-                        else:
-                            st.write("N/A")
-            
-            st.markdown("---")
+
+    for section_key, section_name, rows in data['sections']:
+        st.subheader(section_name)
+        for original_item, optimized_item in rows:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**Original**")
+                _render_comparison_item(section_key, original_item)
+            with col2:
+                st.markdown("**Optimized**")
+                _render_comparison_item(section_key, optimized_item)
+        st.markdown("---")
 
 def main():
+    started = time.perf_counter()
+    try:
+        render_app()
+    finally:
+        record_run_time('full', time.perf_counter() - started)
+
+def render_app():
     st.set_page_config(
         page_title="𓂃🪶GenAI Resume Crafter",
         layout="wide",
@@ -1531,6 +5225,22 @@ def main():
             if not st.session_state.company_name:
                 st.session_state.company_name = "Innovative Tech Solutions"
 
+        st.selectbox(
+            "Pipeline Mode",
+            options=list(PIPELINE_MODES),
+            format_func=PIPELINE_MODES.get,
+            key="pipeline_mode",
+            help="One-shot mode asks for every artifact in a single call, which saves requests on tight quotas"
+        )
+        st.selectbox(
+            "Rewrite Mode",
+            options=list(REWRITE_MODES),
+            format_func=REWRITE_MODES.get,
+            key="rewrite_mode",
+            help="Weak-bullets mode keeps strong, quantified achievements as written and only sends the weak ones to the AI; "
+                 "it always runs the fan-out pipeline"
+        )
+
         cols = st.columns(2)
         with cols[0]:
             if st.button("Optimize Resume", use_container_width=True, type="primary"):
@@ -1557,83 +5267,33 @@ def main():
                         st.rerun()
                         return
                 else:
-                    filtered_resume = {
-                        'contact_info': st.session_state.resume_data['contact_info'],
-                        'target_role': st.session_state.resume_data['target_role']
-                    }
-                    
-                    if "Professional Summary" in st.session_state.selected_sections:
-                        filtered_resume['professional_summary'] = st.session_state.resume_data.get('professional_summary', '')
-                    
-                    if "Work Experience" in st.session_state.selected_sections:
-                        filtered_resume['work_experience'] = st.session_state.resume_data.get('work_experience', [])
-                    
-                    if "Education" in st.session_state.selected_sections:
-                        filtered_resume['education'] = st.session_state.resume_data.get('education', [])
-                    
-                    if "Skills" in st.session_state.selected_sections:
-                        filtered_resume['skills'] = st.session_state.resume_data.get('skills', {})
-                    
-                    if "Projects" in st.session_state.selected_sections:
-                        filtered_resume['projects'] = st.session_state.resume_data.get('projects', [])
-                    
-                    if "Certifications" in st.session_state.selected_sections:
-                        filtered_resume['certifications'] = st.session_state.resume_data.get('certifications', [])
-                    
-                    optimized_resume, error = optimize_resume_with_ai(
-                        filtered_resume,
-                        st.session_state.job_description,
-                        st.session_state.resume_data['target_role']
-                    )
-
-                    if optimized_resume is None:
-                        if "API key" in error or "model not initialized" in error or "400" in error or "API_KEY" in error:
-                            st.session_state.api_key_valid = False
-                            st.session_state.show_api_instructions = True
-                            st.rerun()
-                        else:
-                            st.error(f"Error optimizing resume: {error}")
-                    else:
-                        st.session_state.optimized_resume = optimized_resume
-                        st.session_state.cover_letter = generate_cover_letter_with_ai(
-                            st.session_state.optimized_resume,
-                            st.session_state.job_description,
-                            st.session_state.company_name
-                        )
-                        st.session_state.cover_letter_ats = analyze_cover_letter_ats(
-                            st.session_state.cover_letter,
-                            st.session_state.job_description
-                        )
-                        st.session_state.ats_report = analyze_ats_compliance(
-                            st.session_state.optimized_resume,
-                            st.session_state.job_description
-                        )
-                        st.session_state.interview_prep = generate_interview_prep(
-                            st.session_state.optimized_resume,
-                            st.session_state.job_description
-                        )
-                        st.session_state.show_comparison = True
-                        st.success("✅ Resume optimization completed!")
-                        st.rerun()
+                    optimize_and_store()
 
         with cols[1]:
             if st.button("Reset Form", use_container_width=True):
+                cancel_session_calls()
+                release_session_artifacts()
                 for key in list(st.session_state.keys()):
                     del st.session_state[key]
                 init_session_state()
                 st.rerun()
 
-        if st.session_state.optimized_resume:
+        optimized_resume = session_artifact('optimized_resume')
+        if optimized_resume:
             st.markdown("---")
             st.subheader("Download")
-            pdf_buffer = create_pdf_document(st.session_state.optimized_resume, is_resume=True)
-            st.download_button(
-                label="📥 Download Resume (PDF)",
-                data=pdf_buffer,
-                file_name=f"optimized_resume_{st.session_state.optimized_resume['contact_info']['name'].replace(' ', '_')}.pdf",
-                mime="application/pdf",
-                use_container_width=True
-            )
+            resume_layout_controls()
+            optimized_resume_download(optimized_resume, "📥 Download Resume (PDF)")
+            if st.session_state.pop('incomplete_results', False):
+                st.warning("Some results could not be generated, so they were not saved for reuse. Regenerate to try again.")
+            if st.button("🔄 Regenerate", use_container_width=True,
+                         help="Run the AI again instead of reusing results for the same or a similar job description"):
+                optimize_and_store(reuse=False)
+
+        show_profiles()
+        show_model_usage()
+        show_session_memory()
+        show_run_profile()
 
     if st.session_state.auto_optimize and st.session_state.api_key_valid:
         st.session_state.auto_optimize = False
@@ -1642,66 +5302,10 @@ def main():
             st.session_state.resume_data['target_role'] and 
             st.session_state.job_description):
             
-            filtered_resume = {
-                'contact_info': st.session_state.resume_data['contact_info'],
-                'target_role': st.session_state.resume_data['target_role']
-            }
-            
-            if "Professional Summary" in st.session_state.selected_sections:
-                filtered_resume['professional_summary'] = st.session_state.resume_data.get('professional_summary', '')
-            
-            if "Work Experience" in st.session_state.selected_sections:
-                filtered_resume['work_experience'] = st.session_state.resume_data.get('work_experience', [])
-            
-            if "Education" in st.session_state.selected_sections:
-                filtered_resume['education'] = st.session_state.resume_data.get('education', [])
-            
-            if "Skills" in st.session_state.selected_sections:
-                filtered_resume['skills'] = st.session_state.resume_data.get('skills', {})
-            
-            if "Projects" in st.session_state.selected_sections:
-                filtered_resume['projects'] = st.session_state.resume_data.get('projects', [])
-            
-            if "Certifications" in st.session_state.selected_sections:
-                filtered_resume['certifications'] = st.session_state.resume_data.get('certifications', [])
-            
-            optimized_resume, error = optimize_resume_with_ai(
-                filtered_resume,
-                st.session_state.job_description,
-                st.session_state.resume_data['target_role']
-            )
-
-            if optimized_resume is None:
-                if "API key" in error or "model not initialized" in error or "400" in error or "API_KEY" in error:
-                    st.session_state.api_key_valid = False
-                    st.session_state.show_api_instructions = True
-                    st.rerun()
-                else:
-                    st.error(f"Error optimizing resume: {error}")
-            else:
-                st.session_state.optimized_resume = optimized_resume
-                st.session_state.cover_letter = generate_cover_letter_with_ai(
-                    st.session_state.optimized_resume,
-                    st.session_state.job_description,
-                    st.session_state.company_name
-                )
-                st.session_state.cover_letter_ats = analyze_cover_letter_ats(
-                    st.session_state.cover_letter,
-                    st.session_state.job_description
-                )
-                st.session_state.ats_report = analyze_ats_compliance(
-                    st.session_state.optimized_resume,
-                    st.session_state.job_description
-                )
-                st.session_state.interview_prep = generate_interview_prep(
-                    st.session_state.optimized_resume,
-                    st.session_state.job_description
-                )
-                st.session_state.show_comparison = True
-                st.success("✅ Resume optimization completed!")
-                st.rerun()
+            optimize_and_store()
         else:
             st.warning("Please fill in your name, target role, and job description")
+    optimized_resume = session_artifact('optimized_resume')
     tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "Resume Builder", 
         "Optimized Resume", 
@@ -1714,6 +5318,8 @@ def main():
     with tab1:
         contact_info_form()
         job_info_form()
+        # Filled after the section forms so the meter reflects edits made in this run
+        coverage_meter = st.container()
         
         if "Professional Summary" in st.session_state.selected_sections:
             professional_summary_form()
@@ -1727,28 +5333,27 @@ def main():
             projects_form()
         if "Certifications" in st.session_state.selected_sections:
             certifications_form()
+        with coverage_meter:
+            st.session_state.live_panels_key = live_panels_key()
+            keyword_coverage_meter()
+            resume_lint_panel()
+            page_fit_indicator()
     
     with tab2:
-        if st.session_state.optimized_resume is None:
+        if optimized_resume is None:
             st.info("Optimize the resume to see tailored results here")
-        elif st.session_state.optimized_resume:
+        elif optimized_resume:
             st.subheader("Optimized Resume")
             with st.expander("View Optimized Resume Data", expanded=True):
-                st.json(st.session_state.optimized_resume)
+                st.json(optimized_resume)
 
-                pdf_buffer = create_pdf_document(st.session_state.optimized_resume, is_resume=True)
-                st.download_button(
-                    label="Download Optimized Resume (PDF)",
-                    data=pdf_buffer,
-                    file_name=f"optimized_resume_{st.session_state.optimized_resume['contact_info']['name'].replace(' ', '_')}.pdf",
-                    mime="application/pdf",
-                    use_container_width=True
-                )
+                optimized_resume_download(optimized_resume, "Download Optimized Resume (PDF)", key="tab_resume_pdf")
         else:
             st.info("Optimize your resume to see tailored results here")
 
     with tab3:
-        if st.session_state.cover_letter:
+        cover_letter = session_artifact('cover_letter')
+        if cover_letter:
             st.subheader("Generated Cover Letter")
             col1, col2 = st.columns(2)
         
@@ -1777,10 +5382,10 @@ def main():
             <div class="section-title">Cover Letter Preview</div>
             """, unsafe_allow_html=True)
             
-                st.markdown(f'<div class="scroll-container">{st.session_state.cover_letter}</div>', 
+                st.markdown(f'<div class="scroll-container">{cover_letter}</div>', 
                       unsafe_allow_html=True)
             
-                cover_docx_buffer = create_docx_cover_letter(st.session_state.cover_letter)
+                cover_docx_buffer = export_cover_letter_docx(cover_letter, st.session_state.resume_data['contact_info'])
                 st.download_button(
                 label="📄 Download Cover Letter",
                 data=cover_docx_buffer,
@@ -1815,7 +5420,7 @@ def main():
     """, unsafe_allow_html=True)
 
                   st.markdown(
-        f'<div class="scroll-container-ats">{st.session_state.cover_letter_ats}</div>',
+        f'<div class="scroll-container-ats">{session_artifact("cover_letter_ats")}</div>',
         unsafe_allow_html=True
     )
             
@@ -1823,60 +5428,82 @@ def main():
             st.info("Optimize your resume to generate a cover letter")
 
     with tab4:
-        if st.session_state.show_comparison and st.session_state.optimized_resume:
+        if st.session_state.show_comparison and optimized_resume:
             st.header("Resume Comparison")
             st.markdown("Compare your original resume with the AI-optimized version")
             
-            filtered_original = {
-                'contact_info': st.session_state.resume_data['contact_info'],
-                'target_role': st.session_state.resume_data['target_role']
-            }
-            
-            if "Professional Summary" in st.session_state.selected_sections:
-                filtered_original['professional_summary'] = st.session_state.resume_data.get('professional_summary', '')
-            
-            if "Work Experience" in st.session_state.selected_sections:
-                filtered_original['work_experience'] = st.session_state.resume_data.get('work_experience', [])
-            
-            if "Education" in st.session_state.selected_sections:
-                filtered_original['education'] = st.session_state.resume_data.get('education', [])
-            
-            if "Skills" in st.session_state.selected_sections:
-                filtered_original['skills'] = st.session_state.resume_data.get('skills', {})
-            
-            if "Projects" in st.session_state.selected_sections:
-                filtered_original['projects'] = st.session_state.resume_data.get('projects', [])
-            if "Certifications" in st.session_state.selected_sections:
-                filtered_original['certifications'] = st.session_state.resume_data.get('certifications', [])
-            create_comparison_view(filtered_original, st.session_state.optimized_resume)
+            filtered_original = filter_resume_sections(st.session_state.resume_data, st.session_state.selected_sections)
+            create_comparison_view(filtered_original, optimized_resume)
         else:
             st.info("Optimize your resume first to see the comparison")
     with tab5:
-        if st.session_state.optimized_resume and st.session_state.ats_report:
+        ats_report = session_artifact('ats_report')
+        if optimized_resume and ats_report:
             st.subheader("ATS Compliance Report")
-            st.markdown(st.session_state.ats_report)
-        elif st.session_state.optimized_resume:
+            st.markdown(ats_report)
+            show_report_downloads(ats_report, "ATS Compliance Report", "ats_report")
+        elif optimized_resume:
             st.subheader("ATS Compliance Report")
             with st.spinner("Generating ATS analysis..."):
-                st.session_state.ats_report = analyze_ats_compliance(
-                    st.session_state.optimized_resume,
+                ats_report = analyze_ats_compliance(
+                    optimized_resume,
                     st.session_state.job_description
                 )
-            st.markdown(st.session_state.ats_report)
+                set_session_artifact('ats_report', ats_report)
+            st.markdown(ats_report)
+            if ats_report:
+                show_report_downloads(ats_report, "ATS Compliance Report", "ats_report")
         else:
             st.info("Optimize your resume to view ATS analysis")
     with tab6:
-        if st.session_state.optimized_resume and st.session_state.interview_prep:
+        if optimized_resume:
             st.subheader("Interview Preparation Questions")
-            st.markdown(st.session_state.interview_prep)
-        elif st.session_state.optimized_resume:
-            st.subheader("Interview Preparation Questions")
-            with st.spinner("Generating interview questions..."):
-                st.session_state.interview_prep = generate_interview_prep(
-                    st.session_state.optimized_resume,
-                    st.session_state.job_description
+            interview_prep = session_artifact('interview_prep')
+            if interview_prep.startswith("Error generating"):
+                st.session_state.interview_prep_error = interview_prep
+                set_session_artifact('interview_prep', "")
+                interview_prep = ""
+            # A failure is remembered so it is shown with a retry button instead of regenerated on every rerun
+            if not interview_prep and 'interview_prep_error' not in st.session_state:
+                with st.spinner("Generating interview questions..."):
+                    generated = generate_interview_prep(
+                        optimized_resume,
+                        st.session_state.job_description
+                    )
+                if generated and not generated.startswith("Error generating"):
+                    set_session_artifact('interview_prep', generated)
+                    interview_prep = generated
+                else:
+                    st.session_state.interview_prep_error = generated or "Could not generate interview questions. Check your API key and try again."
+            if not interview_prep:
+                st.error(st.session_state.interview_prep_error)
+                if st.button("🔄 Retry", key="retry_interview_prep"):
+                    del st.session_state.interview_prep_error
+                    st.rerun()
+            else:
+                answers = show_interview_prep()
+
+                next_page = interview_prep_pages_loaded(interview_prep)
+                if 0 < next_page < len(INTERVIEW_PREP_PAGES):
+                    if st.button(f"Load more: {INTERVIEW_PREP_PAGES[next_page][0]}", key="load_more_interview_prep"):
+                        with st.spinner("Generating more interview questions..."):
+                            more = generate_interview_prep(
+                                optimized_resume,
+                                st.session_state.job_description,
+                                page=next_page,
+                                previous=interview_prep
+                            )
+                        if more.startswith("Error generating"):
+                            st.error(more)
+                        elif more:
+                            set_session_artifact('interview_prep', interview_prep + "\n\n" + more)
+                            st.rerun()
+
+                show_report_downloads(
+                    interview_prep_export_markdown(interview_prep, answers),
+                    "Interview Preparation",
+                    "interview_prep"
                 )
-            st.markdown(st.session_state.interview_prep)
         else:
             st.info("Optimize your resume to get interview preparation tips")
 if __name__ == "__main__":
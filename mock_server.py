@@ -0,0 +1,39 @@
+import argparse
+
+from main import MockGenerativeModel, create_mock_llm_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Gemini API used for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fixed latency per call in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency per call in seconds")
+    parser.add_argument("--input-latency", type=float, default=0.0,
+                        help="Prefill latency in seconds per 1k uncached prompt tokens")
+    parser.add_argument("--output-latency", type=float, default=0.0,
+                        help="Decode latency in seconds per 1k generated tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls that fail with a quota error")
+    parser.add_argument("--recordings", help="JSON file of recorded responses keyed by prompt hash")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    model = MockGenerativeModel(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        recordings=args.recordings,
+        seed=args.seed,
+        input_latency=args.input_latency,
+        output_latency=args.output_latency
+    )
+    server = create_mock_llm_server(args.host, args.port, model)
+    print(f"Mock LLM server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# main reads its configuration at import time; the tests never reach a real model
+os.environ["LLM_BACKEND"] = "mock"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def mock_model():
+    """A mock model serving generation calls made outside a Streamlit session"""
+    import main
+    model = main.MockGenerativeModel(latency=0.2, seed=1)
+    main.set_default_model(model)
+    yield model
+    main.set_default_model(None)
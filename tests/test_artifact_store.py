@@ -0,0 +1,104 @@
+import os
+import time
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'ARTIFACT_STORE_DIR', str(tmp_path / "artifacts"))
+    main._artifact_store.clear()
+    yield main._artifact_store()
+    main._artifact_store.clear()
+
+
+def test_identical_content_is_stored_once_until_every_owner_releases_it(store):
+    first = main.put_artifact(b"cover letter", 'session-a')
+    second = main.put_artifact(b"cover letter", 'session-b')
+    assert first.digest == second.digest
+    assert store['blobs'][first.digest]['owners'] == {'session-a', 'session-b'}
+    path = main.artifact_path(first.digest)
+
+    main.release_artifact(first.digest, 'session-a')
+    assert os.path.exists(path)
+    assert main.read_artifact(second) == b"cover letter"
+
+    main.release_artifact(first.digest, 'session-b')
+    assert not os.path.exists(path)
+    assert first.digest not in store['blobs']
+    with pytest.raises(FileNotFoundError):
+        main.read_artifact(first)
+
+
+def test_memory_spills_least_recently_used_blobs_to_disk(store, monkeypatch):
+    monkeypatch.setattr(main, 'ARTIFACT_MEMORY_MB', 1.5)
+    old = main.put_artifact(b"a" * 1024 * 1024, 'session-a')
+    new = main.put_artifact(b"b" * 1024 * 1024, 'session-a')
+    assert old.digest not in store['memory']
+    assert new.digest in store['memory']
+    assert main.read_artifact(old) == b"a" * 1024 * 1024
+    assert old.digest in store['memory'] and new.digest not in store['memory']
+
+
+def test_eviction_keeps_disconnected_sessions_and_releases_gone_ones(store):
+    handles = {session_id: main.put_artifact(session_id.encode(), session_id)
+               for session_id in ('active', 'disconnected', 'gone', 'expired')}
+    now = time.time()
+    store['sessions'].update({'active': now, 'disconnected': now, 'gone': now,
+                              'expired': now - main.ARTIFACT_IDLE_SECONDS - 1})
+
+    released, _ = main.evict_idle_artifacts(
+        store, lambda session_id: session_id == 'active', lambda session_id: session_id != 'gone'
+    )
+
+    assert released == 2
+    assert set(store['sessions']) == {'active', 'disconnected'}
+    assert handles['active'].digest in store['memory']
+    assert handles['disconnected'].digest not in store['memory']
+    assert main.read_artifact(handles['disconnected']) == b"disconnected"
+    for session_id in ('gone', 'expired'):
+        assert handles[session_id].digest not in store['blobs']
+        assert not os.path.exists(main.artifact_path(handles[session_id].digest))
+
+
+def test_shared_blobs_survive_one_owner_being_evicted(store):
+    handle = main.put_artifact(b"shared", 'gone')
+    main.put_artifact(b"shared", 'active')
+    store['sessions'].update({'gone': time.time(), 'active': time.time()})
+    main.evict_idle_artifacts(store, lambda session_id: session_id == 'active', lambda session_id: session_id == 'active')
+    assert store['blobs'][handle.digest]['owners'] == {'active'}
+    assert main.read_artifact(handle) == b"shared"
+
+
+def test_orphan_cleanup_only_deletes_blob_files_of_exited_processes(tmp_path, monkeypatch):
+    root = tmp_path / "artifacts"
+    monkeypatch.setattr(main, 'ARTIFACT_STORE_DIR', str(root))
+    monkeypatch.setattr(main, 'process_is_running', lambda pid: pid == 222)
+    digest = "ab" + "0" * 62
+    for process_dir in ("111-0000abcd", "222-0000abcd"):
+        (root / process_dir / "ab").mkdir(parents=True)
+        (root / process_dir / "ab" / digest).write_bytes(b"old")
+        (root / process_dir / "ab" / f"{digest}.tmp").write_bytes(b"partial")
+    (root / "111-0000abcd" / "ab" / "notes.txt").write_text("keep")
+    (root / "profiles").mkdir()
+    (root / "profiles" / digest).write_bytes(b"keep")
+
+    assert main.remove_orphan_artifacts() == 2
+    assert sorted(os.listdir(root / "111-0000abcd" / "ab")) == ["notes.txt"]
+    assert sorted(os.listdir(root / "222-0000abcd" / "ab")) == [digest, f"{digest}.tmp"]
+    assert (root / "profiles" / digest).exists()
+
+
+def test_a_second_process_keeps_the_first_ones_blobs(store, monkeypatch):
+    handle = main.put_artifact(b"live resume", 'session-a')
+    monkeypatch.setattr(main.os, 'getpid', lambda: 999999)
+    monkeypatch.setattr(main, 'process_is_running', lambda pid: True)
+    main._artifact_store.clear()
+    second = main._artifact_store()
+
+    assert main.remove_orphan_artifacts() == 0
+    assert second['dir'] != store['dir']
+    with open(os.path.join(store['dir'], handle.digest[:2], handle.digest), 'rb') as f:
+        assert f.read() == b"live resume"
@@ -0,0 +1,13 @@
+from streamlit.testing.v1 import AppTest
+
+import main
+
+
+def test_mock_backend_is_configured_once_per_session():
+    app = AppTest.from_file(main.__file__, default_timeout=60)
+    app.run()
+    model = app.session_state['model']
+    app.session_state['routed_models']['marker'] = model
+    app.run()
+    assert app.session_state['model'] is model
+    assert 'marker' in app.session_state['routed_models']
@@ -0,0 +1,31 @@
+from streamlit.testing.v1 import AppTest
+
+import main
+
+
+def optimized_app():
+    app = AppTest.from_file(main.__file__, default_timeout=60)
+    app.run()
+    app.text_input(key="name_input").set_value("Jordan Example")
+    app.text_input(key="job_title_input").set_value("Engineer")
+    app.text_area(key="job_desc_input").set_value("Requirements:\n- Python")
+    app.run()
+    next(button for button in app.button if button.label == "Optimize Resume").click()
+    app.run()
+    assert app.session_state['artifacts'].get('optimized_resume')
+    return app
+
+
+def test_failed_interview_prep_shows_an_error_with_retry_instead_of_regenerating():
+    app = optimized_app()
+    del app.session_state['artifacts']['interview_prep']
+    app.session_state['interview_prep_error'] = "Error generating interview prep: boom"
+    app.run()
+    assert "Error generating interview prep: boom" in [error.value for error in app.error]
+    assert 'interview_prep' not in app.session_state['artifacts']
+
+    next(button for button in app.button if button.label == "🔄 Retry").click()
+    app.run()
+    assert not app.error
+    assert 'interview_prep_error' not in app.session_state
+    assert app.session_state['artifacts'].get('interview_prep')
@@ -0,0 +1,93 @@
+import random
+import re
+
+import numpy as np
+import pytest
+
+import main
+
+WORDS = [f"term{i}" for i in range(2000)]
+
+
+def shingles(job_description):
+    """The word 3-gram shingles jd_minhash hashes, for computing the exact Jaccard similarity"""
+    words = re.findall(r"\w+", main.preprocess_job_description(job_description).text().lower())
+    return {" ".join(words[i:i + main.JD_SHINGLE_WORDS]) for i in range(max(1, len(words) - main.JD_SHINGLE_WORDS + 1))}
+
+
+def exact_jaccard(a, b):
+    a, b = shingles(a), shingles(b)
+    return len(a & b) / len(a | b)
+
+
+def estimated_jaccard(a, b):
+    return float(np.mean(main.jd_minhash(a) == main.jd_minhash(b)))
+
+
+def posting(words):
+    return "Requirements:\n" + "\n".join(" ".join(words[i:i + 10]) for i in range(0, len(words), 10))
+
+
+def edited(words, rng, share):
+    """words with share of them replaced by words outside the vocabulary of the original"""
+    words = list(words)
+    for i in rng.sample(range(len(words)), int(len(words) * share)):
+        words[i] = f"other{rng.randrange(10 ** 6)}"
+    return words
+
+
+@pytest.fixture
+def index():
+    main._jd_result_index.clear()
+    yield main._jd_result_index()
+    main._jd_result_index.clear()
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("share", [0.0, 0.02, 0.1, 0.3, 0.6])
+def test_minhash_estimates_exact_jaccard(seed, share):
+    rng = random.Random(seed)
+    words = rng.sample(WORDS, 300)
+    a, b = posting(words), posting(edited(words, rng, share))
+    # 128 permutations give a standard error of at most about 0.045
+    assert estimated_jaccard(a, b) == pytest.approx(exact_jaccard(a, b), abs=0.15)
+
+
+def test_unrelated_postings_estimate_near_zero():
+    rng = random.Random(7)
+    assert estimated_jaccard(posting(rng.sample(WORDS, 300)), posting(rng.sample(WORDS, 300))) < 0.05
+
+
+def test_boilerplate_does_not_count_towards_similarity():
+    words = random.Random(3).sample(WORDS, 300)
+    assert estimated_jaccard(posting(words), posting(words) + "\n\nWe are an equal opportunity employer.") == 1.0
+
+
+def test_lsh_lookup_agrees_with_exact_jaccard(index):
+    rng = random.Random(11)
+    words = rng.sample(WORDS, 300)
+    original = posting(words)
+    main.remember_results('ns', original, main.jd_minhash(original), {'cover_letter': "letter"})
+
+    assert main.find_similar_results('ns', original, main.jd_minhash(original)) == ({'cover_letter': "letter"}, 1.0)
+    near = posting(edited(words, rng, 0.01))
+    assert exact_jaccard(original, near) > main.JD_SIMILARITY_THRESHOLD + 0.05
+    results, similarity = main.find_similar_results('ns', near, main.jd_minhash(near))
+    assert results == {'cover_letter': "letter"} and similarity >= main.JD_SIMILARITY_THRESHOLD
+
+    far = posting(edited(words, rng, 0.3))
+    assert exact_jaccard(original, far) < main.JD_SIMILARITY_THRESHOLD - 0.2
+    assert main.find_similar_results('ns', far, main.jd_minhash(far))[0] is None
+    assert main.find_similar_results('other', near, main.jd_minhash(near))[0] is None
+    assert index['stats'] == {'lookups': 4, 'exact': 1, 'near': 1}
+
+
+def test_evicted_entries_leave_no_buckets(index, monkeypatch):
+    monkeypatch.setattr(main, 'JD_RESULT_CACHE_SIZE', 2)
+    rng = random.Random(5)
+    postings = [posting(rng.sample(WORDS, 100)) for _ in range(3)]
+    for job_description in postings:
+        main.remember_results('ns', job_description, main.jd_minhash(job_description), {})
+    assert len(index['entries']) == 2
+    assert all(key in index['entries'] for bucket in index['buckets'].values() for key in bucket)
+    assert main.find_similar_results('ns', postings[0], main.jd_minhash(postings[0]))[0] is None
@@ -0,0 +1,63 @@
+import pytest
+
+import main
+
+POSTING = """Senior Privacy Engineer
+We build privacy tooling used by millions of people.
+
+Responsibilities
+- Design data deletion pipelines
+- Review new features for privacy risk
+
+Requirements:
+- 5+ years of Python
+- Experience with AWS
+
+## Nice to have
+- Go
+
+**Benefits**
+- Health insurance and 401k
+
+We are an equal opportunity employer."""
+
+
+def segments(text):
+    posting = main.segment_job_description(text)
+    return {line: segment for segment, line in posting.lines}
+
+
+def test_segments_follow_headings():
+    found = segments(POSTING)
+    assert found["Senior Privacy Engineer"] == 'summary'
+    assert found["We build privacy tooling used by millions of people."] == 'summary'
+    assert found["- Design data deletion pipelines"] == 'responsibilities'
+    assert found["- 5+ years of Python"] == 'requirements'
+    assert found["- Go"] == 'nice_to_have'
+    assert found["- Health insurance and 401k"] == 'boilerplate'
+    assert found["We are an equal opportunity employer."] == 'boilerplate'
+
+
+@pytest.mark.parametrize("title", [
+    "Senior Privacy Engineer", "Benefits Analyst", "Compensation Manager", "Legal Counsel", "Diversity Recruiter"
+])
+def test_job_titles_are_not_headings(title):
+    found = segments(f"{title}\nYou will own payroll reporting.\n{title}s partner with finance.")
+    assert found[title] == 'summary'
+    assert found[f"{title}s partner with finance."] == 'summary'
+
+
+def test_first_line_is_never_boilerplate():
+    assert segments("Benefits:\nAdministers our health plans.")["Benefits:"] == 'summary'
+
+
+def test_repeated_lines_are_dropped():
+    posting = main.segment_job_description("Requirements:\n- Python\n- python\n-  Python ")
+    assert [line for _, line in posting.lines] == ["Requirements:", "- Python"]
+
+
+def test_role_text_leaves_out_boilerplate_and_company():
+    text = main.segment_job_description(POSTING + "\n\nAbout us:\nWe are a startup.").text(main.JD_ROLE_SEGMENTS)
+    assert "Senior Privacy Engineer" in text
+    assert "401k" not in text
+    assert "We are a startup." not in text
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+
+import main
+
+
+def test_acquire_picks_the_key_with_the_most_headroom():
+    pool = main.ApiKeyPool(["a", "b"], rpm_limit=10, tpm_limit=1000)
+    assert pool.acquire(100) == "a"
+    assert pool.acquire(100) == "b"
+    assert pool.acquire(500, exclude={"a"}) == "b"
+    assert pool.acquire(100) == "a"
+
+
+def test_acquire_respects_request_and_token_limits():
+    pool = main.ApiKeyPool(["a"], rpm_limit=2, tpm_limit=1000)
+    assert pool.acquire(1001) is None
+    assert pool.acquire(10) == "a"
+    assert pool.acquire(10) == "a"
+    assert pool.acquire(10) is None
+
+
+def test_window_frees_requests_and_retry_after_says_when():
+    pool = main.ApiKeyPool(["a"], rpm_limit=1, tpm_limit=1000, window=0.2)
+    assert pool.acquire(10) == "a"
+    assert pool.acquire(10) is None
+    assert 0 < pool.retry_after(10) <= 0.2
+    time.sleep(0.25)
+    assert pool.acquire(10) == "a"
+
+
+def test_retry_after_is_none_when_no_key_ever_has_room():
+    pool = main.ApiKeyPool(["a"], rpm_limit=5, tpm_limit=100)
+    assert pool.retry_after(101) is None
+    pool.disable("a")
+    assert pool.retry_after(10) is None
+
+
+def test_settle_corrects_the_token_estimate():
+    pool = main.ApiKeyPool(["a"], rpm_limit=10, tpm_limit=1000)
+    pool.acquire(100)
+    pool.settle("a", 100, 950)
+    assert pool.acquire(100) is None
+    assert pool.acquire(50) == "a"
+
+
+def test_exhausted_key_cools_down_and_disabled_key_stays_out():
+    pool = main.ApiKeyPool(["a", "b"], rpm_limit=10, tpm_limit=1000, window=0.2)
+    pool.acquire(10)
+    pool.mark_exhausted("a")
+    pool.disable("b")
+    assert pool.acquire(10) is None
+    assert [row['status'] for row in pool.usage()][1] == "disabled"
+    time.sleep(0.25)
+    assert pool.acquire(10) == "a"
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel on one key, failing with the queued errors first"""
+
+    def __init__(self, key, calls, errors):
+        self.key, self.calls, self.errors = key, calls, errors
+        self._async_client = object()
+
+    def generate_content(self, prompt, generation_config=None):
+        self.calls.append(self.key)
+        if self.errors.get(self.key):
+            raise Exception(self.errors[self.key].pop(0))
+        return main.MockResponse(f"answer from {self.key}", 10)
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        return self.generate_content(prompt, generation_config)
+
+
+class FakePooledModel(main.PooledGenerativeModel):
+    def __init__(self, pool, errors=None):
+        super().__init__(main.DEFAULT_MODEL_NAME, pool)
+        self.calls, self.errors = [], errors or {}
+
+    def _model(self, key):
+        return FakeModel(key, self.calls, self.errors)
+
+
+def test_quota_error_rotates_to_the_next_key():
+    pool = main.ApiKeyPool(["a", "b"], rpm_limit=10, tpm_limit=10000, window=60)
+    model = FakePooledModel(pool, {"a": ["429 Resource has been exhausted"]})
+    assert model.generate_content("hello").text == "answer from b"
+    assert model.calls == ["a", "b"]
+    assert pool.usage()[0]['status'].startswith("cooling down")
+
+
+def test_rejected_key_is_disabled_and_the_call_retried():
+    pool = main.ApiKeyPool(["a", "b"], rpm_limit=10, tpm_limit=10000)
+    model = FakePooledModel(pool, {"a": ["400 API key not valid. Please pass a valid API key."]})
+    assert asyncio.run(model.generate_content_async("hello")).text == "answer from b"
+    assert pool.usage()[0]['status'] == "disabled"
+
+
+def test_other_errors_are_raised_without_retrying():
+    pool = main.ApiKeyPool(["a", "b"], rpm_limit=10, tpm_limit=10000)
+    model = FakePooledModel(pool, {"a": ["500 Internal error"]})
+    with pytest.raises(Exception, match="500"):
+        model.generate_content("hello")
+    assert model.calls == ["a"]
+
+
+def test_calls_wait_for_room_instead_of_failing():
+    pool = main.ApiKeyPool(["a"], rpm_limit=2, tpm_limit=10000, window=0.3)
+    model = FakePooledModel(pool)
+    started = time.monotonic()
+    for _ in range(3):
+        model.generate_content("hello")
+    assert time.monotonic() - started >= 0.25
+    assert model.calls == ["a"] * 3
+
+
+def test_every_key_failing_raises_a_quota_error():
+    pool = main.ApiKeyPool(["a"], rpm_limit=10, tpm_limit=100)
+    with pytest.raises(Exception, match="429"):
+        FakePooledModel(pool).generate_content("x" * 1000)
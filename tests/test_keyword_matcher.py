@@ -0,0 +1,40 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def matcher():
+    return main.KeywordMatcher(["python", "c++", "node.js", "ci/cd", "machine learning", "go", "learning"])
+
+
+def found(matcher, text):
+    return {matcher.keywords[index] for index in matcher.scan(text)}
+
+
+def test_scan_matches_whole_words_case_insensitively(matcher):
+    assert found(matcher, "Built services in Python and Go") == {"python", "go"}
+    assert found(matcher, "Pythonic code, good habits, ago") == set()
+
+
+def test_scan_matches_symbols_and_phrases(matcher):
+    assert found(matcher, "C++ and Node.js with CI/CD") == {"c++", "node.js", "ci/cd"}
+    assert found(matcher, "Applied Machine Learning.") == {"machine learning", "learning"}
+
+
+def test_scan_finds_overlapping_keywords_through_failure_links():
+    matcher = main.KeywordMatcher(["data", "big data", "data pipeline"])
+    assert found(matcher, "big data pipeline") == {"data", "big data", "data pipeline"}
+
+
+def test_scan_of_empty_matcher_and_text():
+    assert main.KeywordMatcher([]).scan("anything") == set()
+    assert main.KeywordMatcher(["python"]).scan("") == set()
+
+
+def test_extract_jd_keywords_keeps_phrases_and_symbols():
+    keywords = main.extract_jd_keywords(
+        "Requirements:\n- 5+ years of Python and C++\n- Experience with AWS Lambda, Node.js and CI/CD"
+    )
+    assert {"aws lambda", "python", "c++", "node.js", "ci/cd"} <= set(keywords)
+    assert "aws" not in keywords and "years" not in keywords
@@ -0,0 +1,40 @@
+import pytest
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph
+
+import main
+
+
+def render(markup):
+    """Build a ReportLab paragraph, which raises on markup it cannot parse"""
+    return Paragraph(markup, getSampleStyleSheet()['Normal'])
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("plain text", "plain text"),
+    ("**bold** and *italic*", "<b>bold</b> and <i>italic</i>"),
+    ("__bold__ and _italic_", "<b>bold</b> and <i>italic</i>"),
+    ("***Very important***", "<b><i>Very important</i></b>"),
+    ("run `pip install` now", "run <font face='Courier'>pip install</font> now"),
+    ("a < b & c", "a &lt; b &amp; c"),
+    ("snake_case_name stays", "snake_case_name stays"),
+    ("2 * 3 * 4", "2 * 3 * 4"),
+])
+def test_markdown_inline(text, expected):
+    assert main.markdown_inline(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "**Bold *nested** end*",
+    "*a **b* c**",
+    "**unclosed bold",
+    "_a *b_ c*",
+    "***",
+    "**`code`** and *`more*`",
+])
+def test_markdown_inline_never_crosses_tags(text):
+    render(main.markdown_inline(text))
+
+
+def test_markdown_runs_keeps_unpaired_delimiters_literal():
+    assert "".join(piece for piece, _ in main.markdown_runs("**unclosed bold")) == "**unclosed bold"
@@ -0,0 +1,89 @@
+import json
+import uuid
+
+import pytest
+
+import main
+
+COMBINED = "OUTPUT ONLY THE JSON OBJECT WITH ALL FIVE FIELDS"
+
+
+class EditedCombinedModel(main.MockGenerativeModel):
+    """Mock model whose combined response is passed through edit(fields) before it is returned"""
+
+    def __init__(self, edit):
+        super().__init__(seed=1)
+        self.edit = edit
+        self.prompts = []
+
+    def _prepare(self, prompt, cached_prefix, generation_config=None):
+        delay, response = super()._prepare(prompt, cached_prefix, generation_config)
+        self.prompts.append(prompt)
+        if COMBINED in prompt:
+            fields = self.edit(json.loads(response.text))
+            response = main.MockResponse(json.dumps(fields) if isinstance(fields, dict) else fields)
+        return delay, response
+
+
+@pytest.fixture
+def use_model():
+    def use(edit):
+        model = EditedCombinedModel(edit)
+        main.set_default_model(model)
+        return model
+    yield use
+    main.set_default_model(None)
+
+
+def resume():
+    # A fresh name per test keeps calls from being coalesced with another test's
+    return {'contact_info': {'name': f"Jordan {uuid.uuid4().hex[:8]}"}, 'target_role': 'Engineer',
+            'professional_summary': 'Backend engineer.',
+            'work_experience': [{'job_title': 'Engineer', 'company': 'Acme', 'dates': '2020 - 2023',
+                                 'achievements': ['Built billing services in Python']}]}
+
+
+def run(data):
+    return main.run_optimization_pipeline(data, "Requirements:\n- Python", 'Engineer', 'Acme', mode='one_shot')
+
+
+def test_complete_combined_response_is_one_call(use_model):
+    model = use_model(lambda fields: fields)
+    results, error = run(resume())
+    assert error is None
+    assert model.calls == 1
+    assert results['cover_letter'] == main.MOCK_COVER_LETTER
+    assert results['cover_letter_ats'] == main.MOCK_ATS_REPORT
+
+
+def test_regenerated_cover_letter_gets_its_own_ats_report(use_model):
+    model = use_model(lambda fields: dict(fields, cover_letter="", cover_letter_ats_report="Report on a letter nobody saw"))
+    results, error = run(resume())
+    assert error is None
+    assert results['cover_letter'] == main.MOCK_COVER_LETTER
+    assert results['cover_letter_ats'] == main.MOCK_ATS_REPORT
+    assert any(main.MOCK_COVER_LETTER in prompt for prompt in model.prompts if COMBINED not in prompt)
+
+
+def test_missing_fields_are_generated_separately(use_model):
+    use_model(lambda fields: {'optimized_resume': fields['optimized_resume']})
+    results, error = run(resume())
+    assert error is None
+    assert main.results_complete(results)
+
+
+def test_unusable_combined_response_falls_back_to_fan_out(use_model):
+    model = use_model(lambda fields: "{not json")
+    results, error = run(resume())
+    assert error is None
+    assert main.results_complete(results)
+    assert model.calls > 1
+
+
+def test_resume_too_long_for_one_response_skips_the_combined_call(use_model):
+    model = use_model(lambda fields: fields)
+    data = resume()
+    data['work_experience'][0]['achievements'] = ["Built billing services in Python for many customers " * 4] * 110
+    results, error = run(data)
+    assert error is None
+    assert not any(COMBINED in prompt for prompt in model.prompts)
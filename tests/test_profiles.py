@@ -0,0 +1,105 @@
+import json
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import main
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    directory = str(tmp_path / "profiles")
+    monkeypatch.setattr(main, 'PROFILE_STORE_DIR', directory)
+    monkeypatch.setenv("PROFILE_STORE_DIR", directory)
+    return directory
+
+
+def resume(name="Jordan Example", **fields):
+    return {'contact_info': {'name': name, 'email': 'jordan@example.com'}, 'target_role': 'Engineer',
+            'professional_summary': 'Engineer.', 'work_experience': [], **fields}
+
+
+def payload(resume_data, job_description="Python role"):
+    return {'resume_data': resume_data, 'job_description': job_description, 'company_name': 'Acme',
+            'selected_sections': ["Professional Summary", "Work Experience"]}
+
+
+def latest(name):
+    return main.profile_payload(main.read_profile(name))
+
+
+def test_versions_rebuild_from_snapshots_and_deltas(profile_dir):
+    saved = [payload(resume(professional_summary=f"Summary {i}"), f"Job {i % 3}") for i in range(main.PROFILE_SNAPSHOT_EVERY + 3)]
+    for version in saved:
+        main.save_profile_version("Jordan", version)
+    profile = main.read_profile("Jordan")
+    assert len(profile['versions']) == len(saved)
+    assert sum('snapshot' in entry for entry in profile['versions']) == 2
+    for number, version in enumerate(saved, 1):
+        assert main.profile_payload(profile, number) == version
+
+
+def test_unchanged_payload_is_not_saved_again(profile_dir):
+    assert main.save_profile_version("Jordan", payload(resume())) == 1
+    assert main.save_profile_version("Jordan", payload(resume())) == 1
+
+
+def test_partial_resume_import_is_completed_with_defaults(profile_dir):
+    name, error = main.import_profile(json.dumps({"contact_info": {"name": "A"}}))
+    assert (name, error) == ("A", None)
+    resume_data = latest("A")['resume_data']
+    assert resume_data['contact_info']['email'] == ''
+    assert resume_data['professional_summary'] == '' and resume_data['target_role'] == ''
+    main.filter_resume_sections(resume_data, [label for label, _, _ in main.RESUME_SECTIONS])
+
+
+def test_partial_entries_get_every_field(profile_dir):
+    main.import_profile(json.dumps({"contact_info": {"name": "A"}, "work_experience": [{"company": "Acme"}],
+                                    "education": [{"degree": "BSc", "year": 2020}]}))
+    resume_data = latest("A")['resume_data']
+    assert resume_data['work_experience'] == [{'job_title': '', 'company': 'Acme', 'dates': '', 'location': '', 'achievements': []}]
+    assert resume_data['education'][0]['year'] == '2020'
+
+
+def test_exported_profile_imports_with_its_history(profile_dir):
+    main.save_profile_version("Jordan", payload(resume()))
+    main.save_profile_version("Jordan", payload(resume(professional_summary="Changed.")))
+    exported = main.profile_export_json("Jordan")
+    imported = json.loads(exported) | {'name': "Jordan copy"}
+    assert main.import_profile(json.dumps(imported)) == ("Jordan copy", None)
+    copy = main.read_profile("Jordan copy")
+    assert [entry['saved_at'] for entry in copy['versions']] == [entry['saved_at'] for entry in main.read_profile("Jordan")['versions']]
+    assert main.profile_payload(copy, 1)['resume_data']['professional_summary'] == "Engineer."
+    assert latest("Jordan copy")['resume_data']['professional_summary'] == "Changed."
+
+
+@pytest.mark.parametrize("profile, message", [
+    ({'name': "Bad", 'versions': []}, "no versions"),
+    ({'name': "Bad", 'versions': "v1"}, "no versions"),
+    ({'name': "Bad", 'versions': [{'delta': {'set': [], 'unset': []}}]}, "Version 1"),
+    ({'name': "Bad", 'versions': [{'snapshot': {'resume_data': {'contact_info': "A"}}}]}, "contact_info must be an object"),
+    ({'name': "Bad", 'versions': [{'snapshot': payload(resume())}, {'delta': "oops"}]}, "Version 2"),
+])
+def test_malformed_history_is_rejected(profile_dir, profile, message):
+    name, error = main.import_profile(json.dumps(profile))
+    assert name is None and message in error
+    assert main.list_profiles() == []
+
+
+def test_imported_history_without_timestamps_is_rebuilt(profile_dir):
+    name, error = main.import_profile(json.dumps({'name': "Bare", 'versions': [{'snapshot': {'resume_data': {'contact_info': {}}}}],
+                                                  'results': {'key': "not a result"}}))
+    assert error is None
+    profile = main.read_profile(name)
+    assert isinstance(profile['versions'][0]['saved_at'], str)
+    assert profile['results'] == {}
+
+
+def test_loading_an_imported_partial_resume_keeps_the_app_running(profile_dir):
+    main.import_profile(json.dumps({"contact_info": {"name": "A"}}))
+    app = AppTest.from_file(main.__file__, default_timeout=60)
+    app.run()
+    next(button for button in app.button if button.label == "Load Profile").click()
+    app.run()
+    assert not app.exception
+    assert app.text_input(key="name_input").value == "A"
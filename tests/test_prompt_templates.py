@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def reload_templates(monkeypatch):
+    def load(overrides):
+        monkeypatch.setenv("PROMPT_TEMPLATES", json.dumps(overrides))
+        main.load_prompt_templates()
+    yield load
+    monkeypatch.delenv("PROMPT_TEMPLATES", raising=False)
+    main.load_prompt_templates()
+
+
+def test_render_truncates_the_named_field_to_the_budget():
+    template = main.PromptTemplate('t', "Resume:\n{resume}\nJob:\n{job}", budget=50, truncate='job')
+    prompt = template.render(resume="short", job="x" * 1000)
+    assert main.estimate_tokens(prompt) <= 50
+    assert prompt.startswith("Resume:\nshort\nJob:\n") and prompt.endswith(main.TRUNCATION_MARKER)
+
+
+def test_render_within_budget_is_unchanged():
+    template = main.PromptTemplate('t', "Job: {job}", budget=50, truncate='job')
+    assert template.render(job="Python") == "Job: Python"
+
+
+@pytest.mark.parametrize("truncate", [None, 'missing'])
+def test_budget_without_a_truncatable_field_is_rejected(truncate):
+    with pytest.raises(ValueError, match="truncate must name one of its fields"):
+        main.PromptTemplate('t', "Job: {job}", budget=50, truncate=truncate)
+
+
+def test_variant_override_with_budget_and_no_truncate_fails_at_load(reload_templates):
+    with pytest.raises(ValueError, match="cover_letter.b"):
+        reload_templates({'cover_letter': {'variants': {'b': {'text': "Letter for {company}", 'budget': 100}}}})
+
+
+def test_variant_override_inherits_truncate(reload_templates):
+    reload_templates({'optimize': {'variants': {'b': {'text': "Optimize {resume_json} for {job_description}", 'budget': 100}}}})
+    assert main.PROMPT_TEMPLATES['optimize']['b'].truncate == 'job_description'
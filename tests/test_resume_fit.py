@@ -0,0 +1,89 @@
+import itertools
+import random
+
+import pytest
+
+import main
+
+
+def brute_force_cover(heights, costs, need):
+    """Cheapest cost of any subset covering need, or of every item when nothing does"""
+    need = min(need, sum(heights))
+    return min(sum(costs[i] for i in subset)
+               for size in range(len(heights) + 1) for subset in itertools.combinations(range(len(heights)), size)
+               if sum(heights[i] for i in subset) >= need)
+
+
+def test_cheapest_cover_picks_the_cheapest_covering_set():
+    assert main.cheapest_cover([10, 20, 30], [1.0, 1.5, 5.0], 25) == (2.5, (0, 1))
+    assert main.cheapest_cover([10, 20, 30], [1.0, 1.5, 5.0], 30) == (2.5, (0, 1))
+    assert main.cheapest_cover([10, 20, 30], [1.0, 1.5, 1.0], 30) == (1.0, (2,))
+
+
+def test_cheapest_cover_with_nothing_to_free():
+    assert main.cheapest_cover([10, 20], [1.0, 1.0], 0) == (0.0, ())
+    assert main.cheapest_cover([], [], 5) == (0.0, ())
+
+
+def test_cheapest_cover_takes_everything_when_items_fall_short():
+    assert main.cheapest_cover([3, 4], [1.0, 2.0], 100) == (3.0, (0, 1))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_cheapest_cover_matches_brute_force(seed):
+    rng = random.Random(seed)
+    heights = [rng.randint(0, 40) for _ in range(rng.randint(1, 8))]
+    costs = [round(rng.uniform(0.1, 5.0), 2) for _ in heights]
+    need = rng.randint(0, sum(heights) + 10)
+    cost, chosen = main.cheapest_cover(heights, costs, need)
+    assert cost == pytest.approx(brute_force_cover(heights, costs, need))
+    assert cost == pytest.approx(sum(costs[i] for i in chosen))
+    assert sum(heights[i] for i in chosen) >= min(need, sum(heights))
+
+
+def make_resume(positions, bullets):
+    return {
+        'contact_info': {'name': 'Jordan Example', 'email': 'jordan@example.com', 'location': 'Austin, TX'},
+        'target_role': 'Software Engineer',
+        'professional_summary': 'Backend engineer building Python services on AWS.',
+        'work_experience': [
+            {'job_title': f'Engineer {i + 1}', 'company': f'Company {i + 1}', 'dates': f'{2010 + i} - {2011 + i}',
+             'location': 'Remote',
+             'achievements': [f'Built service {j + 1} in Python handling {j + 2}k requests per second on AWS'
+                              for j in range(bullets)]}
+            for i in range(positions)
+        ],
+        'projects': [{'name': 'Deploy Tool', 'description': 'A CLI for blue-green deployments', 'technologies': ['Python']}],
+        'certifications': ['AWS Certified Developer']
+    }
+
+
+def test_short_resume_fits_unchanged():
+    resume = make_resume(1, 3)
+    plan = main.plan_resume_fit(resume, 'classic')
+    assert plan.fits
+    assert plan.dropped == ()
+    assert plan.resume_data is resume
+    assert (plan.layout.scale, plan.layout.spacing) == main.RESUME_FIT_STEPS[0][:2]
+
+
+@pytest.mark.parametrize("template", sorted(main.RESUME_TEMPLATES))
+def test_long_resume_is_fit_onto_one_page(template):
+    resume = make_resume(6, 8)
+    plan = main.plan_resume_fit(resume, template, job_description="Python AWS")
+    assert plan.fits
+    assert plan.dropped
+    assert all(item.section in ('work_experience', 'projects', 'certifications') for item in plan.dropped)
+    # Every position keeps its best bullets
+    kept = [len(position['achievements']) for position in plan.resume_data['work_experience']]
+    assert min(kept) >= min(main.RESUME_FIT_KEEP_BULLETS, 8)
+    assert main.render_resume_pdf(resume, template, fit=True, job_description="Python AWS").pages == 1
+
+
+@pytest.mark.parametrize("changes, summary", [
+    ("tighter spacing", "⚠️ 2 pages: too long for one page even with tighter spacing"),
+    ("", "⚠️ 2 pages: too long for one page, and fit-to-page found nothing to tighten or drop"),
+])
+def test_caption_for_a_resume_that_does_not_fit(changes, summary):
+    info = {'pages': 2, 'fit': True, 'changes': changes, 'measure_ms': 3, 'search_ms': 1, 'passes': 0, 'build_ms': 20}
+    assert main.resume_pdf_caption(info) == f"{summary} · measured in 4 ms, built in 20 ms"
@@ -0,0 +1,32 @@
+import pytest
+
+import main
+
+
+def tense_findings(dates):
+    resume = {'contact_info': {'name': "Jordan"}, 'work_experience': [{
+        'job_title': "Engineer", 'company': "Acme", 'dates': dates,
+        'achievements': ["Build billing services in Python for 40 customers", "Lead a team of five engineers on payments"]
+    }]}
+    return [finding for finding in main.lint_resume(resume) if finding.rule == 'tense']
+
+
+@pytest.mark.parametrize("dates", ["Jan 2020 - Present", "2021 - current", "2022 - Now", "2019 – present"])
+def test_current_position_may_use_present_tense(dates):
+    assert tense_findings(dates) == []
+
+
+@pytest.mark.parametrize("dates", ["2018 - 2019", "2018 - 2019 (snow season)", "Known client, 2018 - 2019",
+                                   "2018 - 2019, concurrent roles", "Nowhere Inc 2017"])
+def test_past_position_needs_past_tense(dates):
+    assert len(tense_findings(dates)) == 2
+
+
+def test_mixed_tenses_in_a_current_position_follow_the_majority():
+    resume = {'contact_info': {'name': "Jordan"}, 'work_experience': [{
+        'job_title': "Engineer", 'company': "Acme", 'dates': "2020 - Present",
+        'achievements': ["Build billing services in Python for 40 customers", "Lead a team of five engineers on payments",
+                         "Migrated the ledger to Postgres with zero downtime"]
+    }]}
+    findings = [finding for finding in main.lint_resume(resume) if finding.rule == 'tense']
+    assert [finding.bullet for finding in findings] == [2]
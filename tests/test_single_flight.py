@@ -0,0 +1,42 @@
+import concurrent.futures
+import uuid
+
+import pytest
+
+import main
+
+
+def test_identical_tasks_share_one_call(mock_model):
+    prompt = f"Write a cover letter {uuid.uuid4()}"
+    futures = [main.start_task('cover_letter', prompt) for _ in range(8)]
+    results = [future.result(timeout=10) for future in futures]
+    assert mock_model.calls == 1
+    assert len(results) == 8 and len(set(results)) == 1
+
+
+def test_different_prompts_are_not_coalesced(mock_model):
+    futures = [main.start_task('cover_letter', f"Write a cover letter {uuid.uuid4()}") for _ in range(3)]
+    for future in futures:
+        future.result(timeout=10)
+    assert mock_model.calls == 3
+
+
+def test_cancelling_one_caller_leaves_the_shared_call_running(mock_model):
+    prompt = f"Write a cover letter {uuid.uuid4()}"
+    first, second = main.start_task('cover_letter', prompt), main.start_task('cover_letter', prompt)
+    first.cancel()
+    assert second.result(timeout=10)
+    assert mock_model.calls == 1
+
+
+def test_shared_call_is_cancelled_once_nobody_waits(mock_model):
+    prompt = f"Write a cover letter {uuid.uuid4()}"
+    futures = [main.start_task('cover_letter', prompt) for _ in range(3)]
+    for future in futures:
+        future.cancel()
+    for future in futures:
+        with pytest.raises(concurrent.futures.CancelledError):
+            future.result(timeout=10)
+    runtime = main._async_runtime()
+    concurrent.futures.wait([main.asyncio.run_coroutine_threadsafe(main.asyncio.sleep(0.05), runtime['loop'])])
+    assert not runtime['flights']